@@ -26,6 +26,27 @@ a = Analysis(
         'src.gui',
         'src.excel_processor',
         'src.output_generator',
+        'src.profiling',
+        'src.pricing',
+        'src.history',
+        'src.delta_report',
+        'src.normalization',
+        'src.formula_eval',
+        'src.column_detector',
+        'src.costing',
+        'src.scenarios',
+        'src.target_solver',
+        'src.parallel_collect',
+        'src.mapped_io',
+        'src.sheet_rows',
+        'src.preview',
+        'src.matching',
+        'src.city_lookup',
+        'src.diagnostics',
+        'src.conditions',
+        'src.delivery_modes',
+        'src.translit',
+        'src.alias_learning',
     ],
     hookspath=[],
     hooksconfig={},
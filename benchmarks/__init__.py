@@ -0,0 +1,8 @@
+"""
+Бенчмарки конвейера обработки.
+
+Генерирует синтетические прайс-листы конкурентов и конфигурации AppConfig,
+замеряет этапы process_all и сохраняет результаты для сравнения версий.
+
+Запуск: python -m benchmarks run --rows 5000 --cities 300 --competitors 4
+"""
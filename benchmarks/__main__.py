@@ -0,0 +1,119 @@
+"""
+Командная строка бенчмарков:
+    python -m benchmarks run [параметры нагрузки]
+    python -m benchmarks check [--baseline PATH] [--tolerance 0.25] [--update-baseline]
+
+Baseline зависит от машины и в репозитории не хранится: перед первой проверкой
+запишите его командой `python -m benchmarks check --update-baseline`.
+"""
+import argparse
+import sys
+
+from benchmarks.regression import (
+    SCENARIOS, DEFAULT_BASELINE, run_scenarios, load_baseline, save_baseline, compare, format_comparison
+)
+from benchmarks.runner import run_benchmark, save_result, format_result, RESULTS_DIR
+from benchmarks.workload import WorkloadSpec
+
+
+def _add_spec_arguments(parser: argparse.ArgumentParser):
+    defaults = WorkloadSpec()
+    parser.add_argument('--rows', type=int, default=defaults.rows, help="строк с городами в файле конкурента")
+    parser.add_argument('--cities', type=int, default=defaults.cities, help="городов в конфигурации")
+    parser.add_argument('--aliases', type=int, default=defaults.aliases, help="псевдонимов на город")
+    parser.add_argument('--alias-hit-ratio', type=float, default=defaults.alias_hit_ratio)
+    parser.add_argument('--competitors', type=int, default=defaults.competitors)
+    parser.add_argument('--markup-rows', type=int, default=defaults.markup_rows)
+    parser.add_argument('--layout', choices=['flat', 'stacked'], default=defaults.layout)
+    parser.add_argument('--header-rows', type=int, default=defaults.header_rows)
+    parser.add_argument('--text-ratio', type=float, default=defaults.text_ratio)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+
+
+def _spec_from_args(args) -> WorkloadSpec:
+    return WorkloadSpec(
+        rows=args.rows,
+        cities=args.cities,
+        aliases=args.aliases,
+        alias_hit_ratio=args.alias_hit_ratio,
+        competitors=args.competitors,
+        markup_rows=args.markup_rows,
+        layout=args.layout,
+        header_rows=args.header_rows,
+        text_ratio=args.text_ratio,
+        seed=args.seed,
+    )
+
+
+def _parse_stage_tolerance(items) -> dict:
+    """Разобрать переопределения допуска вида stage=0.5."""
+    result = {}
+    for item in items or []:
+        stage, _, value = item.partition('=')
+        result[stage.strip()] = float(value)
+    return result
+
+
+def _check(args) -> int:
+    """Прогнать стандартные сценарии и сравнить с baseline. Код возврата 1 — регрессия."""
+    current = run_scenarios(args.scenario, repeat=args.repeat)
+
+    if args.update_baseline:
+        save_baseline(current, args.baseline)
+        print(f"Baseline обновлён: {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"Baseline не найден: {args.baseline}. Создайте его флагом --update-baseline.")
+        return 2
+
+    rows = compare(current, baseline, args.tolerance, _parse_stage_tolerance(args.stage_tolerance))
+    print(format_comparison(rows, baseline))
+    return 1 if any(row['status'] == 'regression' for row in rows) else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description="Бенчмарки конвейера обработки")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="сгенерировать нагрузку и замерить этапы")
+    _add_spec_arguments(run_parser)
+    run_parser.add_argument('--repeat', type=int, default=3, help="число прогонов")
+    run_parser.add_argument('--no-memory', action='store_true', help="не замерять пиковую память")
+    run_parser.add_argument('--results-dir', default=str(RESULTS_DIR), help="куда сохранить JSON результата")
+    run_parser.add_argument('--name', default="", help="имя файла результата")
+    run_parser.add_argument('--workdir', default=None, help="сохранить сгенерированные файлы в этот каталог")
+
+    check_parser = commands.add_parser('check', help="сравнить стандартные сценарии с baseline")
+    check_parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="JSON baseline")
+    check_parser.add_argument('--tolerance', type=float, default=0.25,
+                              help="допустимое замедление этапа (0.25 = +25%%)")
+    check_parser.add_argument('--stage-tolerance', action='append', metavar='STAGE=TOL',
+                              help="допуск для отдельного этапа, напр. save=0.5")
+    check_parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                              help="прогнать только указанные сценарии")
+    check_parser.add_argument('--repeat', type=int, default=3, help="прогонов на сценарий")
+    check_parser.add_argument('--update-baseline', action='store_true',
+                              help="записать текущий прогон как baseline вместо сравнения")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'check':
+        return _check(args)
+
+    if args.command == 'run':
+        result = run_benchmark(
+            _spec_from_args(args),
+            repeat=args.repeat,
+            workdir=args.workdir,
+            measure_memory=not args.no_memory,
+        )
+        print(format_result(result))
+        path = save_result(result, args.results_dir, args.name)
+        print(f"Результат сохранён: {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
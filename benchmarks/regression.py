@@ -0,0 +1,138 @@
+"""
+Проверка регрессий производительности: стандартные сценарии против сохранённого baseline.
+
+Время этапов зависит от машины, поэтому baseline не хранится в репозитории. Перед
+первой проверкой его записывают на той же машине:
+    python -m benchmarks check --update-baseline
+и обновляют тем же флагом после принятых изменений производительности.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import json
+
+from src import __version__
+
+from benchmarks.runner import run_benchmark, STAGES, _git_revision
+from benchmarks.workload import WorkloadSpec
+
+# Стандартные сценарии: фиксированный seed, размер — на минуту работы на ноутбуке
+SCENARIOS: Dict[str, WorkloadSpec] = {
+    'flat': WorkloadSpec(rows=600, cities=60, competitors=3, markup_rows=1, seed=1),
+    'aliases': WorkloadSpec(rows=600, cities=60, competitors=2, aliases=3, alias_hit_ratio=0.5, seed=2),
+    'stacked': WorkloadSpec(rows=300, cities=40, competitors=2, layout='stacked', seed=3),
+}
+
+# Сравниваемые этапы: ingest/match/generate/save (collect = ingest + match)
+COMPARED_STAGES = ['ingest', 'match', 'generate', 'save']
+
+DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+
+# Разница меньше этого порога (секунды) считается шумом при любой относительной разнице
+NOISE_FLOOR = 0.01
+
+
+def run_scenarios(names: Optional[List[str]] = None, repeat: int = 3) -> Dict[str, Any]:
+    """Прогнать стандартные сценарии; для сравнения берётся минимум по прогонам."""
+    names = names or list(SCENARIOS)
+    scenarios = {}
+    for name in names:
+        result = run_benchmark(SCENARIOS[name], repeat=repeat, measure_memory=False)
+        scenarios[name] = {
+            'spec': result['spec'],
+            'stages': {stage: result['stages'][stage]['min'] for stage in STAGES},
+        }
+    return {
+        'version': __version__,
+        'revision': _git_revision(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'repeat': repeat,
+        'scenarios': scenarios,
+    }
+
+
+def load_baseline(path: Path) -> Optional[Dict[str, Any]]:
+    """Загрузить baseline (None, если файла нет)."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(run: Dict[str, Any], path: Path):
+    """Сохранить прогон как новый baseline."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(run, f, ensure_ascii=False, indent=2)
+
+
+def compare(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.25,
+    stage_tolerance: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Сравнить прогон с baseline.
+
+    Args:
+        tolerance: допустимое относительное замедление (0.25 = +25%)
+        stage_tolerance: переопределение допуска для отдельных этапов
+
+    Returns:
+        Строки сравнения: scenario, stage, baseline, current, change, status
+        (status: ok / regression / improved / new)
+    """
+    stage_tolerance = stage_tolerance or {}
+    rows = []
+    for name, scenario in current['scenarios'].items():
+        base_scenario = baseline.get('scenarios', {}).get(name)
+        for stage in COMPARED_STAGES:
+            value = scenario['stages'].get(stage, 0.0)
+            if base_scenario is None or stage not in base_scenario['stages']:
+                rows.append({
+                    'scenario': name, 'stage': stage, 'baseline': None,
+                    'current': value, 'change': None, 'status': 'new',
+                })
+                continue
+
+            base_value = base_scenario['stages'][stage]
+            allowed = stage_tolerance.get(stage, tolerance)
+            if base_value > 0:
+                change = (value - base_value) / base_value
+                slower, faster = change > allowed, change < -allowed
+            else:
+                # От нулевого baseline относительной разницы нет — решает абсолютная выше шума
+                change = None
+                slower, faster = True, False
+            if value - base_value > NOISE_FLOOR and slower:
+                status = 'regression'
+            elif base_value - value > NOISE_FLOOR and faster:
+                status = 'improved'
+            else:
+                status = 'ok'
+            rows.append({
+                'scenario': name, 'stage': stage, 'baseline': base_value,
+                'current': value, 'change': change, 'status': status,
+            })
+    return rows
+
+
+def format_comparison(rows: List[Dict[str, Any]], baseline: Dict[str, Any]) -> str:
+    """Таблица сравнения для вывода в консоль."""
+    marks = {'ok': '  ', 'regression': '✗ ', 'improved': '✓ ', 'new': '+ '}
+    lines = [
+        f"Baseline: версия {baseline.get('version', '?')} {baseline.get('revision', '')} "
+        f"от {baseline.get('created_at', '?')}",
+        f"   {'Сценарий':<10} {'Этап':<10} {'baseline, с':>12} {'сейчас, с':>12} {'изменение':>10}",
+    ]
+    for row in rows:
+        base = f"{row['baseline']:.4f}" if row['baseline'] is not None else "—"
+        change = f"{row['change'] * 100:+.1f}%" if row['change'] is not None else "—"
+        lines.append(
+            f"{marks[row['status']]} {row['scenario']:<10} {row['stage']:<10} "
+            f"{base:>12} {row['current']:>12.4f} {change:>10}"
+        )
+    regressions = sum(1 for row in rows if row['status'] == 'regression')
+    lines.append(f"Регрессий: {regressions}")
+    return "\n".join(lines)
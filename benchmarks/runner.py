@@ -0,0 +1,170 @@
+"""
+Замер этапов конвейера обработки на синтетической нагрузке.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import gc
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from src import __version__
+from src.excel_processor import ExcelProcessor
+from src.models import AppConfig
+
+from benchmarks.workload import WorkloadSpec, generate_workload
+
+# Этап бенчмарка -> этапы профилировщика, время которых суммируется
+STAGES = {
+    'collect': ['collect'],
+    'ingest': ['load_workbook'],
+    'match': ['match'],
+    'generate': ['generate', 'markups_sheet', 'write_data', 'own_company'],
+    'save': ['save'],
+}
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def _git_revision() -> str:
+    """Короткий хэш текущего коммита (пустая строка вне git)."""
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).parent, capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def _stage_times(processor: ExcelProcessor) -> Dict[str, float]:
+    """Свести отрезки профилировщика к этапам бенчмарка."""
+    totals = processor.profiler.stage_totals()
+    return {
+        stage: sum(totals.get(name, {}).get('total', 0.0) for name in names)
+        for stage, names in STAGES.items()
+    }
+
+
+def _run_once(config: AppConfig) -> Dict[str, float]:
+    """Один прогон process_all с замером этапов."""
+    config.profiling.enabled = True
+    config.profiling.cprofile = False
+    processor = ExcelProcessor(config)
+    # Мусор от предыдущего прогона не должен собираться посреди замера
+    gc.collect()
+    started = time.perf_counter()
+    processor.process_all()
+    times = _stage_times(processor)
+    times['total'] = time.perf_counter() - started
+    return times
+
+
+def _measure_memory(config: AppConfig) -> Dict[str, float]:
+    """Отдельный прогон под tracemalloc: пиковая память Python-объектов."""
+    tracemalloc.start()
+    try:
+        _run_once(config)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_mb': round(peak / 1024 / 1024, 2)}
+
+
+def run_benchmark(
+    spec: WorkloadSpec,
+    repeat: int = 3,
+    workdir: Optional[Path] = None,
+    measure_memory: bool = True,
+) -> Dict[str, Any]:
+    """
+    Сгенерировать нагрузку и замерить этапы конвейера.
+
+    Время каждого этапа — медиана и минимум по repeat прогонам.
+    Память замеряется отдельным прогоном, чтобы tracemalloc не искажал время.
+    """
+    with tempfile.TemporaryDirectory(prefix='analiz_tk_bench_') as tmp:
+        directory = Path(workdir) if workdir else Path(tmp)
+        config = generate_workload(spec, directory)
+
+        # Логи конвейера только мешают замерам
+        root = logging.getLogger()
+        previous_level = root.level
+        root.setLevel(logging.WARNING)
+        try:
+            runs: List[Dict[str, float]] = [_run_once(config) for _ in range(max(1, repeat))]
+            memory = _measure_memory(config) if measure_memory else {}
+        finally:
+            root.setLevel(previous_level)
+
+    stages: Dict[str, Dict[str, float]] = {}
+    for stage in list(STAGES) + ['total']:
+        values = [run[stage] for run in runs]
+        stages[stage] = {
+            'median': round(statistics.median(values), 6),
+            'min': round(min(values), 6),
+        }
+
+    source_rows = spec.rows * spec.competitors
+    lookups = spec.cities * spec.competitors
+    output_rows = spec.cities * (spec.competitors * (1 + spec.markup_rows) + 4)
+
+    def per_second(amount: int, stage: str) -> float:
+        seconds = stages[stage]['median']
+        return round(amount / seconds, 1) if seconds > 0 else 0.0
+
+    return {
+        'version': __version__,
+        'revision': _git_revision(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'spec': spec.to_dict(),
+        'repeat': repeat,
+        'stages': stages,
+        'throughput': {
+            'ingest_rows_per_s': per_second(source_rows, 'ingest'),
+            'match_lookups_per_s': per_second(lookups, 'match'),
+            'generate_rows_per_s': per_second(output_rows, 'generate'),
+        },
+        'memory': memory,
+    }
+
+
+def save_result(result: Dict[str, Any], directory: Path = RESULTS_DIR, name: str = "") -> Path:
+    """Сохранить результат бенчмарка в JSON."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    if not name:
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        revision = result.get('revision') or result.get('version', '')
+        name = f"{stamp}_{revision}.json"
+    path = directory / name
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    """Человекочитаемая сводка результата."""
+    spec = result['spec']
+    lines = [
+        f"Версия {result['version']} {result.get('revision', '')} | Python {result['python']}",
+        f"Нагрузка: строк {spec['rows']}, городов {spec['cities']}, конкурентов {spec['competitors']}, "
+        f"псевдонимов {spec['aliases']}, строк наценок {spec['markup_rows']}, раскладка {spec['layout']}",
+        f"{'Этап':<10} {'медиана, с':>12} {'минимум, с':>12}",
+    ]
+    for stage, values in result['stages'].items():
+        lines.append(f"{stage:<10} {values['median']:>12.4f} {values['min']:>12.4f}")
+    for key, value in result['throughput'].items():
+        lines.append(f"{key}: {value}")
+    if result.get('memory'):
+        lines.append(f"Пиковая память (tracemalloc): {result['memory']['peak_mb']} МБ")
+    return "\n".join(lines)
@@ -0,0 +1,199 @@
+"""
+Генератор синтетической нагрузки: прайс-листы конкурентов и AppConfig.
+"""
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Any, List
+import random
+
+import openpyxl
+from openpyxl.utils import column_index_from_string
+
+from src.models import (
+    AppConfig, CompetitorConfig, ColumnMapping, RowOffsets, Markups, MarkupRow, OutputConfig
+)
+
+# Слоги для генерации правдоподобных названий городов
+_PREFIXES = ["Ново", "Старо", "Верх", "Нижне", "Красно", "Бело", "Усть-", "Соль-", "Камен", "Зелено"]
+_ROOTS = [
+    "сибир", "алтай", "байкал", "волж", "урал", "томь", "обь", "ангар", "енисей", "кузнец",
+    "север", "лесн", "горн", "речн", "степн", "озерн", "камыш", "берез", "сосн", "кедр",
+]
+_SUFFIXES = ["ск", "ово", "ино", "град", "поль", "горск", "ка", "анск", "ецк", "ярск"]
+
+FIELDS = ['convert', 'minimum_1', 'minimum_2', 'volume', 'weight_100', 'weight_3000']
+
+# Поле -> (минимум, максимум) синтетической цены
+_PRICE_RANGES = {
+    'convert': (150, 600),
+    'minimum_1': (250, 1200),
+    'minimum_2': (350, 2500),
+    'volume': (1500, 9000),
+    'weight_100': (8, 70),
+    'weight_3000': (6, 50),
+}
+
+
+@dataclass
+class WorkloadSpec:
+    """Параметры синтетической нагрузки."""
+    rows: int = 1000              # Строк с городами в каждом файле конкурента
+    cities: int = 100             # Городов в конфигурации
+    aliases: int = 1              # Псевдонимов на город
+    alias_hit_ratio: float = 0.1  # Доля городов, записанных в файле под псевдонимом
+    competitors: int = 3          # Число конкурентов (файлов)
+    markup_rows: int = 1          # Строк наценок на конкурента
+    layout: str = "flat"          # flat — поля в одной строке; stacked — каждое поле на своей строке
+    header_rows: int = 3          # Строк заголовка перед данными
+    text_ratio: float = 0.0       # Доля цен, записанных строкой («1 200 р.»)
+    seed: int = 42
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _city_names(rng: random.Random, count: int) -> List[str]:
+    """Сгенерировать count уникальных названий городов."""
+    names = set()
+    result = []
+    while len(result) < count:
+        name = rng.choice(_PREFIXES) + rng.choice(_ROOTS) + rng.choice(_SUFFIXES)
+        name = name[0].upper() + name[1:]
+        if len(names) >= len(_PREFIXES) * len(_ROOTS) * len(_SUFFIXES):
+            name = f"{name} {len(result)}"
+        if name in names:
+            continue
+        names.add(name)
+        result.append(name)
+    return result
+
+
+def _price(rng: random.Random, field: str, text_ratio: float) -> Any:
+    low, high = _PRICE_RANGES[field]
+    if field.startswith('weight'):
+        value: Any = round(rng.uniform(low, high), 1)
+    else:
+        value = rng.randint(low, high) // 10 * 10
+    if text_ratio and rng.random() < text_ratio:
+        return f"{value:,} р.".replace(",", " ")
+    return value
+
+
+def _layout(spec: WorkloadSpec):
+    """Колонки и смещения строк для выбранной раскладки."""
+    if spec.layout == "stacked":
+        # Все поля в колонке B, каждое на своей строке под строкой города
+        columns = ColumnMapping(city="A", **{f: "B" for f in FIELDS})
+        offsets = RowOffsets(row_2=0, row_3=1, row_4=2, row_5=3, row_6=4, row_7=5)
+        rows_per_city = len(FIELDS)
+    else:
+        columns = ColumnMapping(
+            city="A", convert="C", minimum_1="D", minimum_2="E",
+            volume="G", weight_100="H", weight_3000="J",
+        )
+        offsets = RowOffsets()
+        rows_per_city = 1
+    return columns, offsets, rows_per_city
+
+
+def _write_competitor_file(
+    path: Path,
+    spec: WorkloadSpec,
+    rng: random.Random,
+    labels: List[str],
+    columns: ColumnMapping,
+    offsets: RowOffsets,
+    rows_per_city: int,
+):
+    """Записать прайс-лист конкурента (write_only — быстро и без лишней памяти)."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Тарифы")
+
+    col_index = {
+        letter: column_index_from_string(letter)
+        for letter in asdict(columns).values()
+    }
+    width = max(col_index.values())
+
+    for i in range(spec.header_rows):
+        header = [None] * width
+        header[0] = "Город назначения" if i == 0 else None
+        for field in FIELDS:
+            header[col_index[getattr(columns, field)] - 1] = f"{field} {i}" if i == 0 else None
+        ws.append(header)
+
+    field_offsets = [offsets.row_2, offsets.row_3, offsets.row_4, offsets.row_5, offsets.row_6, offsets.row_7]
+    for label in labels:
+        block = [[None] * width for _ in range(rows_per_city)]
+        block[0][0] = label
+        for field, offset in zip(FIELDS, field_offsets):
+            block[offset][col_index[getattr(columns, field)] - 1] = _price(rng, field, spec.text_ratio)
+        # Колонка B в плоской раскладке — тип доставки (как у реальных ТК)
+        if rows_per_city == 1:
+            block[0][1] = "Авто"
+        for row in block:
+            ws.append(row)
+
+    wb.save(path)
+
+
+def generate_workload(spec: WorkloadSpec, directory: Path) -> AppConfig:
+    """
+    Сгенерировать файлы конкурентов в directory и вернуть конфигурацию для них.
+
+    Каждый файл содержит spec.rows городов в случайном порядке; spec.cities из них
+    попадают в конфигурацию. Часть городов записана в файлах под псевдонимом.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(spec.seed)
+
+    total_rows = max(spec.rows, spec.cities)
+    labels = _city_names(rng, total_rows + spec.cities * spec.aliases)
+    source_cities = labels[:total_rows]
+    alias_pool = labels[total_rows:]
+
+    config_cities = rng.sample(source_cities, spec.cities)
+    city_aliases: Dict[str, List[str]] = {}
+    for i, city in enumerate(config_cities):
+        if spec.aliases:
+            city_aliases[city] = alias_pool[i * spec.aliases:(i + 1) * spec.aliases]
+
+    # Города, записанные в файлах под псевдонимом
+    alias_cities = {
+        city for city in config_cities
+        if city_aliases.get(city) and rng.random() < spec.alias_hit_ratio
+    }
+
+    columns, offsets, rows_per_city = _layout(spec)
+
+    config = AppConfig(
+        output_file=str(directory / "result.xlsx"),
+        cities={city: i for i, city in enumerate(config_cities, 1)},
+        city_aliases=city_aliases,
+        output_config=OutputConfig(title="Стоимость доставки", subtitle="бенчмарк"),
+    )
+
+    for ci in range(spec.competitors):
+        name = f"ТК-{ci + 1}"
+        file_labels = [
+            city_aliases[label][0] if label in alias_cities else label
+            for label in source_cities
+        ]
+        rng.shuffle(file_labels)
+        file_path = directory / f"competitor_{ci + 1}.xlsx"
+        _write_competitor_file(file_path, spec, rng, file_labels, columns, offsets, rows_per_city)
+
+        config.competitors[name] = CompetitorConfig(
+            name=name,
+            file_path=str(file_path),
+            source_columns=ColumnMapping(**asdict(columns)),
+            row_offsets=RowOffsets(**asdict(offsets)),
+            markups=Markups(convert=5.0 * (ci % 2)),
+            markup_rows=[
+                MarkupRow(name=f"+{(mi + 1) * 10}%", percent=(mi + 1) * 10.0)
+                for mi in range(spec.markup_rows)
+            ],
+        )
+
+    return config
@@ -1,7 +1,11 @@
 """
 Главный файл запуска приложения анализа цен конкурентов v2.0
 """
+import multiprocessing
+
 from src.gui import main
 
 if __name__ == '__main__':
+    # Нужно для процессов параллельного сбора в собранном exe (PyInstaller)
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,135 @@
+"""
+Обучение псевдонимов городов по принятым совпадениям.
+
+Метка источника, принятая как строка города по нечёткому сравнению, пересчитывается
+в каждом запуске. Подтверждённая метка добавляется в city_aliases — в следующих
+запусках её канонический ключ находит строку поиском в словаре, и нечёткий проход
+для города не выполняется.
+
+Псевдонимы, которые не давали совпадений в последних запусках (по истории цен), или
+повторяющие название или другой псевдоним после нормализации, предлагаются к удалению,
+чтобы набор вариантов, а с ним и число нечётких проходов, оставался небольшим.
+Псевдоним того же ключа в другой письменности («Almaty» для «Алматы») повтором не
+считается: нечёткое сравнение оценивает его иначе и находит другие метки.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+from src.diagnostics import CityMatch
+from src.matching import prepare
+from src.models import AppConfig
+from src.translit import canonical_key, name_keys
+
+
+@dataclass
+class AliasSuggestion:
+    """Метка источника, принятая как город, но ещё не входящая в его варианты названия."""
+    city: str
+    label: str
+    score: int  # Лучшая оценка совпадения, %
+    variant: str
+    competitors: List[str] = field(default_factory=list)
+
+
+def suggest_aliases(config: AppConfig, matches: Iterable[CityMatch]) -> List[AliasSuggestion]:
+    """
+    Метки, найденные нечётким сравнением, — кандидаты в псевдонимы.
+
+    Метки с ключом названия или псевдонима города (в том числе в другой письменности)
+    уже находятся по словарю и не предлагаются; метки с ключом другого города — тоже.
+
+    Returns:
+        Кандидаты в порядке городов конфигурации, внутри города — по убыванию оценки
+    """
+    own_keys = {city: set(name_keys(config.get_city_names(city))) for city in config.cities}
+    taken_keys = set().union(*own_keys.values())
+
+    found: Dict[Tuple[str, str], AliasSuggestion] = {}
+    for match in matches:
+        key = canonical_key(match.label)
+        if match.city not in own_keys or not key or key in taken_keys:
+            continue
+        suggestion = found.get((match.city, key))
+        if suggestion is None:
+            suggestion = found[(match.city, key)] = AliasSuggestion(
+                city=match.city, label=match.label.strip(), score=match.score, variant=match.variant
+            )
+        elif match.score > suggestion.score:
+            suggestion.score, suggestion.variant = match.score, match.variant
+        if match.competitor not in suggestion.competitors:
+            suggestion.competitors.append(match.competitor)
+
+    order = {city: i for i, city in enumerate(config.cities)}
+    return sorted(found.values(), key=lambda s: (order[s.city], -s.score, s.label))
+
+
+def accept_aliases(config: AppConfig, suggestions: Iterable[AliasSuggestion]) -> int:
+    """
+    Добавить метки в city_aliases.
+
+    Returns:
+        Число добавленных псевдонимов (метки с уже известным ключом пропускаются)
+    """
+    added = 0
+    for suggestion in suggestions:
+        names = config.get_city_names(suggestion.city)
+        if canonical_key(suggestion.label) in name_keys(names):
+            continue
+        config.city_aliases.setdefault(suggestion.city, []).append(suggestion.label)
+        added += 1
+    return added
+
+
+def stale_aliases(
+    config: AppConfig,
+    matches: Iterable[CityMatch],
+    runs_seen: int,
+    min_runs: int,
+) -> Dict[str, List[str]]:
+    """
+    Псевдонимы к удалению.
+
+    Повторяющие название или предыдущий псевдоним после нормализации (тот же
+    ключ и тот же запрос нечёткого сравнения — ни одной новой метки) — всегда. Не дававшие
+    совпадений (ни как вариант совпадения, ни ключом принятой метки) — только если
+    в истории есть не меньше min_runs запусков с записанными метками.
+
+    Returns:
+        {город: [псевдоним, ...]}
+    """
+    used: Dict[str, Set[str]] = {}
+    for match in matches:
+        used.setdefault(match.city, set()).update((match.variant, canonical_key(match.label)))
+
+    stale: Dict[str, List[str]] = {}
+    for city, aliases in config.city_aliases.items():
+        # Ключи и запросы нечёткого сравнения названия и предыдущих псевдонимов
+        seen = {(canonical_key(city), prepare(city.lower()))}
+        city_used = used.get(city, set())
+        for alias in aliases:
+            key = canonical_key(alias)
+            variant = (key, prepare(alias.lower()))
+            redundant = variant in seen
+            unused = runs_seen >= min_runs and alias not in city_used and key not in city_used
+            if redundant or unused:
+                stale.setdefault(city, []).append(alias)
+            seen.add(variant)
+    return stale
+
+
+def remove_aliases(config: AppConfig, stale: Dict[str, List[str]]) -> int:
+    """
+    Удалить псевдонимы из city_aliases.
+
+    Returns:
+        Число удалённых псевдонимов
+    """
+    removed = 0
+    for city, aliases in stale.items():
+        kept = [a for a in config.city_aliases.get(city, []) if a not in aliases]
+        removed += len(config.city_aliases.get(city, [])) - len(kept)
+        if kept:
+            config.city_aliases[city] = kept
+        else:
+            config.city_aliases.pop(city, None)
+    return removed
@@ -0,0 +1,183 @@
+"""
+Поиск города по всем конкурентам без повторного чтения файлов.
+
+Для каждого конкурента строится индекс меток колонки города: метка, номер строки
+и значения полей этой строки. Индексы строятся как побочный продукт сбора данных
+(лист уже прочитан) и хранятся до изменения файла или колонок. Запрос — поиск
+по префиксу в отсортированных метках, поиск канонического ключа (транслитерация)
+и оценка WRatio по меткам конкурента.
+"""
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import logging
+import os
+
+from src.matching import prepare, wratio_scores
+from src.models import CompetitorConfig
+from src.sheet_rows import SheetRows
+from src.translit import canonical_key, name_keys
+
+logger = logging.getLogger(__name__)
+
+# Ниже этого совпадения метка не показывается в результатах поиска
+MIN_LOOKUP_SCORE = 60
+
+# Ячейки полей строки: [(поле, колонка, строка)] — как ExcelProcessor._field_cells
+FieldCells = Callable[[CompetitorConfig, int], List[Tuple[str, str, int]]]
+
+
+@dataclass
+class LookupHit:
+    """Строка конкурента, подходящая под запрос."""
+    competitor: str
+    row: int
+    label: str
+    score: int                    # Лучшее совпадение WRatio с запросом (или его вариантами), %
+    matched: bool                 # Совпадение не ниже порога конкурента
+    prefix: bool = False          # Метка начинается с запроса
+    values: Dict[str, Any] = field(default_factory=dict)
+
+
+def index_key(competitor: CompetitorConfig) -> Tuple:
+    """Ключ актуальности индекса: файл (размер и время изменения) и колонки конкурента."""
+    try:
+        stat = os.stat(competitor.file_path)
+        stamp = (os.path.abspath(competitor.file_path), stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        stamp = (competitor.file_path, -1, -1)
+    return stamp + (
+        tuple(vars(competitor.source_columns).values()),
+        tuple(vars(competitor.row_offsets).values()),
+    )
+
+
+class LabelIndex:
+    """Метки колонки города одного конкурента со значениями полей."""
+
+    def __init__(self, competitor: CompetitorConfig, entries: List[Tuple[int, str, Dict[str, Any]]]):
+        self.competitor = competitor.name
+        self.key = index_key(competitor)
+        # Одинаковые метки у конкурентов с общим файлом и колонкой города оцениваются один раз
+        self.labels_key = self.key[:3] + (competitor.source_columns.city,)
+        self.entries = entries
+        # Метки в нижнем регистре, отсортированные для поиска по префиксу: (метка, номер записи)
+        self.lowered = [label.strip().lower() for _, label, _ in entries]
+        self.sorted_keys = sorted((text, i) for i, text in enumerate(self.lowered))
+        # Метки, подготовленные для пакетной оценки WRatio
+        self.prepared = [prepare(label) for _, label, _ in entries]
+        # Канонические ключи меток: {ключ: [номер записи]}
+        self.keys: Dict[str, List[int]] = {}
+        for i, (_, label, _) in enumerate(entries):
+            key = canonical_key(label)
+            if key:
+                self.keys.setdefault(key, []).append(i)
+
+    @classmethod
+    def build(cls, sheet: SheetRows, competitor: CompetitorConfig, field_cells: FieldCells) -> 'LabelIndex':
+        """Построить индекс по прочитанному листу."""
+        entries = []
+        for row_idx, label in sheet.labels(competitor.source_columns.city):
+            values = {
+                name: sheet.value(col, row)
+                for name, col, row in field_cells(competitor, row_idx)
+            }
+            entries.append((row_idx, str(label), values))
+        return cls(competitor, entries)
+
+    def prefix_matches(self, text: str) -> List[int]:
+        """Номера записей, метка которых начинается с text."""
+        found = []
+        pos = bisect_left(self.sorted_keys, (text,))
+        while pos < len(self.sorted_keys) and self.sorted_keys[pos][0].startswith(text):
+            found.append(self.sorted_keys[pos][1])
+            pos += 1
+        return found
+
+    def score(self, names: List[str]) -> Dict[int, int]:
+        """
+        Оценки записей, подходящих под запрос: {номер записи: лучшая оценка WRatio}.
+
+        Args:
+            names: запрос и его варианты (основное название и псевдонимы), в нижнем регистре
+        """
+        prefix = {i for name in names for i in self.prefix_matches(name)}
+        best: Dict[int, int] = {i: 0 for i in prefix}
+        # Та же метка в другой письменности или под известным другим названием
+        for key in name_keys(names):
+            for i in self.keys.get(key, ()):
+                best[i] = 100
+        for query in dict.fromkeys(prepare(name) for name in names):
+            for i, score in wratio_scores(query, self.prepared, MIN_LOOKUP_SCORE):
+                best[i] = max(best.get(i, 0), score)
+        return best
+
+    def hits(self, names: List[str], best: Dict[int, int], limit: int, threshold: int) -> List[LookupHit]:
+        """
+        Лучшие строки по оценкам score().
+
+        Args:
+            limit: сколько строк вернуть
+            threshold: порог совпадения конкурента (%) — для признака matched
+        """
+        prefix = {i for name in names for i in self.prefix_matches(name)}
+        # Выше оценка; при равной — префиксные совпадения; затем по порядку строк
+        ranked = sorted((-score, i not in prefix, i, score) for i, score in best.items())
+        hits = []
+        for _, _, i, score in ranked[:limit]:
+            row_idx, label, values = self.entries[i]
+            hits.append(LookupHit(
+                competitor=self.competitor,
+                row=row_idx,
+                label=label,
+                score=score,
+                matched=score >= threshold,
+                prefix=i in prefix,
+                values=dict(values),
+            ))
+        return hits
+
+
+class CityLookup:
+    """Кэш индексов меток по конкурентам и запросы к ним."""
+
+    def __init__(self):
+        self.indexes: Dict[str, LabelIndex] = {}
+
+    def store(self, index: LabelIndex):
+        self.indexes[index.competitor] = index
+
+    def stale(self, competitors: List[CompetitorConfig]) -> List[CompetitorConfig]:
+        """Конкуренты без индекса или с изменившимся файлом/колонками."""
+        return [
+            c for c in competitors
+            if c.name not in self.indexes or self.indexes[c.name].key != index_key(c)
+        ]
+
+    def search(
+        self,
+        names: List[str],
+        competitors: List[CompetitorConfig],
+        limit: int = 3,
+    ) -> Dict[str, List[LookupHit]]:
+        """
+        Найти строки по всем конкурентам (только по готовым индексам).
+
+        Returns:
+            {конкурент: [LookupHit, ...]} в порядке competitors
+        """
+        names = [n.strip().lower() for n in names if n and n.strip()]
+        results: Dict[str, List[LookupHit]] = {}
+        scores: Dict[Tuple, Dict[int, int]] = {}
+        for competitor in competitors:
+            index: Optional[LabelIndex] = self.indexes.get(competitor.name)
+            if index is None or not names:
+                results[competitor.name] = []
+                continue
+            best = scores.get(index.labels_key)
+            if best is None:
+                best = scores[index.labels_key] = index.score(names)
+            results[competitor.name] = index.hits(
+                names, best, limit, competitor.fuzzy_match_threshold
+            )
+        return results
@@ -0,0 +1,284 @@
+"""
+Автоопределение колонок в файле нового конкурента.
+
+Читаются только первые строки листа в потоковом режиме (read_only), поэтому
+размер файла на время не влияет. Колонка города ищется по совпадениям значений
+с настроенными городами, колонки полей — по заголовкам над первой строкой данных.
+"""
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+import re
+import time
+
+import openpyxl
+from openpyxl.utils import get_column_letter
+from thefuzz import fuzz
+
+from src.mapped_io import MappedFiles
+from src.matching import PREFILTER_MIN_THRESHOLD, TrigramIndex, best_wratio, prepare
+from src.models import AppConfig, ColumnMapping
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк читать по умолчанию
+DEFAULT_SCAN_ROWS = 200
+
+# Сколько строк над первой строкой данных считаются заголовком
+HEADER_DEPTH = 3
+
+# Ниже этой уверенности поле не предлагается (остаётся текущая колонка)
+MIN_CONFIDENCE = 0.6
+
+# Сколько найденных городов в колонке считается полной уверенностью
+CITY_HITS_FOR_CERTAINTY = 3
+
+# Формулировки заголовков для каждого поля (как в OutputFileGenerator.FIELD_NAMES и у конкурентов)
+FIELD_VOCABULARY: Dict[str, List[str]] = {
+    'city': ['город', 'город назначения', 'направление', 'направления', 'пункт назначения'],
+    'convert': ['конверт', 'документы', 'до 1 кг', 'до 0,5 кг'],
+    'minimum_1': ['посылка до 10 кг', 'до 10 кг', 'до 5 кг'],
+    'minimum_2': ['1 место до 30 кг', 'до 30 кг', 'до 20 кг', 'более 10 кг'],
+    'volume': ['груз до 0,5 куба', 'до 0,5 м3', 'объем', 'тариф за 1 м3'],
+    'weight_100': ['груз до 100 кг', 'до 100 кг', 'до 150 кг'],
+    'weight_3000': ['груз более 3000 кг', 'более 3000 кг', 'от 3000'],
+}
+
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+_DIGIT_UNIT_RE = re.compile(r'(\d)([a-zа-я])')
+_SPACES_RE = re.compile(r'\s+')
+
+
+@dataclass
+class ColumnDetection:
+    """Предложение маппинга колонок с уверенностью по каждому полю."""
+    mapping: ColumnMapping
+    confidence: Dict[str, float] = field(default_factory=dict)  # поле -> 0..1 (0 — не найдено)
+    header_rows: Tuple[int, int] = (0, 0)  # первая и последняя строка заголовка (0 — нет)
+    data_start_row: int = 0
+    city_hits: int = 0  # сколько строк совпало с настроенными городами
+    scanned_rows: int = 0
+    elapsed: float = 0.0
+
+    def detected_fields(self) -> List[str]:
+        """Поля, для которых колонка найдена уверенно."""
+        return [name for name, value in self.confidence.items() if value >= MIN_CONFIDENCE]
+
+
+def _normalize_header(text: str) -> str:
+    s = text.lower().replace('\n', ' ').replace('ё', 'е').replace('м³', 'м3').replace('куба', 'м3')
+    s = s.replace(',', '.')
+    s = _DIGIT_UNIT_RE.sub(r'\1 \2', s)
+    return _SPACES_RE.sub(' ', s).strip()
+
+
+# Словарь в нормализованном виде: {поле: [(фраза, числа фразы)]}
+_VOCABULARY = {
+    name: [(_normalize_header(p), set(_NUMBER_RE.findall(_normalize_header(p)))) for p in phrases]
+    for name, phrases in FIELD_VOCABULARY.items()
+}
+
+
+def header_score(header: str, field_name: str) -> float:
+    """
+    Похожесть заголовка на поле (0..1).
+
+    Числа во фразе («до 10 кг») должны быть и в заголовке, иначе «до 100 кг»
+    и «до 10 кг» были бы почти одинаковы.
+    """
+    if not header:
+        return 0.0
+    header_numbers = set(_NUMBER_RE.findall(header))
+    best = 0.0
+    for phrase, numbers in _VOCABULARY[field_name]:
+        score = fuzz.token_set_ratio(phrase, header) / 100
+        if numbers and not numbers <= header_numbers:
+            score *= 0.6
+        best = max(best, score)
+    return best
+
+
+def _is_text(value: Any) -> bool:
+    return isinstance(value, str) and any(ch.isalpha() for ch in value)
+
+
+def _has_digits(value: Any) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    return isinstance(value, str) and any(ch.isdigit() for ch in value)
+
+
+def _read_rows(source: Any, max_rows: int) -> List[Tuple[Any, ...]]:
+    """Первые строки первого листа (потоковое чтение); source — путь или файловый объект."""
+    wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = wb.worksheets[0]
+        return [tuple(row) for row in sheet.iter_rows(max_row=max_rows, values_only=True)]
+    finally:
+        wb.close()
+
+
+class _CityIndex:
+    """
+    Проверка значений ячеек на совпадение с настроенными городами (с кэшем по значению).
+
+    Названия подготавливаются один раз. При пороге не ниже PREFILTER_MIN_THRESHOLD
+    WRatio считается только для названий, отобранных индексом триграмм (результат
+    тот же, что у перебора), иначе — против всех названий одним вызовом rapidfuzz.
+    """
+
+    def __init__(self, config: AppConfig, threshold: int):
+        self.names = {
+            name.lower()
+            for city in config.cities.keys()
+            for name in config.get_city_names(city)
+        }
+        self.prepared = sorted({prepare(name) for name in self.names} - {""})
+        self.threshold = threshold
+        self.index = TrigramIndex(self.prepared) if threshold >= PREFILTER_MIN_THRESHOLD else None
+        self._cache: Dict[str, bool] = {}
+
+    def matches(self, value: str) -> bool:
+        text = value.strip().lower()
+        result = self._cache.get(text)
+        if result is None:
+            if text in self.names:
+                result = True
+            elif self.index is not None:
+                result = bool(self.index.scores(prepare(text), self.threshold))
+            else:
+                result = best_wratio(prepare(text), self.prepared, self.threshold) is not None
+            self._cache[text] = result
+        return result
+
+
+def detect_columns(
+    file_path: str,
+    config: AppConfig,
+    current: Optional[ColumnMapping] = None,
+    max_rows: int = DEFAULT_SCAN_ROWS,
+    threshold: int = 95,
+    files: Optional[MappedFiles] = None,
+) -> Optional[ColumnDetection]:
+    """
+    Предложить колонки для файла конкурента.
+
+    Args:
+        file_path: файл конкурента
+        config: конфигурация (города и псевдонимы для поиска колонки города)
+        current: текущий маппинг — для неуверенно найденных полей колонка не меняется
+        max_rows: сколько первых строк читать
+        threshold: порог совпадения названия города (%)
+        files: отображения файлов запуска (файл читается из уже отображённой области)
+
+    Returns:
+        ColumnDetection или None, если файл не удалось прочитать
+    """
+    if not file_path or not Path(file_path).exists():
+        logger.warning(f"Файл не найден: {file_path}")
+        return None
+
+    started = time.perf_counter()
+    try:
+        rows = _read_rows(files.reader(file_path) if files else file_path, max_rows)
+    except Exception as e:
+        logger.error(f"Ошибка чтения {file_path}: {e}")
+        return None
+
+    width = max((len(row) for row in rows), default=0)
+    columns = [[row[i] if i < len(row) else None for row in rows] for i in range(width)]
+    mapping = ColumnMapping(**vars(current)) if current else ColumnMapping()
+    detection = ColumnDetection(mapping=mapping, scanned_rows=len(rows))
+
+    # Колонка города: строки, совпавшие с настроенными городами
+    cities = _CityIndex(config, threshold)
+    city_rows: Dict[int, List[int]] = {}
+    for col_idx, values in enumerate(columns):
+        texts = [v for v in values if _is_text(v)]
+        if not texts or len(texts) * 2 < sum(1 for v in values if v is not None):
+            continue
+        hits = [row_idx for row_idx, v in enumerate(values) if _is_text(v) and cities.matches(v)]
+        if hits:
+            city_rows[col_idx] = hits
+
+    if city_rows:
+        city_col = max(city_rows, key=lambda c: (len(city_rows[c]), -c))
+        data_start = city_rows[city_col][0]
+    else:
+        city_col = None
+        data_start = _guess_data_start(rows)
+
+    # Текст заголовка колонки — все значения в нескольких строках над данными
+    header_first = max(0, data_start - HEADER_DEPTH)
+    headers = [
+        _normalize_header(" ".join(
+            str(values[r]) for r in range(header_first, data_start) if values[r] is not None
+        ))
+        for values in columns
+    ]
+    if data_start > 0:
+        detection.header_rows = (header_first + 1, data_start)
+    detection.data_start_row = data_start + 1
+
+    # Город: совпадения с городами и заголовок, объединённые как независимые признаки
+    city_confidence: Dict[int, float] = {}
+    for col_idx in range(width):
+        hits = len(city_rows.get(col_idx, []))
+        by_cities = min(1.0, hits / max(1, min(CITY_HITS_FOR_CERTAINTY, len(cities.names))))
+        by_header = header_score(headers[col_idx], 'city')
+        city_confidence[col_idx] = 1 - (1 - by_cities) * (1 - by_header)
+    if city_col is None and city_confidence:
+        city_col = max(city_confidence, key=lambda c: (city_confidence[c], -c))
+    if city_col is not None:
+        detection.city_hits = len(city_rows.get(city_col, []))
+        _propose(detection, 'city', city_col, city_confidence[city_col])
+
+    # Поля цен: заголовок, с поправкой на долю ячеек с числами под ним
+    for field_name in FIELD_VOCABULARY:
+        if field_name == 'city':
+            continue
+        best_col, best_score = None, 0.0
+        for col_idx in range(width):
+            if col_idx == city_col:
+                continue
+            score = header_score(headers[col_idx], field_name)
+            if score <= best_score:
+                continue
+            data = [v for v in columns[col_idx][data_start:] if v is not None]
+            numeric = sum(1 for v in data if _has_digits(v)) / len(data) if data else 0.0
+            score *= 0.5 + 0.5 * numeric
+            if score > best_score:
+                best_col, best_score = col_idx, score
+        _propose(detection, field_name, best_col, best_score)
+
+    detection.elapsed = time.perf_counter() - started
+    logger.info(
+        f"Определение колонок {Path(file_path).name}: строк {len(rows)}, "
+        f"найдено полей {len(detection.detected_fields())} из {len(FIELD_VOCABULARY)} "
+        f"за {detection.elapsed:.2f} с"
+    )
+    return detection
+
+
+def _propose(detection: ColumnDetection, field_name: str, col_idx: Optional[int], score: float):
+    """Записать колонку в маппинг, если уверенность достаточна."""
+    score = round(score, 2)
+    if col_idx is None or score < MIN_CONFIDENCE:
+        detection.confidence[field_name] = 0.0
+        return
+    setattr(detection.mapping, field_name, get_column_letter(col_idx + 1))
+    detection.confidence[field_name] = score
+
+
+def _guess_data_start(rows: List[Tuple[Any, ...]]) -> int:
+    """Первая строка данных без найденных городов: текст в начале и в основном числа дальше."""
+    for row_idx, row in enumerate(rows[1:], start=1):
+        values = [v for v in row if v is not None]
+        if len(values) < 3 or not _is_text(values[0]):
+            continue
+        if sum(1 for v in values[1:] if _has_digits(v)) * 2 >= len(values) - 1:
+            return row_idx
+    return 1 if len(rows) > 1 else 0
@@ -0,0 +1,151 @@
+"""
+Условия на строку города (special_conditions), скомпилированные в проверки кортежа строки.
+
+Правило задаёт колонку, оператор и значение, при необходимости — города.
+Правила компилируются один раз на конкурента: номер колонки, приведённое значение
+и функция сравнения готовы заранее, а проверка строки работает прямо с кортежем
+значений из прохода по листу, без дополнительных чтений ячеек.
+"""
+from typing import Any, Callable, Dict, List, Sequence
+import re
+
+from openpyxl.utils import column_index_from_string
+
+from src.models import ConditionRule
+from src.pricing import is_number
+
+# Оператор -> подпись для интерфейса
+OPERATORS = {
+    'eq': "равно",
+    'ne': "не равно",
+    'in': "одно из",
+    'not_in': "не одно из",
+    'contains': "содержит",
+    'not_contains': "не содержит",
+    'regex': "регулярное выражение",
+    'empty': "пусто",
+    'not_empty': "не пусто",
+    'gt': ">",
+    'ge': "≥",
+    'lt': "<",
+    'le': "≤",
+}
+
+RowCheck = Callable[[Sequence[Any]], bool]
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value).strip().casefold()
+
+
+def _number(value: Any):
+    """Число из значения ячейки или None."""
+    if is_number(value):
+        return value
+    try:
+        return float(str(value).strip().replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _values(value: Any) -> List[Any]:
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return str(value).split(',')
+
+
+def _compile_rule(rule: ConditionRule) -> RowCheck:
+    """Проверка одного правила для кортежа значений строки."""
+    try:
+        idx = column_index_from_string(rule.column.strip().upper()) - 1
+    except ValueError:
+        raise ValueError(f"Неверная колонка условия: '{rule.column}'")
+
+    def cell(row: Sequence[Any]) -> Any:
+        return row[idx] if idx < len(row) else None
+
+    op = rule.operator
+    if op in ('eq', 'ne'):
+        expected_text = _text(rule.value)
+        expected_number = _number(rule.value)
+
+        def equal(row):
+            value = cell(row)
+            if expected_number is not None and is_number(value):
+                return value == expected_number
+            return _text(value) == expected_text
+
+        return equal if op == 'eq' else (lambda row: not equal(row))
+
+    if op in ('in', 'not_in'):
+        allowed = {_text(v) for v in _values(rule.value)}
+        if op == 'in':
+            return lambda row: _text(cell(row)) in allowed
+        return lambda row: _text(cell(row)) not in allowed
+
+    if op in ('contains', 'not_contains'):
+        part = _text(rule.value)
+        if op == 'contains':
+            return lambda row: part in _text(cell(row))
+        return lambda row: part not in _text(cell(row))
+
+    if op == 'regex':
+        try:
+            pattern = re.compile(str(rule.value), re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Неверное регулярное выражение '{rule.value}': {e}")
+        return lambda row: pattern.search("" if cell(row) is None else str(cell(row))) is not None
+
+    if op == 'empty':
+        return lambda row: _text(cell(row)) == ""
+    if op == 'not_empty':
+        return lambda row: _text(cell(row)) != ""
+
+    if op in ('gt', 'ge', 'lt', 'le'):
+        bound = _number(rule.value)
+        if bound is None:
+            raise ValueError(f"Условие '{OPERATORS[op]}' требует числа, получено '{rule.value}'")
+        compare = {
+            'gt': lambda a: a > bound,
+            'ge': lambda a: a >= bound,
+            'lt': lambda a: a < bound,
+            'le': lambda a: a <= bound,
+        }[op]
+
+        def numeric(row):
+            value = _number(cell(row))
+            return value is not None and compare(value)
+
+        return numeric
+
+    raise ValueError(f"Неизвестный оператор условия: '{op}'")
+
+
+class CompiledConditions:
+    """Скомпилированные условия конкурента; проверки для города собираются один раз."""
+
+    def __init__(self, rules: List[ConditionRule]):
+        self._common: List[RowCheck] = []
+        self._by_city: Dict[str, List[RowCheck]] = {}
+        for rule in rules:
+            check = _compile_rule(rule)
+            if rule.cities:
+                for city in rule.cities:
+                    self._by_city.setdefault(city, []).append(check)
+            else:
+                self._common.append(check)
+        self._for_city: Dict[str, List[RowCheck]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._common or self._by_city)
+
+    def checks(self, city: str) -> List[RowCheck]:
+        """Проверки, действующие для города."""
+        checks = self._for_city.get(city)
+        if checks is None:
+            checks = self._for_city[city] = self._common + self._by_city.get(city, [])
+        return checks
+
+    def matches(self, row: Sequence[Any], city: str) -> bool:
+        """Строка проходит все условия города."""
+        return all(check(row) for check in self.checks(city))
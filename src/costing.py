@@ -0,0 +1,441 @@
+"""
+Расчёт стоимости журнала отгрузок по тарифам конкурентов и собственной ТК.
+
+CSV отгрузок (город назначения, вес, объём) читается потоково блоками: каждая строка
+относится к тарифу (конверт, минималки, объём, вес 100, вес 3000) по весу и объёму
+и добавляется в агрегат (город, тариф). Стоимость по перевозчикам считается
+по агрегатам, поэтому память не зависит от длины журнала.
+"""
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+import csv
+import logging
+import time
+
+from src.matching import PREFILTER_MIN_THRESHOLD, TrigramIndex, prepare, wratio_scores
+from src.models import AppConfig, CompetitorConfig
+from src.pricing import is_number, marked_up_value, average_value, own_company_value
+from src.translit import canonical_key, name_keys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# Объёмный вес: 1 м³ считается как 250 кг
+VOLUMETRIC_KG_PER_M3 = 250.0
+
+# Сколько нераспознанных городов назначения запоминать для отчёта
+MAX_UNMATCHED_TRACKED = 1000
+
+# Заголовки колонок CSV отгрузок (сравниваются без единиц после запятой)
+SHIPMENT_COLUMNS = {
+    'destination': ['город', 'город назначения', 'назначение', 'пункт назначения',
+                    'направление', 'destination', 'city'],
+    'weight': ['вес', 'weight'],
+    'volume': ['объем', 'volume'],
+}
+
+
+@dataclass
+class TierRule:
+    """Тариф отгрузки: поле конкурента и границы по весу/объёму."""
+    field: str
+    max_weight: Optional[float] = None  # кг, включительно
+    max_volume: Optional[float] = None  # м³, включительно
+    per_kg: bool = False  # Цена за кг расчётного веса (иначе — за отправление)
+
+
+# Правила проверяются по порядку, отгрузка попадает в первый подходящий тариф
+DEFAULT_TIERS = [
+    TierRule('convert', max_weight=1, max_volume=0.004),
+    TierRule('minimum_1', max_weight=10),
+    TierRule('minimum_2', max_weight=30),
+    TierRule('volume', max_weight=100, max_volume=0.5),
+    TierRule('weight_100', max_weight=3000, per_kg=True),
+    TierRule('weight_3000', per_kg=True),
+]
+
+
+@dataclass
+class ShipmentChunk:
+    """Блок отгрузок в колоночном виде."""
+    cities: List[Optional[str]]
+    weights: array
+    volumes: array
+
+
+@dataclass
+class CarrierCost:
+    """Стоимость отгрузок города у перевозчика."""
+    cost: float = 0.0
+    own_cost: float = 0.0  # Стоимость тех же отгрузок у собственной ТК
+    shipments: int = 0     # Отгрузки, для которых есть тарифы и у перевозчика, и у нас
+
+    @property
+    def savings(self) -> float:
+        """Сколько клиент экономит у собственной ТК по сравнению с перевозчиком."""
+        return self.cost - self.own_cost
+
+
+@dataclass
+class CityCosting:
+    """Итоги по городу назначения."""
+    city: str
+    shipments: int = 0
+    weight: float = 0.0
+    own_cost: float = 0.0
+    own_priced: int = 0
+    carriers: Dict[str, CarrierCost] = field(default_factory=dict)
+
+
+@dataclass
+class CostingResult:
+    """Результат расчёта журнала отгрузок."""
+    cities: List[CityCosting]
+    carriers: List[str]
+    total_rows: int = 0
+    invalid_rows: int = 0
+    unmatched_rows: int = 0
+    unmatched: Dict[str, int] = field(default_factory=dict)  # назначение -> число строк
+    # Объём в единицах тарифа: {(город, поле): отправлений или кг расчётного веса}
+    units: Dict[Tuple[str, str], float] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+
+def _normalize_header(text: str) -> str:
+    return text.split(',')[0].strip().lower().replace('ё', 'е')
+
+
+def _to_float(text: str) -> Optional[float]:
+    text = text.strip().replace(' ', '').replace(' ', '').replace(',', '.')
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _detect_delimiter(header_line: str) -> str:
+    # «;» и табуляция проверяются первыми: запятая бывает в заголовках («Вес, кг»)
+    for delimiter in (';', '\t', ','):
+        if delimiter in header_line:
+            return delimiter
+    return ';'
+
+
+class _CityResolver:
+    """
+    Город назначения -> настроенный город (с кэшем по значению).
+
+    Порядок как при сборе: точное название, канонический ключ (транслитерация,
+    известные другие названия), затем нечёткое сравнение. Названия подготавливаются
+    один раз; при пороге не ниже PREFILTER_MIN_THRESHOLD WRatio считается только для
+    отобранных индексом триграмм, иначе — пакетно по всем названиям. При равной
+    оценке выигрывает город, чьё название идёт раньше в конфигурации.
+    """
+
+    def __init__(self, config: AppConfig, threshold: int):
+        self._cache: Dict[str, Optional[str]] = {}
+        self.keys: Dict[str, str] = {}
+        # Подготовленные названия без повторов и их города — в порядке конфигурации
+        self.prepared: List[str] = []
+        self.cities: List[str] = []
+        seen = set()
+        for city in config.cities.keys():
+            names = config.get_city_names(city)
+            for name in names:
+                self._cache.setdefault(name.lower(), city)
+                query = prepare(name.lower())
+                if query and query not in seen:
+                    seen.add(query)
+                    self.prepared.append(query)
+                    self.cities.append(city)
+            for key in name_keys(names):
+                self.keys.setdefault(key, city)
+        self.threshold = threshold
+        self.index = TrigramIndex(self.prepared) if threshold >= PREFILTER_MIN_THRESHOLD else None
+
+    def resolve(self, destination: str) -> Optional[str]:
+        text = destination.strip().lower()
+        if text in self._cache:
+            return self._cache[text]
+        city = self.keys.get(canonical_key(text))
+        if city is None:
+            query = prepare(text)
+            if not query:
+                scored = []
+            elif self.index is not None:
+                scored = self.index.scores(query, self.threshold)
+            else:
+                scored = wratio_scores(query, self.prepared, self.threshold)
+            # Лучшая целая оценка, при равной — раньше в конфигурации (как при переборе)
+            best = max(scored, key=lambda item: (item[1], -item[0]), default=None)
+            city = self.cities[best[0]] if best else None
+        self._cache[text] = city
+        return city
+
+
+def read_shipments(
+    csv_path: Path,
+    resolver: '_CityResolver',
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    stats: Optional[CostingResult] = None,
+) -> Iterator[ShipmentChunk]:
+    """
+    Прочитать CSV отгрузок блоками по chunk_size строк.
+
+    Разделитель («;», табуляция или «,») определяется по заголовку. Строки без веса
+    и с нераспознанным городом учитываются в stats и в блоки не попадают.
+    """
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        header_line = f.readline()
+        delimiter = _detect_delimiter(header_line)
+        header = next(csv.reader([header_line], delimiter=delimiter))
+        positions: Dict[str, int] = {}
+        for idx, name in enumerate(header):
+            for column, aliases in SHIPMENT_COLUMNS.items():
+                if column not in positions and _normalize_header(name) in aliases:
+                    positions[column] = idx
+        missing = [c for c in ('destination', 'weight') if c not in positions]
+        if missing:
+            raise ValueError(f"В CSV нет колонок: {', '.join(missing)} (заголовок: {header})")
+
+        dest_idx = positions['destination']
+        weight_idx = positions['weight']
+        volume_idx = positions.get('volume')
+
+        chunk = ShipmentChunk([], array('d'), array('d'))
+        for row in csv.reader(f, delimiter=delimiter):
+            if not row:
+                continue
+            if stats is not None:
+                stats.total_rows += 1
+            weight = _to_float(row[weight_idx]) if weight_idx < len(row) else None
+            if weight is None or weight < 0 or dest_idx >= len(row):
+                if stats is not None:
+                    stats.invalid_rows += 1
+                continue
+            volume = None
+            if volume_idx is not None and volume_idx < len(row):
+                volume = _to_float(row[volume_idx])
+
+            destination = row[dest_idx]
+            city = resolver.resolve(destination)
+            if city is None:
+                if stats is not None:
+                    stats.unmatched_rows += 1
+                    key = destination.strip()
+                    if key in stats.unmatched or len(stats.unmatched) < MAX_UNMATCHED_TRACKED:
+                        stats.unmatched[key] = stats.unmatched.get(key, 0) + 1
+                continue
+
+            chunk.cities.append(city)
+            chunk.weights.append(weight)
+            chunk.volumes.append(volume or 0.0)
+            if len(chunk.cities) >= chunk_size:
+                yield chunk
+                chunk = ShipmentChunk([], array('d'), array('d'))
+        if chunk.cities:
+            yield chunk
+
+
+class ShipmentCosting:
+    """
+    Агрегация отгрузок и расчёт стоимости по тарифам запуска.
+
+    Args:
+        config: конфигурация (наценки конкурентов и собственной ТК)
+        collected: нормализованные данные запуска {конкурент: {город: {поле: значение}}}
+        city_competitors: конкуренты, выведенные в каждом городе
+        tiers: правила выбора тарифа
+    """
+
+    def __init__(
+        self,
+        config: AppConfig,
+        collected: Dict[str, Dict[str, Dict[str, Any]]],
+        city_competitors: Dict[str, List[CompetitorConfig]],
+        tiers: Optional[List[TierRule]] = None,
+    ):
+        self.config = config
+        self.tiers = tiers or DEFAULT_TIERS
+        self.carriers = [c for c in config.competitors.values() if c.enabled]
+
+        # Тарифы: {город: {перевозчик: {поле: цена}}}, для собственной ТК — отдельно
+        self.prices: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self.own_prices: Dict[str, Dict[str, float]] = {}
+        # Наценки конкурентов — только если они есть в файле (лист «Наценки»)
+        markups = config.output_config.markups_sheet
+        for city in config.cities.keys():
+            city_values = {name: cities.get(city, {}) for name, cities in collected.items()}
+            self.prices[city] = {}
+            for competitor in self.carriers:
+                fields = city_values.get(competitor.name, {})
+                self.prices[city][competitor.name] = {
+                    rule.field: marked_up_value(competitor, rule.field, fields[rule.field], markups)
+                    for rule in self.tiers
+                    if is_number(fields.get(rule.field))
+                }
+            if config.own_company.enabled:
+                present = city_competitors.get(city, [])
+                own = {}
+                for rule in self.tiers:
+                    value = own_company_value(
+                        config, average_value(present, city_values, rule.field, markups), rule.field
+                    )
+                    if value is not None:
+                        own[rule.field] = value
+                self.own_prices[city] = own
+
+        # Агрегаты: {(город, индекс тарифа): [отправлений, сумма расчётного веса, сумма веса]}
+        self.buckets: Dict[Tuple[str, int], List[float]] = {}
+
+    def tier_index(self, weight: float, volume: float, chargeable: float) -> int:
+        for idx, rule in enumerate(self.tiers):
+            check_weight = chargeable if rule.per_kg else weight
+            if rule.max_weight is not None and check_weight > rule.max_weight:
+                continue
+            if rule.max_volume is not None and volume > rule.max_volume:
+                continue
+            return idx
+        return len(self.tiers) - 1
+
+    def add_chunk(self, chunk: ShipmentChunk):
+        """Добавить блок отгрузок в агрегаты."""
+        chargeable = array('d', (
+            max(w, v * VOLUMETRIC_KG_PER_M3) for w, v in zip(chunk.weights, chunk.volumes)
+        ))
+        tier_index = self.tier_index
+        tiers = [tier_index(w, v, c) for w, v, c in zip(chunk.weights, chunk.volumes, chargeable)]
+        buckets = self.buckets
+        for city, tier, weight, charge in zip(chunk.cities, tiers, chunk.weights, chargeable):
+            bucket = buckets.get((city, tier))
+            if bucket is None:
+                bucket = buckets[(city, tier)] = [0, 0.0, 0.0]
+            bucket[0] += 1
+            bucket[1] += charge
+            bucket[2] += weight
+
+    def _bucket_cost(self, price: Optional[float], rule: TierRule, bucket: List[float]) -> Optional[float]:
+        if price is None:
+            return None
+        return price * (bucket[1] if rule.per_kg else bucket[0])
+
+    def units(self) -> Dict[Tuple[str, str], float]:
+        """Объём отгрузок по (город, поле) в единицах цены: отправления или кг."""
+        units: Dict[Tuple[str, str], float] = {}
+        for (city, tier), bucket in self.buckets.items():
+            rule = self.tiers[tier]
+            key = (city, rule.field)
+            units[key] = units.get(key, 0.0) + (bucket[1] if rule.per_kg else bucket[0])
+        return units
+
+    def result(self) -> List[CityCosting]:
+        """Итоги по городам (в алфавитном порядке, как в итоговом файле)."""
+        by_city: Dict[str, CityCosting] = {}
+        for (city, tier), bucket in self.buckets.items():
+            rule = self.tiers[tier]
+            row = by_city.setdefault(city, CityCosting(
+                city=city, carriers={c.name: CarrierCost() for c in self.carriers}
+            ))
+            count = int(bucket[0])
+            row.shipments += count
+            row.weight += bucket[2]
+
+            own_cost = self._bucket_cost(self.own_prices.get(city, {}).get(rule.field), rule, bucket)
+            if own_cost is not None:
+                row.own_cost += own_cost
+                row.own_priced += count
+
+            for competitor in self.carriers:
+                price = self.prices[city][competitor.name].get(rule.field)
+                cost = self._bucket_cost(price, rule, bucket)
+                if cost is None or own_cost is None:
+                    continue
+                carrier = row.carriers[competitor.name]
+                carrier.cost += cost
+                carrier.own_cost += own_cost
+                carrier.shipments += count
+        return [by_city[city] for city in sorted(by_city)]
+
+
+def cost_shipments(
+    config: AppConfig,
+    collected: Dict[str, Dict[str, Dict[str, Any]]],
+    city_competitors: Dict[str, List[CompetitorConfig]],
+    csv_path: str,
+    output_path: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    threshold: int = 90,
+) -> CostingResult:
+    """
+    Рассчитать журнал отгрузок и записать итоги по городам в CSV.
+
+    Args:
+        csv_path: CSV отгрузок (город назначения; вес, кг; объём, м³)
+        output_path: CSV итогов (по умолчанию <имя>_costing.csv рядом с журналом)
+        threshold: порог нечёткого совпадения города назначения (%)
+    """
+    started = time.perf_counter()
+    costing = ShipmentCosting(config, collected, city_competitors)
+    result = CostingResult(cities=[], carriers=[c.name for c in costing.carriers])
+    resolver = _CityResolver(config, threshold)
+
+    for chunk in read_shipments(Path(csv_path), resolver, chunk_size, stats=result):
+        costing.add_chunk(chunk)
+
+    result.cities = costing.result()
+    result.units = costing.units()
+    result.elapsed = time.perf_counter() - started
+
+    output = Path(output_path) if output_path else costing_csv_path(csv_path)
+    write_costing_csv(result, output, config.own_company.name)
+
+    logger.info(
+        f"Расчёт отгрузок: строк {result.total_rows}, городов {len(result.cities)}, "
+        f"некорректных {result.invalid_rows}, без города {result.unmatched_rows} "
+        f"за {result.elapsed:.2f} с ({output})"
+    )
+    if result.unmatched:
+        top = sorted(result.unmatched.items(), key=lambda kv: -kv[1])[:5]
+        logger.warning("Не найдены города назначения: " + ", ".join(f"'{d}' ({n})" for d, n in top))
+    return result
+
+
+def costing_csv_path(csv_path: str) -> Path:
+    """Путь к CSV итогов для журнала отгрузок."""
+    path = Path(csv_path)
+    return path.with_name(f"{path.stem}_costing.csv")
+
+
+def write_costing_csv(result: CostingResult, path: Path, own_name: str):
+    """CSV для Excel: разделитель «;», UTF-8 с BOM; экономия = перевозчик − собственная ТК."""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        header = ["Город", "Отправлений", "Вес, кг", f"{own_name}: стоимость"]
+        for carrier in result.carriers:
+            header += [f"{carrier}: стоимость", f"{carrier}: экономия"]
+        writer.writerow(header)
+
+        totals = CityCosting(city="Итого", carriers={c: CarrierCost() for c in result.carriers})
+        for row in result.cities + [totals]:
+            if row is not totals:
+                totals.shipments += row.shipments
+                totals.weight += row.weight
+                totals.own_cost += row.own_cost
+                for carrier, cost in row.carriers.items():
+                    total = totals.carriers[carrier]
+                    total.cost += cost.cost
+                    total.own_cost += cost.own_cost
+                    total.shipments += cost.shipments
+            line = [row.city, row.shipments, round(row.weight, 2), round(row.own_cost, 2)]
+            for carrier in result.carriers:
+                cost = row.carriers[carrier]
+                if cost.shipments:
+                    line += [round(cost.cost, 2), round(cost.savings, 2)]
+                else:
+                    line += ["", ""]
+            writer.writerow(line)
@@ -0,0 +1,114 @@
+"""
+Виды доставки (авто, авиа, ЖД) как отдельное измерение собранных данных.
+
+Перевозчики указывают один город несколько раз — по строке на вид доставки.
+У конкурента с колонкой вида доставки (mode_column) все строки города, прошедшие
+сопоставление и условия, разбираются за тот же проход: вид берётся из колонки
+строки, для каждой пары (город, вид) сохраняется первая строка.
+
+Данные по видам имеют форму {вид: {конкурент: {город: {поле: значение}}}} —
+для каждого вида та же структура, что у основных собранных данных.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.models import AppConfig, CompetitorConfig
+from src.pricing import average_value
+
+# {вид: {конкурент: {город: {поле: значение}}}}
+ModeData = Dict[str, Dict[str, Dict[str, Dict[str, Any]]]]
+
+
+class ModeResolver:
+    """Вид доставки по значению ячейки с учётом настроенных написаний."""
+
+    def __init__(self, delivery_modes: Dict[str, List[str]]):
+        self.modes = list(delivery_modes.keys())
+        self._spellings: Dict[str, str] = {}
+        for mode, spellings in delivery_modes.items():
+            for text in [mode] + list(spellings):
+                key = str(text).strip().casefold()
+                if key:
+                    self._spellings.setdefault(key, mode)
+        self._cache: Dict[Any, Optional[str]] = {}
+
+    def resolve(self, value: Any) -> Optional[str]:
+        """
+        Вид доставки для значения ячейки (None — пустая ячейка).
+
+        Сначала точное совпадение с написанием, затем написание внутри текста
+        («Авто (сборный груз)»). Ненастроенные значения становятся видом как есть.
+        """
+        if value in self._cache:
+            return self._cache[value]
+        text = "" if value is None else str(value).strip()
+        key = text.casefold()
+        mode = self._spellings.get(key) if key else None
+        if key and mode is None:
+            mode = next((m for s, m in self._spellings.items() if s in key), text)
+        self._cache[value] = mode or None
+        return mode or None
+
+    def ordered(self, modes: Iterable[str]) -> List[str]:
+        """Виды в порядке настройки, ненастроенные — следом по алфавиту."""
+        known = set(self.modes)
+        found = set(modes)
+        return [m for m in self.modes if m in found] + sorted(found - known)
+
+
+def merge_mode_data(target: ModeData, source: ModeData):
+    """Добавить данные по видам (например, из воркера) в target."""
+    for mode, competitors in source.items():
+        by_competitor = target.setdefault(mode, {})
+        for name, cities in competitors.items():
+            by_competitor.setdefault(name, {}).update(cities)
+
+
+def mode_presence(
+    config: AppConfig,
+    mode_data: ModeData,
+    competitors: List[CompetitorConfig],
+) -> Dict[str, Dict[str, List[CompetitorConfig]]]:
+    """
+    Конкуренты с хотя бы одним значением для пары (город, вид).
+
+    Returns:
+        {город: {вид: [конкурент, ...]}} — города в порядке конфигурации,
+        виды в порядке ModeResolver.ordered
+    """
+    resolver = ModeResolver(config.delivery_modes)
+    presence: Dict[str, Dict[str, List[CompetitorConfig]]] = {}
+    for city in config.cities.keys():
+        by_mode: Dict[str, List[CompetitorConfig]] = {}
+        for mode in resolver.ordered(mode_data.keys()):
+            present = [
+                c for c in competitors
+                if any(v is not None for v in mode_data[mode].get(c.name, {}).get(city, {}).values())
+            ]
+            if present:
+                by_mode[mode] = present
+        if by_mode:
+            presence[city] = by_mode
+    return presence
+
+
+def mode_averages(
+    config: AppConfig,
+    mode_data: ModeData,
+    competitors: List[CompetitorConfig],
+    fields: List[str],
+) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+    """
+    Среднее по конкурентам для каждой пары (город, вид) — как строка «Среднее значение».
+
+    Returns:
+        {город: {вид: {поле: среднее или None}}}
+    """
+    averages: Dict[str, Dict[str, Dict[str, Optional[float]]]] = {}
+    markups = config.output_config.markups_sheet
+    for city, by_mode in mode_presence(config, mode_data, competitors).items():
+        for mode, present in by_mode.items():
+            city_values = {c.name: mode_data[mode][c.name][city] for c in present}
+            averages.setdefault(city, {})[mode] = {
+                field: average_value(present, city_values, field, markups) for field in fields
+            }
+    return averages
@@ -0,0 +1,126 @@
+"""
+Сравнение собранных цен с предыдущим запуском.
+
+Снимок значений запуска хранится рядом с выходным файлом (<output>.snapshot.json);
+изменения выводятся на лист «Изменения» и в CSV.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+import csv
+import json
+import logging
+
+from src.pricing import is_number
+
+logger = logging.getLogger(__name__)
+
+# (город, конкурент, поле) -> значение
+FlatValues = Dict[Tuple[str, str, str], Any]
+
+
+@dataclass
+class PriceChange:
+    """Изменение одного значения между запусками."""
+    city: str
+    competitor: str
+    field: str
+    old: Any
+    new: Any
+    percent: Optional[float]  # None, если процент не определён (нечисло, появилось/пропало, было 0)
+
+    def sort_key(self) -> Tuple[int, float]:
+        # Сначала изменения с процентом по убыванию модуля, затем остальные
+        if self.percent is None:
+            return (1, 0.0)
+        return (0, -abs(self.percent))
+
+
+def snapshot_path(output_file: str) -> Path:
+    """Путь к снимку значений для выходного файла."""
+    return Path(output_file).with_suffix('.snapshot.json')
+
+
+def changes_csv_path(output_file: str) -> Path:
+    """Путь к CSV с изменениями для выходного файла."""
+    path = Path(output_file)
+    return path.with_name(f"{path.stem}_changes.csv")
+
+
+def _plain(value: Any) -> Any:
+    """Значение, которое сохраняется в JSON как есть: даты и прочие типы ячеек — строкой."""
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def flatten(collected: Dict[str, Dict[str, Dict[str, Any]]]) -> FlatValues:
+    """
+    {конкурент: {город: {поле: значение}}} -> {(город, конкурент, поле): значение}.
+
+    Даты и другие значения не из JSON приводятся к строке — так же, как их прочитает
+    следующий запуск из снимка.
+    """
+    return {
+        (city, competitor, field): _plain(value)
+        for competitor, cities in collected.items()
+        for city, fields in cities.items()
+        for field, value in fields.items()
+        if value is not None
+    }
+
+
+def load_snapshot(path: Path) -> Optional[FlatValues]:
+    """Загрузить снимок предыдущего запуска (None, если его нет или он повреждён)."""
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {(city, comp, field): value for city, comp, field, value in data['values']}
+    except Exception as e:
+        logger.warning(f"Не удалось прочитать снимок {path}: {e}")
+        return None
+
+
+def save_snapshot(values: FlatValues, path: Path):
+    """Сохранить снимок значений запуска."""
+    data = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'values': [[city, comp, field, value] for (city, comp, field), value in values.items()],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def compute_changes(previous: FlatValues, current: FlatValues) -> List[PriceChange]:
+    """Один проход по объединению ключей; результат отсортирован по модулю изменения."""
+    changes = []
+    for key in previous.keys() | current.keys():
+        old = previous.get(key)
+        new = current.get(key)
+        if old == new:
+            continue
+        percent = None
+        if is_number(old) and is_number(new) and old != 0:
+            percent = (new - old) / abs(old) * 100
+        changes.append(PriceChange(*key, old=old, new=new, percent=percent))
+    changes.sort(key=PriceChange.sort_key)
+    return changes
+
+
+def write_changes_csv(changes: List[PriceChange], path: Path, field_names: Dict[str, str]):
+    """CSV для Excel: разделитель «;», UTF-8 с BOM."""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(["Город", "Конкурент", "Поле", "Было", "Стало", "Изменение, %"])
+        for change in changes:
+            writer.writerow([
+                change.city,
+                change.competitor,
+                field_names.get(change.field, change.field),
+                "" if change.old is None else change.old,
+                "" if change.new is None else change.new,
+                "" if change.percent is None else round(change.percent, 2),
+            ])
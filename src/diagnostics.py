@@ -0,0 +1,97 @@
+"""
+Диагностика сопоставления городов: лучшие кандидаты для каждой пары город/конкурент.
+
+Собирается в том же пакетном проходе, что и поиск строки города, поэтому не
+требует повторного чтения файлов или запуска с отладочным журналом.
+"""
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+import json
+
+STATUS_FOUND = "found"
+STATUS_NOT_FOUND = "not_found"
+STATUS_REJECTED = "rejected"  # Совпадения были, но строки отклонены спецусловиями
+
+STATUS_NAMES = {
+    STATUS_FOUND: "Найден",
+    STATUS_NOT_FOUND: "Не найден",
+    STATUS_REJECTED: "Отклонён спецусловием",
+}
+
+
+@dataclass
+class MatchCandidate:
+    """Метка источника — кандидат на город."""
+    row: int
+    label: str
+    score: int      # WRatio, %
+    variant: str    # Вариант названия (основное или псевдоним) с лучшей оценкой
+
+
+@dataclass
+class CityMatch:
+    """Метка источника, принятая как строка города."""
+    competitor: str
+    city: str
+    label: str
+    variant: str    # Вариант названия, давший совпадение
+    score: int
+
+
+@dataclass
+class CityDiagnostics:
+    """Итог сопоставления города у конкурента."""
+    competitor: str
+    city: str
+    threshold: int
+    matched_row: Optional[int] = None
+    matched_label: Optional[str] = None
+    matched_variant: Optional[str] = None
+    matched_score: Optional[int] = None
+    candidates: List[MatchCandidate] = field(default_factory=list)  # Лучшие по оценке
+    rejected_rows: List[int] = field(default_factory=list)          # Выше порога, но отклонены
+
+    @property
+    def status(self) -> str:
+        if self.matched_row is not None:
+            return STATUS_FOUND
+        return STATUS_REJECTED if self.rejected_rows else STATUS_NOT_FOUND
+
+    def match(self) -> Optional[CityMatch]:
+        """Принятая метка (None, если город не найден)."""
+        if self.matched_row is None:
+            return None
+        return CityMatch(
+            competitor=self.competitor, city=self.city, label=self.matched_label or "",
+            variant=self.matched_variant or "", score=self.matched_score or 0,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['status'] = self.status
+        return data
+
+
+def diagnostics_json_path(output_file: str) -> Path:
+    """Путь к JSON с диагностикой для выходного файла."""
+    path = Path(output_file)
+    return path.with_name(f"{path.stem}_diagnostics.json")
+
+
+def sort_diagnostics(items: List[CityDiagnostics]) -> List[CityDiagnostics]:
+    """Сначала ненайденные, затем по городу и конкуренту."""
+    order = {STATUS_NOT_FOUND: 0, STATUS_REJECTED: 1, STATUS_FOUND: 2}
+    return sorted(items, key=lambda d: (order[d.status], d.city, d.competitor))
+
+
+def write_diagnostics_json(items: List[CityDiagnostics], path: Path, top_k: int):
+    """Записать диагностику сопоставления в JSON."""
+    data = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'top_k': top_k,
+        'items': [item.to_dict() for item in sort_diagnostics(items)],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
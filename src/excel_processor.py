@@ -2,16 +2,45 @@
 Модуль для работы с Excel файлами.
 """
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple, Callable
 import openpyxl
 from openpyxl.workbook import Workbook
 from openpyxl.worksheet.worksheet import Worksheet
 from thefuzz import fuzz
+import heapq
 import logging
 from openpyxl.utils import get_column_letter
 
 from src.models import CompetitorConfig, AppConfig
+from src.alias_learning import AliasSuggestion, stale_aliases, suggest_aliases
+from src.city_lookup import CityLookup, LabelIndex, LookupHit
+from src.column_detector import ColumnDetection, detect_columns
+from src.conditions import CompiledConditions
+from src.costing import CostingResult, cost_shipments
+from src.delivery_modes import ModeData, ModeResolver, mode_averages, mode_presence
+from src.delta_report import (
+    FlatValues, flatten, load_snapshot, save_snapshot, compute_changes,
+    snapshot_path, changes_csv_path, write_changes_csv,
+)
+from src.diagnostics import (
+    CityDiagnostics, CityMatch, MatchCandidate, diagnostics_json_path, write_diagnostics_json,
+)
+from src.formula_eval import FormulaEvaluator, FormulaError
+from src.history import PriceHistoryStore, resolve_db_path
+from src.mapped_io import MappedFiles
+from src.matching import (
+    PREFILTER_MIN_LABELS, PREFILTER_MIN_QUERIES, PREFILTER_MIN_THRESHOLD,
+    TrigramIndex, prepare, wratio_scores,
+)
+from src.normalization import PriceNormalizer, NormalizationIssue
+from src.parallel_collect import collect_parallel
 from src.output_generator import OutputFileGenerator
+from src.preview import PREVIEW_FIELDS, PreviewReader, preview_columns
+from src.profiling import RunProfiler
+from src.scenarios import ScenarioEngine
+from src.sheet_rows import SheetRows, read_sheet_rows
+from src.target_solver import PositionGoal, SolverResult, solve_markups
+from src.translit import name_keys
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +52,27 @@ class ExcelProcessor:
         self.config = config
         self.template_wb: Optional[Workbook] = None
         self.template_sheet: Optional[Worksheet] = None
-        self.generator = OutputFileGenerator(config)
+        self.profiler = RunProfiler(
+            enabled=config.profiling.enabled,
+            cprofile=config.profiling.cprofile,
+            memory=config.profiling.memory,
+        )
+        self.generator = OutputFileGenerator(config, profiler=self.profiler)
+        self.normalizer = PriceNormalizer()
+        # Файлы конкурентов, отображённые в память на время запуска
+        self.mapped_files = MappedFiles()
+        self.normalization_issues: List[NormalizationIssue] = []
+        # Лучшие кандидаты сопоставления городов за последний сбор
+        self.match_diagnostics: List[CityDiagnostics] = []
+        # Данные по видам доставки: {вид: {конкурент: {город: {поле: значение}}}}
+        self.collected_modes: ModeData = {}
+        # Индексы меток колонки города для поиска города по всем конкурентам
+        self.city_lookup = CityLookup()
+        # Данные последнего запуска: {конкурент: {город: {поле: значение}}} и конкуренты в городах
+        self.collected: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.city_competitors: Dict[str, List[CompetitorConfig]] = {}
+        # Объём последнего журнала отгрузок {(город, поле): единиц} — для выручки в сценариях
+        self.shipment_units: Dict[Tuple[str, str], float] = {}
 
     def load_template(self) -> bool:
         """Загрузить шаблон файла."""
@@ -47,89 +96,348 @@ class ExcelProcessor:
         Returns:
             Словарь: {city_name: {field: value}} для городов, где найдены данные
         """
-        city_data: Dict[str, Dict[str, Any]] = {}
+        return self.collect_file_group([competitor]).get(competitor.name, {})
 
-        if not competitor.file_path or not Path(competitor.file_path).exists():
-            logger.warning(f"Файл не найден: {competitor.file_path}")
-            return city_data
+    def file_groups(
+        self,
+        competitors: List[CompetitorConfig],
+        files: Optional[MappedFiles] = None
+    ) -> List[List[CompetitorConfig]]:
+        """
+        Сгруппировать конкурентов по отпечатку файла (порядок первых вхождений сохраняется).
 
-        try:
-            wb = openpyxl.load_workbook(competitor.file_path)
-            sheet = wb.worksheets[0]
+        Несколько направлений одного перевозчика в одной книге дают одну группу,
+        и файл группы читается один раз. Недоступные файлы не группируются.
+        files — отображения, в которых считаются отпечатки (по умолчанию — файлы запуска).
+        """
+        files = files or self.mapped_files
+        groups: Dict[str, List[CompetitorConfig]] = {}
+        for index, competitor in enumerate(competitors):
+            key = ""
+            if competitor.file_path and Path(competitor.file_path).exists():
+                key = files.fingerprint(competitor.file_path)
+            groups.setdefault(key or f"#{index}", []).append(competitor)
+        return list(groups.values())
+
+    def collect_all(
+        self,
+        competitors: List[CompetitorConfig],
+        progress_callback=None
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Собрать данные конкурентов последовательно, по одному чтению на файл.
 
-            for city_name in self.config.cities.keys():
-                row_data = self._find_city_row_data(sheet, city_name, competitor)
-                if row_data is not None:
-                    city_data[city_name] = row_data
+        Returns:
+            {конкурент: {город: {поле: значение}}}
+        """
+        collected: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for group in self.file_groups(competitors):
+            if progress_callback:
+                for competitor in group:
+                    progress_callback(competitor.name, False)
+            with self.profiler.span('collect', ", ".join(c.name for c in group)):
+                collected.update(self.collect_file_group(group))
+            if progress_callback:
+                for competitor in group:
+                    progress_callback(competitor.name, True)
+        # Порядок как у конкурентов в конфигурации
+        return {c.name: collected.get(c.name, {}) for c in competitors}
 
-            wb.close()
-            logger.info(
-                f"{competitor.name}: найдено городов {len(city_data)} "
-                f"из {len(self.config.cities)}"
-            )
+    def collect_file_group(
+        self,
+        competitors: List[CompetitorConfig]
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        Собрать данные конкурентов с общим файлом за один проход по листу.
+
+        Читаются сохранённые значения ячеек (data_only). Формулы без сохранённого
+        результата вычисляются встроенным вычислителем, если это включено;
+        книга с формулами тоже загружается не более одного раза на группу.
+
+        Returns:
+            {конкурент: {город: {поле: значение}}}
+        """
+        collected: Dict[str, Dict[str, Dict[str, Any]]] = {c.name: {} for c in competitors}
+        file_path = competitors[0].file_path
+        names = ", ".join(c.name for c in competitors)
+
+        if not file_path or not Path(file_path).exists():
+            logger.warning(f"Файл не найден: {file_path}")
+            return collected
+
+        try:
+            with self.profiler.span('load_workbook', names):
+                sheet = read_sheet_rows(self.mapped_files.reader(file_path))
         except Exception as e:
-            logger.error(f"Ошибка сбора данных {competitor.name}: {e}")
+            logger.error(f"Ошибка сбора данных {names}: {e}")
+            return collected
+        if len(competitors) > 1:
+            logger.info(f"Файл {Path(file_path).name} прочитан один раз для: {names}")
+
+        formula_books: List[Workbook] = []
+
+        def formula_book() -> Workbook:
+            if not formula_books:
+                formula_books.append(openpyxl.load_workbook(self.mapped_files.reader(file_path)))
+            return formula_books[0]
+
+        try:
+            for competitor in competitors:
+                try:
+                    collected[competitor.name] = self._extract_competitor(
+                        sheet, competitor, formula_book
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка сбора данных {competitor.name}: {e}")
+        finally:
+            for book in formula_books:
+                book.close()
+
+        return collected
+
+    def _extract_competitor(
+        self,
+        sheet: SheetRows,
+        competitor: CompetitorConfig,
+        formula_book: Callable[[], Workbook]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Извлечь данные одного конкурента из прочитанного листа."""
+        city_data: Dict[str, Dict[str, Any]] = {}
 
+        # Строка источника для каждого найденного города
+        source_rows: Dict[str, int] = {}
+        # Строки видов доставки: {(город, вид): строка} — из тех же найденных строк
+        mode_data: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        mode_rows: Dict[Tuple[str, str], int] = {}
+        modes = ModeResolver(self.config.delivery_modes) if competitor.mode_column else None
+        index: Optional[TrigramIndex] = None
+        if self._use_prefilter(sheet, competitor):
+            with self.profiler.span('trigram_index', competitor.name):
+                index = sheet.trigram_index(competitor.source_columns.city)
+        with self.profiler.span('match', competitor.name):
+            conditions = CompiledConditions(competitor.special_conditions)
+            for city_name in self.config.cities.keys():
+                rows = self._find_city_rows(
+                    sheet, city_name, competitor, conditions,
+                    all_rows=modes is not None, index=index
+                )
+                if not rows:
+                    continue
+                source_rows[city_name] = rows[0]
+                city_data[city_name] = self._read_row_fields(sheet, rows[0], competitor)
+                if modes is None:
+                    continue
+                for row_idx in rows:
+                    mode = modes.resolve(sheet.value(competitor.mode_column, row_idx))
+                    if mode is not None and (city_name, mode) not in mode_rows:
+                        mode_rows[(city_name, mode)] = row_idx
+                        mode_data[(city_name, mode)] = self._read_row_fields(sheet, row_idx, competitor)
+
+        # Лист уже прочитан — индекс меток для поиска города почти бесплатен
+        with self.profiler.span('label_index', competitor.name):
+            self.city_lookup.store(LabelIndex.build(sheet, competitor, self._field_cells))
+
+        if competitor.evaluate_formulas:
+            with self.profiler.span('formulas', competitor.name):
+                self._resolve_formulas(competitor, formula_book, sheet.title, city_data, source_rows)
+                if mode_rows:
+                    self._resolve_formulas(competitor, formula_book, sheet.title, mode_data, mode_rows)
+
+        for (city_name, mode), fields in mode_data.items():
+            self.collected_modes.setdefault(mode, {}).setdefault(competitor.name, {})[city_name] = fields
+
+        logger.info(
+            f"{competitor.name}: найдено городов {len(city_data)} "
+            f"из {len(self.config.cities)}"
+            + (f", пар город/вид доставки {len(mode_data)}" if modes is not None else "")
+        )
         return city_data
 
-    def _find_city_row_data(
+    def _field_cells(self, competitor: CompetitorConfig, row_idx: int) -> List[Tuple[str, str, int]]:
+        """Ячейки полей для строки города: [(поле, колонка, строка)]."""
+        offsets = competitor.row_offsets
+        src_cols = competitor.source_columns
+        return [
+            ('convert',     src_cols.convert,     row_idx + offsets.row_2),
+            ('minimum_1',   src_cols.minimum_1,   row_idx + offsets.row_3),
+            ('minimum_2',   src_cols.minimum_2,   row_idx + offsets.row_4),
+            ('volume',      src_cols.volume,      row_idx + offsets.row_5),
+            ('weight_100',  src_cols.weight_100,  row_idx + offsets.row_6),
+            ('weight_3000', src_cols.weight_3000, row_idx + offsets.row_7),
+        ]
+
+    def _read_row_fields(
         self,
-        source_sheet: Worksheet,
-        city_name: str,
+        sheet: SheetRows,
+        row_idx: int,
         competitor: CompetitorConfig
-    ) -> Optional[Dict[str, Any]]:
+    ) -> Dict[str, Any]:
+        """Собрать значения полей для найденной строки города."""
+        return {
+            field: sheet.value(col, row)
+            for field, col, row in self._field_cells(competitor, row_idx)
+        }
+
+    def _use_prefilter(self, sheet: SheetRows, competitor: CompetitorConfig) -> bool:
+        """Искать город через индекс триграмм: много меток, много запросов и точный порог."""
+        queries = sum(len(self.config.get_city_names(city)) for city in self.config.cities)
+        return (
+            competitor.fuzzy_match_threshold >= PREFILTER_MIN_THRESHOLD
+            and queries >= PREFILTER_MIN_QUERIES
+            and len(sheet.labels(competitor.source_columns.city)) >= PREFILTER_MIN_LABELS
+        )
+
+    def _find_city_rows(
+        self,
+        sheet: SheetRows,
+        city_name: str,
+        competitor: CompetitorConfig,
+        conditions: CompiledConditions,
+        all_rows: bool = False,
+        index: Optional[TrigramIndex] = None
+    ) -> List[int]:
         """
-        Найти строку города и вернуть данные как словарь полей.
-        Возвращает None если город не найден.
+        Найти строки города (по названию и псевдонимам).
+
+        Метки, чей канонический ключ совпадает с ключом варианта названия (в том
+        числе в другой письменности), находятся поиском в словаре с оценкой 100.
+        Остальные метки оцениваются пакетно (оценки те же, что у fuzz.WRatio) — по
+        проходу на каждый вариант, включая отличающиеся только письменностью: оценки
+        WRatio у них разные; с индексом триграмм — только отобранные им кандидаты.
+        Если найденная по ключу строка проходит условия, оцениваются только метки
+        выше неё: строка города та же, что при полном переборе, а для строки в начале
+        листа нечёткий проход не нужен вовсе.
+
+        Строки не ниже порога, прошедшие условия конкурента (проверяются на кортеже
+        значений той же строки), возвращаются по порядку. Первая из них — строка
+        города; без all_rows поиск на ней и останавливается. При включённой
+        диагностике запоминаются лучшие кандидаты.
         """
         city_col = competitor.source_columns.city
         threshold = competitor.fuzzy_match_threshold
         search_names = self.config.get_city_names(city_name)
-
-        for row_idx in range(1, source_sheet.max_row + 1):
-            cell_value = source_sheet[f"{city_col}{row_idx}"].value
-            if not cell_value:
+        output_cfg = self.config.output_config
+        top_k = output_cfg.diagnostics_top_k if output_cfg.match_diagnostics else 0
+
+        labels = sheet.labels(city_col)
+        prepared = sheet.prepared(city_col)
+        # Лучшая оценка метки по всем вариантам: {номер метки: (оценка, вариант)}
+        best: Dict[int, Tuple[int, str]] = {}
+        # Транслитерации и известные другие названия — одна проверка по словарю ключей
+        label_keys = sheet.label_keys(city_col)
+        for key, variant in name_keys(search_names).items():
+            for i in label_keys.get(key, ()):
+                best[i] = (100, variant)
+        # Первая найденная по ключу строка, прошедшая условия: метки ниже неё строку
+        # города не изменят. all_rows собирает все строки города, а диагностика —
+        # лучших кандидатов по всему листу, поэтому им нужен полный проход
+        limit: Optional[int] = None
+        if not all_rows and not top_k:
+            limit = next((
+                i for i in sorted(best)
+                if not conditions or conditions.matches(sheet.rows[labels[i][0] - 1], city_name)
+            ), None)
+        # Варианты, совпадающие после подготовки, дают те же оценки — по проходу на запрос
+        queries: Dict[str, str] = {}
+        if limit != 0:
+            for search_name in search_names:
+                queries.setdefault(prepare(search_name.lower()), search_name)
+        for query, search_name in queries.items():
+            # С индексом совпадения не ниже порога те же, что при переборе;
+            # кандидаты диагностики — лучшие среди прошедших префильтр
+            if index is not None:
+                scored = index.scores(query, threshold, all_candidates=bool(top_k))
+                if limit is not None:
+                    scored = [(i, score) for i, score in scored if i < limit]
+            else:
+                choices = prepared if limit is None else prepared[:limit]
+                scored = wratio_scores(query, choices, 0 if top_k else threshold)
+            for i, score in scored:
+                if i not in best or score > best[i][0]:
+                    best[i] = (score, search_name)
+
+        diagnostics = CityDiagnostics(competitor=competitor.name, city=city_name, threshold=threshold)
+        if top_k:
+            top = heapq.nlargest(top_k, best.items(), key=lambda item: (item[1][0], -item[0]))
+            diagnostics.candidates = [
+                MatchCandidate(row=labels[i][0], label=str(labels[i][1]), score=score, variant=variant)
+                for i, (score, variant) in top
+            ]
+        # Найденные строки нужны и без листа диагностики — для обучения псевдонимов
+        self.match_diagnostics.append(diagnostics)
+
+        rows: List[int] = []
+        for i in sorted(i for i, (score, _) in best.items() if score >= threshold):
+            row_idx, cell_value = labels[i]
+            if conditions and not conditions.matches(sheet.rows[row_idx - 1], city_name):
+                if not rows:
+                    diagnostics.rejected_rows.append(row_idx)
                 continue
 
-            cell_str = str(cell_value).lower()
-            matched = False
-            for search_name in search_names:
-                similarity = fuzz.WRatio(search_name.lower(), cell_str)
-                if similarity >= threshold:
-                    matched = True
-                    logger.debug(
-                        f"Город '{city_name}' найден как '{cell_value}' "
-                        f"(вариант: '{search_name}', совпадение: {similarity}%)"
-                    )
-                    break
+            if not rows:
+                score, search_name = best[i]
+                logger.debug(
+                    f"Город '{city_name}' найден как '{cell_value}' "
+                    f"(вариант: '{search_name}', совпадение: {score}%)"
+                )
+                diagnostics.matched_row = row_idx
+                diagnostics.matched_label = str(cell_value)
+                diagnostics.matched_variant = search_name
+                diagnostics.matched_score = score
+            rows.append(row_idx)
+            if not all_rows:
+                break
+
+        if not rows:
+            logger.debug(
+                f"Город '{city_name}' не найден для {competitor.name} "
+                f"(варианты: {search_names})"
+            )
+        return rows
 
-            if not matched:
-                continue
+    def _resolve_formulas(
+        self,
+        competitor: CompetitorConfig,
+        formula_book: Callable[[], Workbook],
+        sheet_title: str,
+        city_data: Dict[Any, Dict[str, Any]],
+        source_rows: Dict[Any, int]
+    ):
+        """
+        Вычислить формулы, для которых в файле нет сохранённого результата.
 
-            if not self._check_special_conditions(source_sheet, row_idx, city_name, competitor):
+        Книга с формулами запрашивается только если среди найденных полей есть пустые;
+        каждая ячейка вычисляется один раз. Ключи city_data и source_rows — город
+        или пара (город, вид доставки).
+        """
+        missing = [
+            (city, field, col, row)
+            for city, row_idx in source_rows.items()
+            for field, col, row in self._field_cells(competitor, row_idx)
+            if city_data[city].get(field) is None
+        ]
+        if not missing:
+            return
+
+        formula_wb = formula_book()
+
+        def cell_value(sheet_name: str, col: str, row: int) -> Any:
+            if sheet_name not in formula_wb.sheetnames:
+                raise FormulaError(f"Лист '{sheet_name}' не найден")
+            return formula_wb[sheet_name][f"{col}{row}"].value
+
+        evaluator = FormulaEvaluator(cell_value)
+        evaluated = 0
+        for city, field, col, row in missing:
+            if not isinstance(cell_value(sheet_title, col, row), str):
                 continue
+            value = evaluator.evaluate(sheet_title, col, row)
+            if value is not None:
+                city_data[city][field] = value
+                evaluated += 1
 
-            # Собрать значения полей
-            offsets = competitor.row_offsets
-            src_cols = competitor.source_columns
-            mappings = [
-                (src_cols.convert,    offsets.row_2, 'convert'),
-                (src_cols.minimum_1,  offsets.row_3, 'minimum_1'),
-                (src_cols.minimum_2,  offsets.row_4, 'minimum_2'),
-                (src_cols.volume,     offsets.row_5, 'volume'),
-                (src_cols.weight_100, offsets.row_6, 'weight_100'),
-                (src_cols.weight_3000,offsets.row_7, 'weight_3000'),
-            ]
-            row_data: Dict[str, Any] = {}
-            for src_col, row_offset, field in mappings:
-                row_data[field] = source_sheet[f"{src_col}{row_idx + row_offset}"].value
-            return row_data
-
-        logger.debug(
-            f"Город '{city_name}' не найден для {competitor.name} "
-            f"(варианты: {search_names})"
-        )
-        return None
+        if evaluated:
+            logger.info(f"{competitor.name}: вычислено формул без сохранённого значения: {evaluated}")
 
     def process_competitor(self, competitor: CompetitorConfig) -> Dict[str, Any]:
         """
@@ -193,6 +501,7 @@ class ExcelProcessor:
 
         # Все варианты написания: основное + псевдонимы
         search_names = self.config.get_city_names(city_name)
+        conditions = CompiledConditions(competitor.special_conditions)
 
         for row_idx in range(1, source_sheet.max_row + 1):
             cell_value = source_sheet[f"{city_col}{row_idx}"].value
@@ -217,8 +526,8 @@ class ExcelProcessor:
             if not matched:
                 continue
 
-            if not self._check_special_conditions(
-                source_sheet, row_idx, city_name, competitor
+            if conditions and not conditions.matches(
+                tuple(cell.value for cell in source_sheet[row_idx]), city_name
             ):
                 continue
 
@@ -229,25 +538,6 @@ class ExcelProcessor:
                      f"(варианты: {search_names})")
         return False
 
-    def _check_special_conditions(
-        self,
-        sheet: Worksheet,
-        row_idx: int,
-        city_name: str,
-        competitor: CompetitorConfig
-    ) -> bool:
-        """Проверить специальные условия для конкретного конкурента/города."""
-        if not competitor.special_conditions:
-            return True
-
-        # Пример: для Энергии и Владивостока проверить колонку B
-        if competitor.name == "Энергия" and city_name == "Владивосток":
-            cell_value = sheet[f"B{row_idx}"].value
-            if cell_value != "Авто":
-                return False
-
-        return True
-
     def _copy_row_data(
         self,
         source_sheet: Worksheet,
@@ -315,6 +605,15 @@ class ExcelProcessor:
         Returns:
             Список результатов обработки
         """
+        self.profiler.begin_run()
+        try:
+            return self._process_all(progress_callback)
+        finally:
+            # И при исключении: отображения закрываются, cProfile не остаётся включённым
+            self._finish_run()
+
+    def _process_all(self, progress_callback=None) -> List[Dict[str, Any]]:
+        """Этапы process_all (замеры и освобождение файлов — в process_all)."""
         results = []
 
         enabled_competitors = [
@@ -324,57 +623,375 @@ class ExcelProcessor:
 
         # ШАГ 1 — собрать данные всех конкурентов в память
         # collected: {competitor_name: {city_name: {field: value}}}
-        collected: Dict[str, Dict[str, Dict[str, Any]]] = {}
-        for competitor in enabled_competitors:
-            if progress_callback:
-                progress_callback(competitor.name, False)
-            collected[competitor.name] = self.collect_competitor_data(competitor)
-            if progress_callback:
-                progress_callback(competitor.name, True)
+        collected: Optional[Dict[str, Dict[str, Dict[str, Any]]]] = None
+        self.match_diagnostics = []
+        self.collected_modes = {}
+        workers = min(self.config.processing.workers, len(enabled_competitors))
+        if workers > 1:
+            # Воркеры пишут числа в общую память, в родителя приходит только побочный канал
+            with self.profiler.span('collect'):
+                try:
+                    collected, self.match_diagnostics, self.collected_modes = collect_parallel(
+                        self.config, self.file_groups(enabled_competitors), workers,
+                        progress_callback, profiler=self.profiler, city_lookup=self.city_lookup
+                    )
+                    logger.info(f"Данные конкурентов собраны в {workers} процессах")
+                except Exception as e:
+                    logger.warning(f"Параллельный сбор не удался ({e}), сбор последовательно")
+
+        if collected is None:
+            # Конкуренты с общим файлом собираются за одно чтение
+            collected = self.collect_all(enabled_competitors, progress_callback)
+
+        # Разобрать строковые цены («1 200 р.», «от 350») в числа
+        with self.profiler.span('normalize'):
+            collected, self.normalization_issues = self.normalizer.normalize_collected(
+                collected, enabled_competitors
+            )
+            # Данные каждого вида доставки — той же формы, что collected
+            for mode, mode_collected in self.collected_modes.items():
+                self.collected_modes[mode], _ = self.normalizer.normalize_collected(
+                    mode_collected, enabled_competitors
+                )
+
+        self.collected = collected
+
+        # Дописать собранные значения в историю цен
+        if self.config.history.enabled:
+            with self.profiler.span('history'):
+                self._record_history(enabled_competitors, collected)
 
         # ШАГ 2 — построить карту присутствия {city: [competitor, ...]}
         # конкурент включается в город только если у него есть хотя бы одно значение
         city_competitors: Dict[str, List[CompetitorConfig]] = {}
-        for city in self.config.cities.keys():
-            city_competitors[city] = []
-            for competitor in enabled_competitors:
-                city_data = collected.get(competitor.name, {}).get(city)
-                if city_data and any(v is not None for v in city_data.values()):
-                    city_competitors[city].append(competitor)
+        with self.profiler.span('presence'):
+            for city in self.config.cities.keys():
+                city_competitors[city] = []
+                for competitor in enabled_competitors:
+                    city_data = collected.get(competitor.name, {}).get(city)
+                    if city_data and any(v is not None for v in city_data.values()):
+                        city_competitors[city].append(competitor)
+        self.city_competitors = city_competitors
 
         # ШАГ 3 — генерировать структуру Excel с учётом присутствия
-        if not self.generator.generate(city_competitors=city_competitors):
+        with self.profiler.span('generate'):
+            generated = self.generator.generate(city_competitors=city_competitors)
+        if not generated:
             logger.error("Не удалось создать выходной файл")
             return results
 
         self.template_wb = self.generator.wb
         self.template_sheet = self.generator.ws
 
-        self.generator.add_markups_sheet()
+        with self.profiler.span('markups_sheet'):
+            self.generator.add_markups_sheet()
 
         # ШАГ 4 — записать данные в ячейки
+        issues_by_competitor: Dict[str, List[NormalizationIssue]] = {}
+        for issue in self.normalization_issues:
+            issues_by_competitor.setdefault(issue.competitor, []).append(issue)
+
         for competitor in enabled_competitors:
-            for city, fields in collected.get(competitor.name, {}).items():
-                # Пропускаем город, если конкурент туда не включён
-                if competitor not in city_competitors.get(city, []):
-                    continue
-                for field, value in fields.items():
-                    self.generator.write_competitor_data(competitor, city, field, value)
+            with self.profiler.span('write_data', competitor.name):
+                for city, fields in collected.get(competitor.name, {}).items():
+                    # Пропускаем город, если конкурент туда не включён
+                    if competitor not in city_competitors.get(city, []):
+                        continue
+                    for field, value in fields.items():
+                        self.generator.write_competitor_data(competitor, city, field, value)
+
+            issues = issues_by_competitor.get(competitor.name, [])
+            for issue in issues:
+                self.generator.mark_unparsed(competitor, issue.city, issue.field)
 
             result = {
                 'success': True,
                 'competitor': competitor.name,
                 'processed_cities': len(collected.get(competitor.name, {})),
-                'errors': []
+                'errors': [],
+                'unparsed_values': len(issues),
             }
             results.append(result)
 
-        # ШАГ 5 — сохранить файл
-        if self.generator.save():
+        # Строка собственной ТК: среднее с наценкой собственной ТК
+        with self.profiler.span('own_company'):
+            self.generator.fill_own_company(city_competitors)
+
+        # ШАГ 5 — изменения относительно прошлого запуска
+        current_values: Optional[FlatValues] = None
+        if self.config.output_config.changes_report:
+            with self.profiler.span('changes'):
+                current_values = self._report_changes(collected)
+
+        # Лучшие кандидаты сопоставления городов — лист «Диагностика» и JSON
+        if self.config.output_config.match_diagnostics:
+            with self.profiler.span('diagnostics'):
+                self._report_diagnostics()
+
+        # Строки по видам доставки и средние для каждой пары город/вид
+        if self.collected_modes:
+            with self.profiler.span('delivery_modes'):
+                self._report_modes(enabled_competitors)
+
+        # ШАГ 6 — сохранить файл
+        with self.profiler.span('save'):
+            saved = self.generator.save()
+        if saved:
             logger.info("Обработка завершена успешно")
+            # Снимок обновляется только после успешного сохранения результата
+            if current_values is not None:
+                try:
+                    save_snapshot(current_values, snapshot_path(self.config.output_file))
+                except Exception as e:
+                    logger.error(f"Ошибка сохранения снимка значений: {e}")
 
         return results
 
+    def _report_changes(self, collected: Dict[str, Dict[str, Dict[str, Any]]]) -> FlatValues:
+        """
+        Сравнить собранные значения со снимком прошлого запуска,
+        добавить лист «Изменения» и записать CSV.
+
+        Returns:
+            Значения текущего запуска для нового снимка
+        """
+        current = flatten(collected)
+        previous = load_snapshot(snapshot_path(self.config.output_file))
+        if previous is None:
+            logger.info("Снимок прошлого запуска не найден — отчёт об изменениях пропущен")
+            return current
+
+        changes = compute_changes(previous, current)
+        self.generator.add_changes_sheet(changes)
+        csv_path = changes_csv_path(self.config.output_file)
+        try:
+            write_changes_csv(changes, csv_path, self.generator.FIELD_NAMES)
+        except Exception as e:
+            logger.error(f"Ошибка записи CSV изменений: {e}")
+        logger.info(f"Изменений цен с прошлого запуска: {len(changes)} ({csv_path})")
+        return current
+
+    def _report_diagnostics(self):
+        """Добавить лист «Диагностика» и записать JSON с кандидатами сопоставления."""
+        top_k = self.config.output_config.diagnostics_top_k
+        self.generator.add_diagnostics_sheet(self.match_diagnostics, top_k)
+        json_path = diagnostics_json_path(self.config.output_file)
+        try:
+            write_diagnostics_json(self.match_diagnostics, json_path, top_k)
+        except Exception as e:
+            logger.error(f"Ошибка записи JSON диагностики: {e}")
+        missed = sum(1 for d in self.match_diagnostics if d.matched_row is None)
+        logger.info(
+            f"Диагностика сопоставления: пар город/конкурент {len(self.match_diagnostics)}, "
+            f"не найдено {missed} ({json_path})"
+        )
+
+    def _report_modes(self, competitors: List[CompetitorConfig]):
+        """Добавить лист «Виды доставки» со строками конкурентов и средним по каждому виду."""
+        presence = mode_presence(self.config, self.collected_modes, competitors)
+        averages = self.mode_averages(competitors)
+        self.generator.add_modes_sheet(self.collected_modes, presence, averages)
+        pairs = sum(len(by_mode) for by_mode in presence.values())
+        logger.info(f"Видов доставки: {len(self.collected_modes)}, пар город/вид: {pairs}")
+
+    def mode_averages(
+        self,
+        competitors: Optional[List[CompetitorConfig]] = None
+    ) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+        """
+        Средние последнего запуска по видам доставки.
+
+        Returns:
+            {город: {вид: {поле: среднее или None}}}
+        """
+        if competitors is None:
+            competitors = [c for c in self.config.competitors.values() if c.enabled]
+        return mode_averages(
+            self.config, self.collected_modes, competitors, self.generator.FIELDS
+        )
+
+    def _record_history(
+        self,
+        competitors: List[CompetitorConfig],
+        collected: Dict[str, Dict[str, Dict[str, Any]]]
+    ):
+        """Записать данные запуска в историю цен (ошибка не прерывает обработку)."""
+        try:
+            with PriceHistoryStore(resolve_db_path(self.config)) as store:
+                store.record_run(
+                    self.config, competitors, collected, fingerprint=self.mapped_files.fingerprint,
+                    matches=self._city_matches(),
+                )
+        except Exception as e:
+            logger.error(f"Ошибка записи истории цен: {e}")
+
+    def _city_matches(self) -> List[CityMatch]:
+        """Принятые метки городов последнего запуска."""
+        return [d.match() for d in self.match_diagnostics if d.matched_row is not None]
+
+    def alias_suggestions(self) -> List[AliasSuggestion]:
+        """
+        Метки, принятые в последнем запуске нечётким сравнением, — кандидаты в псевдонимы.
+
+        Без запуска в этом сеансе берутся метки последнего запуска из истории цен.
+        """
+        matches = self._city_matches()
+        if not matches and self.config.history.enabled:
+            db_path = resolve_db_path(self.config)
+            if db_path.exists():
+                try:
+                    with PriceHistoryStore(db_path) as store:
+                        _, matches = store.recent_matches(1)
+                except Exception as e:
+                    logger.error(f"Ошибка чтения истории сопоставлений: {e}")
+        return suggest_aliases(self.config, matches)
+
+    def stale_aliases(self, runs: Optional[int] = None) -> Dict[str, List[str]]:
+        """
+        Псевдонимы без совпадений в последних runs запусках (по истории цен)
+        и повторяющие название или другой псевдоним после нормализации.
+
+        Returns:
+            {город: [псевдоним, ...]}
+        """
+        runs = runs or self.config.history.alias_stale_runs
+        runs_seen, matches = 0, []
+        db_path = resolve_db_path(self.config)
+        if db_path.exists():
+            try:
+                with PriceHistoryStore(db_path) as store:
+                    runs_seen, matches = store.recent_matches(runs)
+            except Exception as e:
+                logger.error(f"Ошибка чтения истории сопоставлений: {e}")
+        if runs_seen < runs:
+            logger.info(
+                f"В истории запусков с сопоставлениями: {runs_seen} из {runs} — "
+                f"удаляются только повторяющиеся псевдонимы"
+            )
+        return stale_aliases(self.config, matches, runs_seen, runs)
+
+    def _finish_run(self):
+        """Закрыть отображения файлов запуска, завершить замеры и вывести профиль."""
+        self.mapped_files.close_all()
+        self.profiler.end_run()
+        self.profiler.report(self.config.output_file)
+
+    def cost_shipments(self, csv_path: str, output_path: Optional[str] = None) -> Optional[CostingResult]:
+        """
+        Рассчитать журнал отгрузок по тарифам последнего запуска process_all.
+
+        Returns:
+            CostingResult или None, если данных запуска нет или расчёт не удался
+        """
+        if not self.collected:
+            logger.warning("Нет собранных тарифов — сначала запустите обработку")
+            return None
+        try:
+            result = cost_shipments(
+                self.config, self.collected, self.city_competitors, csv_path, output_path
+            )
+        except Exception as e:
+            logger.error(f"Ошибка расчёта отгрузок: {e}")
+            return None
+        self.shipment_units = result.units
+        return result
+
+    def scenario_engine(self) -> Optional[ScenarioEngine]:
+        """
+        Движок сценариев наценок по данным последнего запуска.
+
+        Если рассчитывался журнал отгрузок, выручка взвешивается его объёмами.
+        """
+        if not self.collected:
+            logger.warning("Нет собранных данных — сначала запустите обработку")
+            return None
+        return ScenarioEngine(
+            self.config, self.collected, self.city_competitors, units=self.shipment_units or None
+        )
+
+    def solve_own_markups(self, goals: List[PositionGoal]) -> Optional[Dict[str, SolverResult]]:
+        """
+        Подобрать наценки собственной ТК под цели по данным последнего запуска.
+
+        Выполнимые решения записываются в config.own_company.markups.
+        """
+        engine = self.scenario_engine()
+        if engine is None:
+            return None
+        return solve_markups(engine, goals, self.config)
+
+    def detect_columns(self, competitor: CompetitorConfig) -> Optional[ColumnDetection]:
+        """
+        Предложить колонки файла конкурента по заголовкам и настроенным городам.
+
+        Неуверенно найденные поля сохраняют текущие колонки конкурента.
+        Файл отображается отдельно от файлов запуска: определение вызывается из
+        интерфейса и может идти одновременно с process_all.
+        """
+        with MappedFiles() as files:
+            return detect_columns(
+                competitor.file_path,
+                self.config,
+                current=competitor.source_columns,
+                threshold=competitor.fuzzy_match_threshold,
+                files=files,
+            )
+
+    def build_label_indexes(self, competitors: Optional[List[CompetitorConfig]] = None) -> int:
+        """
+        Построить индексы меток для конкурентов без актуального индекса.
+
+        Файл, общий для нескольких конкурентов, читается один раз. Индексы строятся
+        в фоновом потоке, поэтому файлы отображаются отдельно от файлов запуска.
+
+        Returns:
+            Сколько индексов построено
+        """
+        if competitors is None:
+            competitors = [c for c in self.config.competitors.values() if c.enabled]
+        stale = [
+            c for c in self.city_lookup.stale(competitors)
+            if c.file_path and Path(c.file_path).exists()
+        ]
+        built = 0
+        with MappedFiles() as files:
+            for group in self.file_groups(stale, files):
+                try:
+                    sheet = read_sheet_rows(files.reader(group[0].file_path))
+                except Exception as e:
+                    logger.error(f"Ошибка чтения {group[0].file_path}: {e}")
+                    continue
+                for competitor in group:
+                    self.city_lookup.store(LabelIndex.build(sheet, competitor, self._field_cells))
+                    built += 1
+        if built:
+            logger.info(f"Индексы меток для поиска города построены: {built}")
+        return built
+
+    def lookup_city(self, query: str, limit: int = 3, build: bool = True) -> Dict[str, List[LookupHit]]:
+        """
+        Найти город по названию или началу названия у всех включённых конкурентов.
+
+        Если запрос совпадает с настроенным городом или его псевдонимом, ищутся
+        все варианты написания. Файлы читаются только для устаревших индексов
+        (при build=False — только по уже готовым индексам).
+
+        Returns:
+            {конкурент: [LookupHit, ...]} — лучшие строки конкурента
+        """
+        competitors = [c for c in self.config.competitors.values() if c.enabled]
+        if build:
+            self.build_label_indexes(competitors)
+
+        text = query.strip().lower()
+        names = [query]
+        for city in self.config.cities.keys():
+            variants = self.config.get_city_names(city)
+            if text in (v.lower() for v in variants):
+                names = variants
+                break
+        return self.city_lookup.search(names, competitors, limit)
+
     def preview_data(self, competitor: CompetitorConfig, max_rows: int = 10) -> List[Dict[str, Any]]:
         """
         Предварительный просмотр данных из файла конкурента.
@@ -392,25 +1009,12 @@ class ExcelProcessor:
             if not competitor.file_path or not Path(competitor.file_path).exists():
                 return preview_data
 
-            wb = openpyxl.load_workbook(competitor.file_path, read_only=True)
-            sheet = wb.worksheets[0]
-
-            src_cols = competitor.source_columns
-
-            for row_idx in range(1, min(max_rows + 1, sheet.max_row + 1)):
-                row_data = {
-                    'row': row_idx,
-                    'city': sheet[f"{src_cols.city}{row_idx}"].value,
-                    'convert': sheet[f"{src_cols.convert}{row_idx}"].value,
-                    'minimum_1': sheet[f"{src_cols.minimum_1}{row_idx}"].value,
-                    'minimum_2': sheet[f"{src_cols.minimum_2}{row_idx}"].value,
-                    'volume': sheet[f"{src_cols.volume}{row_idx}"].value,
-                    'weight_100': sheet[f"{src_cols.weight_100}{row_idx}"].value,
-                    'weight_3000': sheet[f"{src_cols.weight_3000}{row_idx}"].value,
-                }
-                preview_data.append(row_data)
-
-            wb.close()
+            # Строки читаются одним последовательным проходом, без поиска ячеек по адресу
+            with PreviewReader(competitor.file_path, preview_columns(competitor)) as reader:
+                for row in reader.next_page(max_rows):
+                    row_data = {'row': row[0]}
+                    row_data.update(zip(PREVIEW_FIELDS, row[1:]))
+                    preview_data.append(row_data)
 
         except Exception as e:
             logger.error(f"Ошибка предпросмотра данных: {e}")
@@ -0,0 +1,324 @@
+"""
+Небольшой вычислитель формул Excel для файлов без сохранённых значений.
+
+Файлы, сохранённые не из Excel (openpyxl, выгрузки сайтов), часто содержат
+формулы без кэшированного результата: при data_only=True такие ячейки пустые.
+Поддерживаются арифметика (+ - * / ^ %, скобки), ссылки на ячейки и диапазоны
+(в т.ч. на другие листы) и функции SUM, MIN, MAX, AVERAGE, ROUND, ABS.
+Каждая ячейка вычисляется один раз на лист (мемоизация). Ячейки, на которые
+ссылается формула, вычисляются заранее обходом со своим стеком, поэтому длинные
+цепочки ссылок («=A1+1», «=A2+1», ...) не упираются в глубину рекурсии Python.
+"""
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import logging
+import re
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<ref>(?:(?:'[^']+'|[^\s'!()+\-*/^,:%=<>&"]+)!)?\$?[A-Za-z]{1,3}\$?\d+)
+  | (?P<func>[A-Za-z][A-Za-z0-9.]*)(?=\s*\()
+  | (?P<op>[-+*/^(),:%])
+""", re.VERBOSE)
+
+_REF_RE = re.compile(r"^(?:(?P<sheet>'[^']+'|[^!]+)!)?\$?(?P<col>[A-Za-z]{1,3})\$?(?P<row>\d+)$")
+
+
+class FormulaError(Exception):
+    """Формулу не удалось вычислить."""
+
+
+def _tokenize(formula: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    while pos < len(formula):
+        match = _TOKEN_RE.match(formula, pos)
+        if not match:
+            raise FormulaError(f"Неподдерживаемый фрагмент: {formula[pos:pos + 10]!r}")
+        kind = match.lastgroup
+        if kind != 'ws':
+            tokens.append((kind, match.group()))
+        pos = match.end()
+    return tokens
+
+
+def _numbers(values: List[Any]) -> List[float]:
+    """Числа из аргументов функции — как в Excel, пустые и текст в диапазонах пропускаются."""
+    result = []
+    for value in values:
+        if isinstance(value, list):
+            result.extend(v for v in value if isinstance(v, (int, float)) and not isinstance(v, bool))
+        elif value is None:
+            continue
+        else:
+            result.append(_to_number(value))
+    return result
+
+
+def _to_number(value: Any) -> float:
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    raise FormulaError(f"Не число: {value!r}")
+
+
+def _scalars(name: str, values: List[Any], required: int, optional: int = 0) -> List[float]:
+    """
+    Позиционные числовые аргументы функции (ROUND, ABS).
+
+    Как в Excel: пустая ячейка — 0, диапазон без чисел — 0, диапазон из нескольких
+    чисел — ошибка. Неверное число аргументов — ошибка формулы.
+    """
+    if not required <= len(values) <= required + optional:
+        raise FormulaError(f"{name}: неверное число аргументов ({len(values)})")
+    result = []
+    for value in values:
+        if isinstance(value, list):
+            numbers = _numbers([value])
+            if len(numbers) > 1:
+                raise FormulaError(f"{name}: диапазон вместо числа")
+            result.append(numbers[0] if numbers else 0)
+        else:
+            result.append(_to_number(value))
+    return result
+
+
+def _round(values: List[Any]) -> float:
+    args = _scalars('ROUND', values, 1, 1)
+    digits = int(args[1]) if len(args) > 1 else 0
+    return round(args[0], digits)
+
+
+def _average(values: List[Any]) -> float:
+    args = _numbers(values)
+    if not args:
+        raise FormulaError("AVERAGE без чисел")
+    return sum(args) / len(args)
+
+
+_FUNCTIONS: Dict[str, Callable[[List[Any]], Any]] = {
+    'SUM': lambda args: sum(_numbers(args)),
+    'MIN': lambda args: min(_numbers(args), default=0),
+    'MAX': lambda args: max(_numbers(args), default=0),
+    'AVERAGE': _average,
+    'ROUND': _round,
+    'ABS': lambda args: abs(_scalars('ABS', args, 1)[0]),
+}
+
+
+class _Parser:
+    """Рекурсивный спуск по токенам одной формулы."""
+
+    def __init__(self, tokens: List[Tuple[str, str]], evaluator: 'FormulaEvaluator', sheet: str):
+        self.tokens = tokens
+        self.pos = 0
+        self.evaluator = evaluator
+        self.sheet = sheet
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, text: Optional[str] = None) -> Tuple[str, str]:
+        token = self.peek()
+        if token is None or (text is not None and token[1] != text):
+            raise FormulaError(f"Ожидалось {text!r}")
+        self.pos += 1
+        return token
+
+    def parse(self) -> Any:
+        value = self.expr()
+        if self.peek() is not None:
+            raise FormulaError(f"Лишний токен {self.peek()[1]!r}")
+        return value
+
+    def expr(self) -> Any:
+        value = self.term()
+        while self.peek() and self.peek()[1] in '+-':
+            op = self.take()[1]
+            right = self.term()
+            value = _to_number(value) + _to_number(right) if op == '+' else _to_number(value) - _to_number(right)
+        return value
+
+    def term(self) -> Any:
+        value = self.power()
+        while self.peek() and self.peek()[1] in '*/':
+            op = self.take()[1]
+            right = _to_number(self.power())
+            if op == '*':
+                value = _to_number(value) * right
+            else:
+                if right == 0:
+                    raise FormulaError("Деление на ноль")
+                value = _to_number(value) / right
+        return value
+
+    def power(self) -> Any:
+        value = self.unary()
+        if self.peek() and self.peek()[1] == '^':
+            self.take()
+            value = _to_number(value) ** _to_number(self.power())
+        return value
+
+    def unary(self) -> Any:
+        token = self.peek()
+        if token and token[1] in '+-':
+            self.take()
+            value = _to_number(self.unary())
+            return -value if token[1] == '-' else value
+        value = self.primary()
+        while self.peek() and self.peek()[1] == '%':
+            self.take()
+            value = _to_number(value) / 100
+        return value
+
+    def primary(self) -> Any:
+        token = self.peek()
+        if token is None:
+            raise FormulaError("Неожиданный конец формулы")
+        kind, text = token
+        if kind == 'number':
+            self.take()
+            return float(text) if any(c in text for c in '.eE') else int(text)
+        if kind == 'ref':
+            self.take()
+            if self.peek() and self.peek()[1] == ':':
+                self.take()
+                _kind, end = self.take()
+                return self.evaluator.range_values(self.sheet, text, end)
+            return self.evaluator.ref_value(self.sheet, text)
+        if kind == 'func':
+            self.take()
+            func = _FUNCTIONS.get(text.upper())
+            if func is None:
+                raise FormulaError(f"Функция {text} не поддерживается")
+            self.take('(')
+            args = []
+            if self.peek() and self.peek()[1] != ')':
+                args.append(self.expr())
+                while self.peek() and self.peek()[1] == ',':
+                    self.take()
+                    args.append(self.expr())
+            self.take(')')
+            return func(args)
+        if text == '(':
+            self.take()
+            value = self.expr()
+            self.take(')')
+            return value
+        raise FormulaError(f"Неожиданный токен {text!r}")
+
+
+class FormulaEvaluator:
+    """
+    Вычисление формул по книге, загруженной без data_only.
+
+    Args:
+        cell_value: функция (лист, колонка, строка) -> значение ячейки как в файле
+                    (для формул — строка, начинающаяся с '=')
+    """
+
+    def __init__(self, cell_value: Callable[[str, str, int], Any]):
+        self.cell_value = cell_value
+        # {(лист, колонка, строка): значение}
+        self._memo: Dict[Tuple[str, str, int], Any] = {}
+
+    def _split_ref(self, sheet: str, ref: str) -> Tuple[str, str, int]:
+        match = _REF_RE.match(ref)
+        if not match:
+            raise FormulaError(f"Неверная ссылка {ref!r}")
+        ref_sheet = match.group('sheet')
+        if ref_sheet:
+            sheet = ref_sheet.strip("'")
+        return sheet, match.group('col').upper(), int(match.group('row'))
+
+    def ref_value(self, sheet: str, ref: str) -> Any:
+        return self.value(*self._split_ref(sheet, ref))
+
+    def _range_keys(self, sheet: str, start: str, end: str) -> List[Tuple[str, str, int]]:
+        sheet, col1, row1 = self._split_ref(sheet, start)
+        _sheet, col2, row2 = self._split_ref(sheet, end)
+        c1, c2 = sorted((column_index_from_string(col1), column_index_from_string(col2)))
+        r1, r2 = sorted((row1, row2))
+        return [
+            (sheet, get_column_letter(c), r)
+            for r in range(r1, r2 + 1)
+            for c in range(c1, c2 + 1)
+        ]
+
+    def range_values(self, sheet: str, start: str, end: str) -> List[Any]:
+        return [self.value(*key) for key in self._range_keys(sheet, start, end)]
+
+    def _references(self, sheet: str, tokens: List[Tuple[str, str]]) -> List[Tuple[str, str, int]]:
+        """Ячейки, на которые ссылается формула (включая ячейки диапазонов)."""
+        keys = []
+        for pos, (kind, text) in enumerate(tokens):
+            if kind != 'ref' or (pos > 0 and tokens[pos - 1][1] == ':'):
+                continue
+            if pos + 2 < len(tokens) and tokens[pos + 1][1] == ':' and tokens[pos + 2][0] == 'ref':
+                keys.extend(self._range_keys(sheet, text, tokens[pos + 2][1]))
+            else:
+                keys.append(self._split_ref(sheet, text))
+        return keys
+
+    def value(self, sheet: str, col: str, row: int) -> Any:
+        """
+        Значение ячейки с вычислением формулы (мемоизируется).
+
+        Ячейки-ссылки вычисляются до разбора формулы обходом в глубину со своим
+        стеком; к моменту разбора все они уже в мемо.
+        """
+        key = (sheet, col, row)
+        if key in self._memo:
+            return self._memo[key]
+
+        # Формулы, чьи ссылки уже поставлены в стек: {ячейка: токены}
+        expanded: Dict[Tuple[str, str, int], List[Tuple[str, str]]] = {}
+        stack = [key]
+        while stack:
+            current = stack[-1]
+            if current in self._memo:
+                stack.pop()
+                continue
+            if current in expanded:
+                # Все ссылки вычислены — разбор формулы берёт их из мемо
+                self._memo[current] = self._parse(current, expanded.pop(current))
+                stack.pop()
+                continue
+
+            raw = self.cell_value(*current)
+            if not (isinstance(raw, str) and raw.startswith('=')):
+                self._memo[current] = raw
+                stack.pop()
+                continue
+
+            tokens = _tokenize(raw[1:])
+            expanded[current] = tokens
+            for ref in reversed(self._references(current[0], tokens)):
+                if ref in expanded:
+                    ref_sheet, ref_col, ref_row = ref
+                    raise FormulaError(f"Циклическая ссылка {ref_sheet}!{ref_col}{ref_row}")
+                if ref not in self._memo:
+                    stack.append(ref)
+        return self._memo[key]
+
+    def _parse(self, key: Tuple[str, str, int], tokens: List[Tuple[str, str]]) -> Any:
+        """Вычислить формулу; арифметические ошибки Python — ошибки формулы."""
+        try:
+            return _Parser(tokens, self, key[0]).parse()
+        except (ArithmeticError, ValueError, RecursionError) as e:
+            raise FormulaError(f"{type(e).__name__}: {e}") from e
+
+    def evaluate(self, sheet: str, col: str, row: int) -> Optional[Any]:
+        """Как value(), но ошибка вычисления даёт None."""
+        try:
+            return self.value(sheet, col, row)
+        except FormulaError as e:
+            logger.debug(f"Формула {sheet}!{col}{row} не вычислена: {e}")
+            return None
@@ -1,8 +1,12 @@
 """
 Графический интерфейс приложения на PySide6.
 """
+import os
+import queue
 import sys
+import time
 import logging
+from collections import deque
 from pathlib import Path
 from typing import Optional
 
@@ -40,14 +44,21 @@ def get_config_path() -> Path:
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QLineEdit, QComboBox, QCheckBox, QSpinBox, QDoubleSpinBox,
-    QTextEdit, QFileDialog, QTabWidget, QTableWidget, QTableWidgetItem,
+    QTextEdit, QFileDialog, QTabWidget, QTableWidget, QTableWidgetItem, QTableView,
     QGroupBox, QMessageBox, QProgressBar, QStatusBar
 )
-from PySide6.QtCore import Qt, QThread, Signal
+from PySide6.QtCore import Qt, QThread, Signal, QTimer, QAbstractTableModel, QModelIndex
 from PySide6.QtGui import QFont
+from openpyxl.utils import column_index_from_string
 
-from src.models import AppConfig, CompetitorConfig
+from src.models import AppConfig, CompetitorConfig, ColumnMapping, ConditionRule
+from src.alias_learning import accept_aliases, remove_aliases
+from src.conditions import OPERATORS, CompiledConditions
 from src.excel_processor import ExcelProcessor
+from src.costing import costing_csv_path
+from src.preview import PAGE_SIZE, PreviewReader, preview_columns
+from src.scenarios import FIELDS, markup_grid
+from src.target_solver import PositionGoal, GOAL_BELOW_AVERAGE, GOAL_RANK_SHARE
 
 logger = logging.getLogger(__name__)
 
@@ -66,6 +77,194 @@ class ProcessingThread(QThread):
         self.finished.emit(results)
 
 
+class CostingThread(QThread):
+    """Поток для расчёта журнала отгрузок в фоне."""
+    finished = Signal(object)  # CostingResult или None
+
+    def __init__(self, processor: ExcelProcessor, csv_path: str, output_path: str):
+        super().__init__()
+        self.processor = processor
+        self.csv_path = csv_path
+        self.output_path = output_path
+
+    def run(self):
+        self.finished.emit(self.processor.cost_shipments(self.csv_path, self.output_path))
+
+
+class LabelIndexThread(QThread):
+    """Поток построения индексов меток для поиска города."""
+    finished = Signal(int)  # сколько индексов построено
+
+    def __init__(self, processor: ExcelProcessor):
+        super().__init__()
+        self.processor = processor
+
+    def run(self):
+        self.finished.emit(self.processor.build_label_indexes())
+
+
+class PreviewThread(QThread):
+    """Поток последовательного чтения страниц предпросмотра."""
+    page_loaded = Signal(int, list, bool)  # поколение, строки страницы, файл прочитан
+    failed = Signal(int, str)  # поколение, ошибка
+
+    def __init__(self, generation: int, file_path: str, columns: list):
+        super().__init__()
+        self.generation = generation
+        self.file_path = file_path
+        self.columns = columns
+        self.requests: queue.Queue = queue.Queue()
+
+    def request_rows(self, count: int):
+        """Запросить следующие count строк."""
+        self.requests.put(count)
+
+    def stop(self):
+        self.requests.put(None)
+
+    def run(self):
+        try:
+            reader = PreviewReader(self.file_path, self.columns)
+        except Exception as e:
+            self.failed.emit(self.generation, str(e))
+            return
+        try:
+            while True:
+                count = self.requests.get()
+                if count is None:
+                    break
+                rows = reader.next_page(count)
+                self.page_loaded.emit(self.generation, rows, reader.finished)
+        except Exception as e:
+            self.failed.emit(self.generation, str(e))
+        finally:
+            reader.close()
+
+
+class PreviewTableModel(QAbstractTableModel):
+    """
+    Строки предпросмотра, подгружаемые страницами при прокрутке.
+
+    Страницы читает PreviewThread; модель хранит только уже прочитанные строки
+    (номер строки и колонки полей).
+    """
+    HEADERS = ["Строка", "Город", "Конверт", "Мин. 1", "Мин. 2", "Объем", "Вес 100", "Вес 3000"]
+
+    loaded = Signal(int, bool)  # прочитано строк, файл прочитан полностью
+    row_ready = Signal(int)     # запрошенная строка прочитана (номер строки модели)
+    failed = Signal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows: list = []
+        self.finished = True
+        self.loading = False
+        self.target_row = 0
+        self._reader: Optional[PreviewThread] = None
+        self.generation = 0
+
+    @property
+    def started(self) -> bool:
+        """Предпросмотр файла запущен (поток чтения создан)."""
+        return self._reader is not None
+
+    def start(self, file_path: str, columns: list):
+        """Начать предпросмотр нового файла."""
+        self.stop()
+        self.beginResetModel()
+        self.rows = []
+        self.finished = False
+        self.loading = False
+        self.target_row = 0
+        self.endResetModel()
+
+        self.generation += 1
+        self._reader = PreviewThread(self.generation, file_path, columns)
+        self._reader.page_loaded.connect(self._on_page_loaded)
+        self._reader.failed.connect(self._on_failed)
+        self._reader.start()
+        self._request(PAGE_SIZE)
+
+    def stop(self):
+        """Остановить поток чтения (файл закрывается в потоке)."""
+        if self._reader is not None:
+            self._reader.stop()
+            self._reader.wait()
+            self._reader = None
+
+    def ensure_row(self, row: int):
+        """Дочитать файл до строки row (1 — первая); row_ready придёт, когда она прочитана."""
+        if row <= len(self.rows):
+            self.row_ready.emit(row - 1)
+            return
+        if self.finished:
+            # Строки дальше конца файла нет — сообщаем о прочитанном и переходим к последней
+            self.loaded.emit(len(self.rows), True)
+            if self.rows:
+                self.row_ready.emit(len(self.rows) - 1)
+            return
+        self.target_row = row
+        if not self.finished and not self.loading:
+            self._request(max(PAGE_SIZE, row - len(self.rows)))
+
+    def _request(self, count: int):
+        if self._reader is None:
+            return
+        self.loading = True
+        self._reader.request_rows(count)
+
+    def _on_page_loaded(self, generation: int, rows: list, finished: bool):
+        if generation != self.generation:
+            return
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+        self.loading = False
+        self.finished = finished
+        self.loaded.emit(len(self.rows), finished)
+
+        if self.target_row:
+            if len(self.rows) >= self.target_row or finished:
+                row = min(self.target_row, len(self.rows))
+                self.target_row = 0
+                if row:
+                    self.row_ready.emit(row - 1)
+            else:
+                self._request(max(PAGE_SIZE, self.target_row - len(self.rows)))
+
+    def _on_failed(self, generation: int, error: str):
+        if generation != self.generation:
+            return
+        self.loading = False
+        self.finished = True
+        self.failed.emit(error)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self.rows[index.row()][index.column()]
+        return "" if value is None else str(value)
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and not self.finished and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._request(PAGE_SIZE)
+
+
 class MainWindow(QMainWindow):
     """Главное окно приложения."""
 
@@ -103,6 +302,8 @@ class MainWindow(QMainWindow):
         self.create_competitor_tab()
         self.create_cities_tab()
         self.create_preview_tab()
+        self.create_scenarios_tab()
+        self.create_lookup_tab()
         self.create_log_tab()
 
         # Панель управления внизу
@@ -189,6 +390,16 @@ class MainWindow(QMainWindow):
         self.markups_sheet_check.setChecked(True)
         output_cfg_layout.addWidget(self.markups_sheet_check)
 
+        self.changes_report_check = QCheckBox("Отчёт об изменениях цен с прошлого запуска (лист «Изменения» и CSV)")
+        self.changes_report_check.setChecked(True)
+        output_cfg_layout.addWidget(self.changes_report_check)
+
+        self.match_diagnostics_check = QCheckBox(
+            "Диагностика сопоставления городов (лист «Диагностика» и JSON с лучшими кандидатами)"
+        )
+        self.match_diagnostics_check.setChecked(True)
+        output_cfg_layout.addWidget(self.match_diagnostics_check)
+
         layout.addWidget(output_cfg_group)
 
         # Группа собственной компании
@@ -205,6 +416,15 @@ class MainWindow(QMainWindow):
         own_name_layout.addWidget(self.own_name_edit)
         own_layout.addLayout(own_name_layout)
 
+        own_mode_layout = QHBoxLayout()
+        own_mode_layout.addWidget(QLabel("Заполнение строки:"))
+        self.own_fill_mode_combo = QComboBox()
+        self.own_fill_mode_combo.addItem("Формулы (среднее × наценка с листа «Наценки»)", "formula")
+        self.own_fill_mode_combo.addItem("Готовые значения", "value")
+        own_mode_layout.addWidget(self.own_fill_mode_combo)
+        own_mode_layout.addStretch()
+        own_layout.addLayout(own_mode_layout)
+
         own_markups_label = QLabel("Наценки на среднее значение (%):")
         own_layout.addWidget(own_markups_label)
 
@@ -230,6 +450,52 @@ class MainWindow(QMainWindow):
 
         layout.addWidget(own_group)
 
+        # Группа истории цен
+        history_group = QGroupBox("История цен")
+        history_layout = QHBoxLayout(history_group)
+
+        self.history_enabled_check = QCheckBox("Сохранять значения каждого запуска")
+        self.history_enabled_check.setChecked(True)
+        history_layout.addWidget(self.history_enabled_check)
+
+        history_layout.addWidget(QLabel("База:"))
+        self.history_path_edit = QLineEdit()
+        self.history_path_edit.setPlaceholderText("price_history.sqlite рядом с выходным файлом")
+        history_layout.addWidget(self.history_path_edit)
+        history_browse_btn = QPushButton("Обзор...")
+        history_browse_btn.clicked.connect(self.browse_history_db)
+        history_layout.addWidget(history_browse_btn)
+
+        layout.addWidget(history_group)
+
+        # Группа профилирования
+        profiling_group = QGroupBox("Профилирование")
+        profiling_layout = QHBoxLayout(profiling_group)
+
+        self.profiling_check = QCheckBox("Замерять время этапов (сводка в журнале и .profile.json)")
+        profiling_layout.addWidget(self.profiling_check)
+
+        self.cprofile_check = QCheckBox("Сохранять дамп cProfile (.pstats)")
+        profiling_layout.addWidget(self.cprofile_check)
+
+        self.memory_profiling_check = QCheckBox("Профилировать память (медленнее)")
+        profiling_layout.addWidget(self.memory_profiling_check)
+        profiling_layout.addStretch()
+
+        layout.addWidget(profiling_group)
+
+        # Группа сбора данных
+        processing_group = QGroupBox("Сбор данных")
+        processing_layout = QHBoxLayout(processing_group)
+        processing_layout.addWidget(QLabel("Процессов для сбора конкурентов:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, max(1, os.cpu_count() or 1))
+        self.workers_spin.setToolTip("1 — последовательно; больше — файлы конкурентов читаются параллельно")
+        processing_layout.addWidget(self.workers_spin)
+        processing_layout.addStretch()
+
+        layout.addWidget(processing_group)
+
         # Информация
         info_group = QGroupBox("Информация")
         info_layout = QVBoxLayout(info_group)
@@ -298,6 +564,10 @@ class MainWindow(QMainWindow):
         self.competitor_bold_check.setChecked(False)
         settings_layout.addWidget(self.competitor_bold_check)
 
+        self.competitor_formulas_check = QCheckBox("Вычислять формулы, сохранённые в файле без результата")
+        self.competitor_formulas_check.setChecked(True)
+        settings_layout.addWidget(self.competitor_formulas_check)
+
         # Колонки источника — все в одну строку
         source_cols_group = QGroupBox("Колонки в файле конкурента")
         source_cols_layout = QHBoxLayout(source_cols_group)
@@ -318,6 +588,10 @@ class MainWindow(QMainWindow):
             setattr(self, attr, edit)
 
         source_cols_layout.addStretch()
+        self.detect_columns_btn = QPushButton("🔍 Определить")
+        self.detect_columns_btn.setToolTip("Определить колонки по заголовкам и городам в файле")
+        self.detect_columns_btn.clicked.connect(self.detect_competitor_columns)
+        source_cols_layout.addWidget(self.detect_columns_btn)
         settings_layout.addWidget(source_cols_group)
 
         # Смещения строк — все в одну строку
@@ -375,9 +649,46 @@ class MainWindow(QMainWindow):
         self.threshold_spin.setRange(50, 100)
         self.threshold_spin.setValue(95)
         threshold_layout.addWidget(self.threshold_spin)
+        threshold_layout.addSpacing(20)
+        threshold_layout.addWidget(QLabel("Колонка вида доставки:"))
+        self.mode_column_edit = QLineEdit()
+        self.mode_column_edit.setMaximumWidth(45)
+        self.mode_column_edit.setPlaceholderText("нет")
+        self.mode_column_edit.setToolTip(
+            "Колонка с видом доставки (авто, авиа, ЖД). Строки города собираются\n"
+            "по каждому виду — лист «Виды доставки» со средними по видам"
+        )
+        threshold_layout.addWidget(self.mode_column_edit)
         threshold_layout.addStretch()
         settings_layout.addLayout(threshold_layout)
 
+        # Разбор строковых цен
+        normalization_group = QGroupBox("Разбор цен, записанных текстом («1 200 р.», «от 350»)")
+        normalization_layout = QHBoxLayout(normalization_group)
+
+        self.normalize_enabled_check = QCheckBox("Разбирать")
+        normalization_layout.addWidget(self.normalize_enabled_check)
+
+        self.normalize_comma_check = QCheckBox("Запятая — десятичный разделитель")
+        self.normalize_comma_check.setToolTip(
+            "Включено: «1,5» — 1.5, «1.200» — 1200. Выключено: «1.5» — 1.5, «1,200» — 1200. "
+            "Записи с двумя разделителями («12,500.00») не разбираются"
+        )
+        normalization_layout.addWidget(self.normalize_comma_check)
+
+        normalization_layout.addWidget(QLabel("Из диапазона брать:"))
+        self.normalize_range_combo = QComboBox()
+        for key, label in [('first', 'первое'), ('last', 'последнее'), ('min', 'минимум'), ('max', 'максимум')]:
+            self.normalize_range_combo.addItem(label, key)
+        normalization_layout.addWidget(self.normalize_range_combo)
+
+        normalization_layout.addWidget(QLabel("Пустые значения:"))
+        self.normalize_empty_edit = QLineEdit()
+        self.normalize_empty_edit.setPlaceholderText("договорная, по запросу")
+        normalization_layout.addWidget(self.normalize_empty_edit)
+
+        settings_layout.addWidget(normalization_group)
+
         layout.addWidget(settings_group)
 
         # Группа дополнительных строк с наценками
@@ -404,6 +715,32 @@ class MainWindow(QMainWindow):
 
         layout.addWidget(mk_rows_group)
 
+        # Условия на строку города (вид доставки и т.п.)
+        conditions_group = QGroupBox("Условия на строку города (например, вид доставки «Авто» в колонке B)")
+        conditions_layout = QVBoxLayout(conditions_group)
+
+        self.conditions_table = QTableWidget()
+        self.conditions_table.setColumnCount(4)
+        self.conditions_table.setHorizontalHeaderLabels(
+            ["Колонка", "Условие", "Значение", "Города (пусто — все)"]
+        )
+        self.conditions_table.horizontalHeader().setStretchLastSection(True)
+        self.conditions_table.setMaximumHeight(150)
+        conditions_layout.addWidget(self.conditions_table)
+
+        cond_btn_layout = QHBoxLayout()
+        add_cond_btn = QPushButton("➕ Добавить")
+        add_cond_btn.clicked.connect(lambda: self.add_condition_row(ConditionRule()))
+        cond_btn_layout.addWidget(add_cond_btn)
+
+        del_cond_btn = QPushButton("➖ Удалить")
+        del_cond_btn.clicked.connect(self.remove_condition_row)
+        cond_btn_layout.addWidget(del_cond_btn)
+        cond_btn_layout.addStretch()
+        conditions_layout.addLayout(cond_btn_layout)
+
+        layout.addWidget(conditions_group)
+
         # Кнопка сохранения
         save_btn = QPushButton("💾 Сохранить настройки конкурента")
         save_btn.clicked.connect(self.save_competitor_config)
@@ -417,7 +754,9 @@ class MainWindow(QMainWindow):
         layout = QVBoxLayout(tab)
 
         layout.addWidget(QLabel(
-            "Список городов. Псевдонимы — доп. варианты написания через запятую (напр.: Астана, Нур-Султан, Astana):"
+            "Список городов. Псевдонимы — доп. варианты написания через запятую (напр.: Санкт-Петербург, СПб).\n"
+            "Написание латиницей (Astana, Qarağandy) и известные переименования городов Казахстана\n"
+            "(Нур-Султан/Астана, Алма-Ата/Алматы) находятся без псевдонимов:"
         ))
 
         self.cities_table = QTableWidget()
@@ -450,6 +789,46 @@ class MainWindow(QMainWindow):
         buttons_layout.addStretch()
         layout.addLayout(buttons_layout)
 
+        # Обучение псевдонимов по совпадениям последнего запуска
+        aliases_group = QGroupBox("Обучение псевдонимов")
+        aliases_layout = QVBoxLayout(aliases_group)
+        aliases_layout.addWidget(QLabel(
+            "Написания в файлах, найденные нечётким сравнением. Отмеченные добавляются в псевдонимы —\n"
+            "в следующих запусках такие строки находятся точным совпадением, без нечёткого прохода:"
+        ))
+
+        self.alias_review_table = QTableWidget()
+        self.alias_review_table.setColumnCount(5)
+        self.alias_review_table.setHorizontalHeaderLabels(
+            ["Город", "Написание в файле", "Совпадение, %", "Вариант", "Конкуренты"]
+        )
+        self.alias_review_table.horizontalHeader().setStretchLastSection(True)
+        aliases_layout.addWidget(self.alias_review_table)
+        self.alias_suggestions = []
+
+        alias_buttons_layout = QHBoxLayout()
+        review_aliases_btn = QPushButton("🔍 Найденные написания")
+        review_aliases_btn.clicked.connect(self.load_alias_suggestions)
+        alias_buttons_layout.addWidget(review_aliases_btn)
+
+        accept_aliases_btn = QPushButton("✅ Добавить отмеченные")
+        accept_aliases_btn.clicked.connect(self.accept_alias_suggestions)
+        alias_buttons_layout.addWidget(accept_aliases_btn)
+
+        alias_buttons_layout.addStretch()
+        alias_buttons_layout.addWidget(QLabel("Устаревшие — без совпадений запусков:"))
+        self.alias_stale_spin = QSpinBox()
+        self.alias_stale_spin.setRange(1, 1000)
+        self.alias_stale_spin.setValue(10)
+        alias_buttons_layout.addWidget(self.alias_stale_spin)
+
+        prune_aliases_btn = QPushButton("🧹 Удалить устаревшие")
+        prune_aliases_btn.clicked.connect(self.prune_stale_aliases)
+        alias_buttons_layout.addWidget(prune_aliases_btn)
+        aliases_layout.addLayout(alias_buttons_layout)
+
+        layout.addWidget(aliases_group)
+
         self.tabs.addTab(tab, "Города")
 
     def create_preview_tab(self):
@@ -470,17 +849,275 @@ class MainWindow(QMainWindow):
 
         layout.addLayout(select_layout)
 
-        # Таблица предпросмотра
-        self.preview_table = QTableWidget()
-        self.preview_table.setColumnCount(8)
-        self.preview_table.setHorizontalHeaderLabels([
-            "Строка", "Город", "Конверт", "Мин. 1", "Мин. 2",
-            "Объем", "Вес 100", "Вес 3000"
-        ])
+        select_layout.addWidget(QLabel("Строка:"))
+        self.preview_row_spin = QSpinBox()
+        self.preview_row_spin.setRange(1, 10_000_000)
+        select_layout.addWidget(self.preview_row_spin)
+
+        goto_btn = QPushButton("Перейти")
+        goto_btn.clicked.connect(self.preview_goto_row)
+        select_layout.addWidget(goto_btn)
+
+        self.preview_status_label = QLabel("")
+        select_layout.addWidget(self.preview_status_label)
+
+        # Таблица предпросмотра: страницы подгружаются в фоне при прокрутке
+        self.preview_model = PreviewTableModel(self)
+        self.preview_model.loaded.connect(self.on_preview_loaded)
+        self.preview_model.row_ready.connect(self.on_preview_row_ready)
+        self.preview_model.failed.connect(self.on_preview_failed)
+        self.preview_table = QTableView()
+        self.preview_table.setModel(self.preview_model)
+        self.preview_table.verticalHeader().setVisible(False)
         layout.addWidget(self.preview_table)
 
         self.tabs.addTab(tab, "Предпросмотр")
 
+    def create_scenarios_tab(self):
+        """Вкладка сценариев наценок собственной ТК."""
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        grid_layout = QHBoxLayout()
+        grid_layout.addWidget(QLabel("Наценка от (%):"))
+        self.scenario_from_spin = QDoubleSpinBox()
+        self.scenario_from_spin.setRange(-100, 1000)
+        self.scenario_from_spin.setValue(-10)
+        grid_layout.addWidget(self.scenario_from_spin)
+
+        grid_layout.addWidget(QLabel("до:"))
+        self.scenario_to_spin = QDoubleSpinBox()
+        self.scenario_to_spin.setRange(-100, 1000)
+        self.scenario_to_spin.setValue(20)
+        grid_layout.addWidget(self.scenario_to_spin)
+
+        grid_layout.addWidget(QLabel("шаг:"))
+        self.scenario_step_spin = QDoubleSpinBox()
+        self.scenario_step_spin.setRange(0.1, 100)
+        self.scenario_step_spin.setValue(2.5)
+        grid_layout.addWidget(self.scenario_step_spin)
+
+        scenario_btn = QPushButton("📊 Рассчитать")
+        scenario_btn.clicked.connect(self.evaluate_scenarios)
+        grid_layout.addWidget(scenario_btn)
+        grid_layout.addStretch()
+        layout.addLayout(grid_layout)
+
+        solver_group = QGroupBox("Подбор наценки под цель")
+        solver_layout = QHBoxLayout(solver_group)
+        solver_layout.addWidget(QLabel("Поле:"))
+        self.solver_field_combo = QComboBox()
+        for field_key, label in zip(FIELDS, ["Конверт", "Мин. 1", "Мин. 2", "Объем", "Вес 100", "Вес 3000"]):
+            self.solver_field_combo.addItem(label, field_key)
+        solver_layout.addWidget(self.solver_field_combo)
+
+        self.solver_goal_combo = QComboBox()
+        self.solver_goal_combo.addItem("Ниже среднего на, %", GOAL_BELOW_AVERAGE)
+        self.solver_goal_combo.addItem("Не дальше места в доле городов", GOAL_RANK_SHARE)
+        self.solver_goal_combo.setCurrentIndex(1)
+        solver_layout.addWidget(self.solver_goal_combo)
+
+        solver_layout.addWidget(QLabel("На %:"))
+        self.solver_below_spin = QDoubleSpinBox()
+        self.solver_below_spin.setRange(0, 99)
+        self.solver_below_spin.setValue(5)
+        solver_layout.addWidget(self.solver_below_spin)
+
+        solver_layout.addWidget(QLabel("Место:"))
+        self.solver_rank_spin = QSpinBox()
+        self.solver_rank_spin.setRange(1, 50)
+        self.solver_rank_spin.setValue(2)
+        solver_layout.addWidget(self.solver_rank_spin)
+
+        solver_layout.addWidget(QLabel("Доля городов (%):"))
+        self.solver_share_spin = QSpinBox()
+        self.solver_share_spin.setRange(1, 100)
+        self.solver_share_spin.setValue(80)
+        solver_layout.addWidget(self.solver_share_spin)
+
+        solver_btn = QPushButton("🎯 Подобрать")
+        solver_btn.clicked.connect(self.solve_own_markup)
+        solver_layout.addWidget(solver_btn)
+        solver_layout.addStretch()
+        layout.addWidget(solver_group)
+
+        hint = QLabel(
+            "Цена собственной ТК = среднее × (1 + наценка). В ячейке: средняя позиция среди "
+            "конкурентов, доля городов, где дешевле всех, изменение выручки к текущим наценкам. "
+            "Двойной щелчок — подставить наценку на вкладке «Основное»."
+        )
+        hint.setWordWrap(True)
+        layout.addWidget(hint)
+
+        self.scenario_table = QTableWidget()
+        self.scenario_table.setColumnCount(6)
+        self.scenario_table.setHorizontalHeaderLabels([
+            "Конверт", "Мин. 1", "Мин. 2", "Объем", "Вес 100", "Вес 3000"
+        ])
+        self.scenario_table.cellDoubleClicked.connect(self.apply_scenario_cell)
+        layout.addWidget(self.scenario_table)
+
+        self.tabs.addTab(tab, "Сценарии")
+
+    def create_lookup_tab(self):
+        """Вкладка поиска города по всем конкурентам."""
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        query_layout = QHBoxLayout()
+        query_layout.addWidget(QLabel("Город:"))
+        self.lookup_edit = QLineEdit()
+        self.lookup_edit.setPlaceholderText("Название или начало названия")
+        self.lookup_edit.textChanged.connect(self.lookup_city)
+        query_layout.addWidget(self.lookup_edit)
+
+        query_layout.addWidget(QLabel("Строк на конкурента:"))
+        self.lookup_limit_spin = QSpinBox()
+        self.lookup_limit_spin.setRange(1, 20)
+        self.lookup_limit_spin.setValue(3)
+        self.lookup_limit_spin.valueChanged.connect(self.lookup_city)
+        query_layout.addWidget(self.lookup_limit_spin)
+
+        self.lookup_index_btn = QPushButton("🔄 Обновить индексы")
+        self.lookup_index_btn.clicked.connect(self.build_lookup_indexes)
+        query_layout.addWidget(self.lookup_index_btn)
+        layout.addLayout(query_layout)
+
+        self.lookup_status_label = QLabel(
+            "Индексы строятся при обработке или по кнопке «Обновить индексы»"
+        )
+        layout.addWidget(self.lookup_status_label)
+
+        self.lookup_table = QTableWidget()
+        self.lookup_table.setColumnCount(11)
+        self.lookup_table.setHorizontalHeaderLabels([
+            "Конкурент", "Строка", "Значение в файле", "Совпадение, %", "Порог",
+            "Конверт", "Мин. 1", "Мин. 2", "Объем", "Вес 100", "Вес 3000"
+        ])
+        layout.addWidget(self.lookup_table)
+
+        self.lookup_index_thread: Optional[LabelIndexThread] = None
+        self.tabs.addTab(tab, "Поиск города")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+
+    def on_tab_changed(self, index: int):
+        """При открытии вкладки поиска построить недостающие индексы в фоне."""
+        if self.tabs.tabText(index) == "Поиск города":
+            self.build_lookup_indexes()
+
+    def build_lookup_indexes(self):
+        """Построить устаревшие индексы меток в фоне."""
+        if self.lookup_index_thread is not None and self.lookup_index_thread.isRunning():
+            return
+        self.lookup_index_btn.setEnabled(False)
+        self.lookup_status_label.setText("Построение индексов...")
+        self.lookup_index_thread = LabelIndexThread(self.processor)
+        self.lookup_index_thread.finished.connect(self.on_lookup_indexes_built)
+        self.lookup_index_thread.start()
+
+    def on_lookup_indexes_built(self, built: int):
+        self.lookup_index_btn.setEnabled(True)
+        ready = len(self.processor.city_lookup.indexes)
+        self.lookup_status_label.setText(f"Индексов конкурентов: {ready} (построено сейчас: {built})")
+        self.lookup_city()
+
+    def lookup_city(self):
+        """Показать строки всех конкурентов для введённого города (по готовым индексам)."""
+        query = self.lookup_edit.text().strip()
+        self.lookup_table.setRowCount(0)
+        if not query:
+            return
+
+        started = time.perf_counter()
+        results = self.processor.lookup_city(query, self.lookup_limit_spin.value(), build=False)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        hits = [hit for competitor_hits in results.values() for hit in competitor_hits]
+        self.lookup_table.setRowCount(len(hits))
+        for row, hit in enumerate(hits):
+            cells = [hit.competitor, str(hit.row), hit.label, str(hit.score), "✓" if hit.matched else ""]
+            cells += ["" if hit.values.get(f) is None else str(hit.values.get(f)) for f in FIELDS]
+            for col, text in enumerate(cells):
+                self.lookup_table.setItem(row, col, QTableWidgetItem(text))
+        self.lookup_table.resizeColumnsToContents()
+
+        missing = [name for name, competitor_hits in results.items() if not competitor_hits]
+        status = f"Найдено строк: {len(hits)} за {elapsed:.1f} мс"
+        if missing:
+            status += f"; нет совпадений: {', '.join(missing)}"
+        self.lookup_status_label.setText(status)
+
+    def evaluate_scenarios(self):
+        """Рассчитать сетку наценок по данным последней обработки."""
+        engine = self.processor.scenario_engine()
+        if engine is None:
+            QMessageBox.warning(self, "Ошибка", "Нет собранных данных — сначала запустите обработку")
+            return
+        try:
+            percents = markup_grid(
+                self.scenario_from_spin.value(),
+                self.scenario_to_spin.value(),
+                self.scenario_step_spin.value(),
+            )
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
+
+        grid = engine.evaluate_grid(percents)
+        self.scenario_percents = percents
+        self.scenario_table.setRowCount(len(percents))
+        self.scenario_table.setVerticalHeaderLabels([f"{p:+g}%" for p in percents])
+        for col, field_key in enumerate(FIELDS):
+            for row, outcome in enumerate(grid[field_key]):
+                if outcome.cities:
+                    text = (
+                        f"поз. {outcome.avg_position:.2f} · {outcome.cheapest_share:.0%}\n"
+                        f"Δ {outcome.revenue_delta:+,.0f}".replace(',', ' ')
+                    )
+                else:
+                    text = "—"
+                self.scenario_table.setItem(row, col, QTableWidgetItem(text))
+        self.scenario_table.resizeRowsToContents()
+
+    def solve_own_markup(self):
+        """Подобрать наценку собственной ТК для выбранного поля под цель."""
+        goal = PositionGoal(
+            field=self.solver_field_combo.currentData(),
+            kind=self.solver_goal_combo.currentData(),
+            percent_below=self.solver_below_spin.value(),
+            rank=self.solver_rank_spin.value(),
+            share=self.solver_share_spin.value() / 100,
+        )
+        results = self.processor.solve_own_markups([goal])
+        if results is None:
+            QMessageBox.warning(self, "Ошибка", "Нет собранных данных — сначала запустите обработку")
+            return
+
+        result = results[goal.field]
+        if not result.feasible:
+            QMessageBox.warning(
+                self, "Подбор наценки",
+                f"Цель «{goal.describe()}» недостижима: даже при {result.percent:+g}% "
+                f"доля городов {result.achieved_share:.0%}"
+            )
+            return
+        self.own_markup_fields[goal.field].setValue(result.percent)
+        self.status_bar.showMessage(
+            f"Наценка «{self.solver_field_combo.currentText()}»: {result.percent:+.2f}% "
+            f"({goal.describe()}) — сохраните конфигурацию", 8000
+        )
+
+    def apply_scenario_cell(self, row: int, col: int):
+        """Подставить наценку из ячейки сценария в наценки собственной ТК."""
+        percents = getattr(self, 'scenario_percents', [])
+        if row >= len(percents):
+            return
+        field_key = FIELDS[col]
+        self.own_markup_fields[field_key].setValue(percents[row])
+        self.status_bar.showMessage(
+            f"Наценка собственной ТК «{field_key}»: {percents[row]:+g}% (сохраните конфигурацию)", 5000
+        )
+
     def create_log_tab(self):
         """Вкладка логов."""
         tab = QWidget()
@@ -508,6 +1145,12 @@ class MainWindow(QMainWindow):
         self.run_btn.clicked.connect(self.run_processing)
         layout.addWidget(self.run_btn)
 
+        self.costing_btn = QPushButton("📦 Расчёт отгрузок...")
+        self.costing_btn.setToolTip("Рассчитать журнал отгрузок (CSV) по тарифам последней обработки")
+        self.costing_btn.setEnabled(False)
+        self.costing_btn.clicked.connect(self.run_costing)
+        layout.addWidget(self.costing_btn)
+
         save_config_btn = QPushButton("💾 Сохранить конфигурацию")
         save_config_btn.clicked.connect(self.save_config)
         layout.addWidget(save_config_btn)
@@ -516,6 +1159,13 @@ class MainWindow(QMainWindow):
 
         return layout
 
+    def closeEvent(self, event):
+        """Остановить фоновое чтение предпросмотра перед закрытием окна."""
+        self.preview_model.stop()
+        if self.lookup_index_thread is not None:
+            self.lookup_index_thread.wait()
+        super().closeEvent(event)
+
     def setup_logging(self):
         """Настроить логирование в текстовое поле."""
         handler = QTextEditLogger(self.log_text)
@@ -533,13 +1183,30 @@ class MainWindow(QMainWindow):
         self.start_row_spin.setValue(self.config.output_config.start_row)
         self.include_average_check.setChecked(self.config.output_config.include_average)
         self.markups_sheet_check.setChecked(self.config.output_config.markups_sheet)
+        self.changes_report_check.setChecked(self.config.output_config.changes_report)
+        self.match_diagnostics_check.setChecked(self.config.output_config.match_diagnostics)
 
         # Собственная компания
         self.own_enabled_check.setChecked(self.config.own_company.enabled)
         self.own_name_edit.setText(self.config.own_company.name)
+        mode_index = self.own_fill_mode_combo.findData(self.config.own_company.fill_mode)
+        self.own_fill_mode_combo.setCurrentIndex(max(mode_index, 0))
         for field_key, spin in self.own_markup_fields.items():
             spin.setValue(getattr(self.config.own_company.markups, field_key, 0.0))
 
+        # История цен
+        self.history_enabled_check.setChecked(self.config.history.enabled)
+        self.history_path_edit.setText(self.config.history.db_path)
+        self.alias_stale_spin.setValue(self.config.history.alias_stale_runs)
+
+        # Профилирование
+        self.profiling_check.setChecked(self.config.profiling.enabled)
+        self.cprofile_check.setChecked(self.config.profiling.cprofile)
+        self.memory_profiling_check.setChecked(self.config.profiling.memory)
+
+        # Сбор данных
+        self.workers_spin.setValue(self.config.processing.workers)
+
         # Конкуренты
         self.competitor_combo.clear()
         self.preview_competitor_combo.clear()
@@ -589,6 +1256,14 @@ class MainWindow(QMainWindow):
             self.config.template_file = file_path
             self.update_info_label()
 
+    def browse_history_db(self):
+        """Выбрать файл базы истории цен."""
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "База истории цен", "", "SQLite (*.sqlite *.db)"
+        )
+        if file_path:
+            self.history_path_edit.setText(file_path)
+
     def on_competitor_changed(self, name: str):
         """Обработка смены конкурента."""
         if not name or name not in self.config.competitors:
@@ -600,6 +1275,7 @@ class MainWindow(QMainWindow):
         self.competitor_file_edit.setText(competitor.file_path)
         self.competitor_enabled_check.setChecked(competitor.enabled)
         self.competitor_bold_check.setChecked(competitor.bold)
+        self.competitor_formulas_check.setChecked(competitor.evaluate_formulas)
 
         # Загрузить строки наценок
         self.markup_rows_table.setRowCount(len(competitor.markup_rows))
@@ -607,6 +1283,11 @@ class MainWindow(QMainWindow):
             self.markup_rows_table.setItem(i, 0, QTableWidgetItem(mk.name))
             self.markup_rows_table.setItem(i, 1, QTableWidgetItem(str(mk.percent)))
 
+        # Условия на строку города
+        self.conditions_table.setRowCount(0)
+        for rule in competitor.special_conditions:
+            self.add_condition_row(rule)
+
         # Исходные колонки
         self.src_city_edit.setText(competitor.source_columns.city)
         self.src_convert_edit.setText(competitor.source_columns.convert)
@@ -633,8 +1314,18 @@ class MainWindow(QMainWindow):
         self.markup_weight100_spin.setValue(competitor.markups.weight_100)
         self.markup_weight3000_spin.setValue(competitor.markups.weight_3000)
 
-        # Порог
+        # Порог и вид доставки
         self.threshold_spin.setValue(competitor.fuzzy_match_threshold)
+        self.mode_column_edit.setText(competitor.mode_column)
+
+        # Разбор цен
+        rules = competitor.normalization
+        self.normalize_enabled_check.setChecked(rules.enabled)
+        self.normalize_comma_check.setChecked(rules.decimal_comma)
+        self.normalize_range_combo.setCurrentIndex(max(0, self.normalize_range_combo.findData(rules.range_pick)))
+        self.normalize_empty_edit.setText(
+            ", ".join(text for text, value in rules.text_values.items() if value is None)
+        )
 
     def add_competitor(self):
         """Добавить нового конкурента."""
@@ -716,6 +1407,59 @@ class MainWindow(QMainWindow):
         if file_path:
             self.competitor_file_edit.setText(file_path)
 
+    def _source_column_edits(self) -> dict:
+        """Поля ввода колонок источника: {поле: (подпись, поле ввода)}."""
+        return {
+            'city': ("Город", self.src_city_edit),
+            'convert': ("Конверт", self.src_convert_edit),
+            'minimum_1': ("Минималка 1", self.src_min1_edit),
+            'minimum_2': ("Минималка 2", self.src_min2_edit),
+            'volume': ("Объем", self.src_volume_edit),
+            'weight_100': ("Вес 100", self.src_weight100_edit),
+            'weight_3000': ("Вес 3000", self.src_weight3000_edit),
+        }
+
+    def detect_competitor_columns(self):
+        """Определить колонки в файле конкурента и подставить их в поля ввода."""
+        file_path = self.competitor_file_edit.text()
+        if not file_path:
+            QMessageBox.warning(self, "Ошибка", "Не выбран файл конкурента")
+            return
+
+        edits = self._source_column_edits()
+        competitor = CompetitorConfig(
+            name=self.competitor_combo.currentText(),
+            file_path=file_path,
+            source_columns=ColumnMapping(**{f: edit.text() for f, (_label, edit) in edits.items()}),
+            fuzzy_match_threshold=self.threshold_spin.value(),
+        )
+        detection = self.processor.detect_columns(competitor)
+        if detection is None:
+            QMessageBox.warning(self, "Ошибка", "Не удалось прочитать файл конкурента")
+            return
+
+        lines = []
+        for field, (label, edit) in edits.items():
+            confidence = detection.confidence.get(field, 0.0)
+            column = getattr(detection.mapping, field)
+            if field in detection.detected_fields():
+                edit.setText(column)
+                lines.append(f"{label}: {column} ({confidence:.0%})")
+            else:
+                lines.append(f"{label}: не найдено, оставлено {column}")
+            edit.setToolTip(f"Уверенность: {confidence:.0%}")
+
+        header = (
+            f"Заголовок: строки {detection.header_rows[0]}–{detection.header_rows[1]}"
+            if detection.header_rows[0] else "Заголовок не найден"
+        )
+        QMessageBox.information(
+            self, "Определение колонок",
+            f"{header}, данные со строки {detection.data_start_row}\n"
+            f"Совпадений с городами: {detection.city_hits}\n\n" + "\n".join(lines) +
+            "\n\nПроверьте колонки и сохраните конкурента."
+        )
+
     def save_competitor_config(self):
         """Сохранить настройки текущего конкурента."""
         current = self.competitor_combo.currentText()
@@ -728,6 +1472,7 @@ class MainWindow(QMainWindow):
         competitor.file_path = self.competitor_file_edit.text()
         competitor.enabled = self.competitor_enabled_check.isChecked()
         competitor.bold = self.competitor_bold_check.isChecked()
+        competitor.evaluate_formulas = self.competitor_formulas_check.isChecked()
 
         # Исходные колонки
         competitor.source_columns.city = self.src_city_edit.text()
@@ -755,8 +1500,28 @@ class MainWindow(QMainWindow):
         competitor.markups.weight_100 = self.markup_weight100_spin.value()
         competitor.markups.weight_3000 = self.markup_weight3000_spin.value()
 
-        # Порог
+        # Порог и вид доставки
         competitor.fuzzy_match_threshold = self.threshold_spin.value()
+        mode_column = self.mode_column_edit.text().strip().upper()
+        try:
+            if mode_column:
+                column_index_from_string(mode_column)
+            competitor.mode_column = mode_column
+        except ValueError:
+            QMessageBox.warning(self, "Ошибка", f"Неверная колонка вида доставки: '{mode_column}'")
+            self.mode_column_edit.setText(competitor.mode_column)
+
+        # Разбор цен
+        rules = competitor.normalization
+        rules.enabled = self.normalize_enabled_check.isChecked()
+        rules.decimal_comma = self.normalize_comma_check.isChecked()
+        rules.range_pick = self.normalize_range_combo.currentData()
+        # Числовые замены из config.json сохраняем, пустые — берём из поля
+        text_values = {text: value for text, value in rules.text_values.items() if value is not None}
+        for text in self.normalize_empty_edit.text().split(","):
+            if text.strip():
+                text_values[text.strip()] = None
+        rules.text_values = text_values
 
         # Строки наценок
         from src.models import MarkupRow
@@ -774,6 +1539,32 @@ class MainWindow(QMainWindow):
                     pass
         competitor.markup_rows = mk_rows
 
+        # Условия на строку города
+        rules = []
+        for i in range(self.conditions_table.rowCount()):
+            column_item = self.conditions_table.item(i, 0)
+            value_item = self.conditions_table.item(i, 2)
+            cities_item = self.conditions_table.item(i, 3)
+            if not column_item or not column_item.text().strip():
+                continue
+            operator = self.conditions_table.cellWidget(i, 1).currentData()
+            value = value_item.text().strip() if value_item else ""
+            if operator in ('in', 'not_in'):
+                value = [v.strip() for v in value.split(",") if v.strip()]
+            cities = cities_item.text() if cities_item else ""
+            rules.append(ConditionRule(
+                column=column_item.text().strip().upper(),
+                operator=operator,
+                value=value,
+                cities=[c.strip() for c in cities.split(",") if c.strip()],
+            ))
+        try:
+            CompiledConditions(rules)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", f"Условие не сохранено: {e}")
+            return
+        competitor.special_conditions = rules
+
         self.status_bar.showMessage(f"Настройки '{current}' сохранены", 3000)
         self.update_info_label()
 
@@ -810,6 +1601,28 @@ class MainWindow(QMainWindow):
         del self.config.cities[city]
         self.load_cities_to_table()
 
+    def add_condition_row(self, rule: ConditionRule):
+        """Добавить строку условия в таблицу."""
+        row = self.conditions_table.rowCount()
+        self.conditions_table.insertRow(row)
+        self.conditions_table.setItem(row, 0, QTableWidgetItem(rule.column))
+
+        operator_combo = QComboBox()
+        for key, label in OPERATORS.items():
+            operator_combo.addItem(label, key)
+        operator_combo.setCurrentIndex(max(0, operator_combo.findData(rule.operator)))
+        self.conditions_table.setCellWidget(row, 1, operator_combo)
+
+        value = ", ".join(map(str, rule.value)) if isinstance(rule.value, list) else str(rule.value)
+        self.conditions_table.setItem(row, 2, QTableWidgetItem(value))
+        self.conditions_table.setItem(row, 3, QTableWidgetItem(", ".join(rule.cities)))
+
+    def remove_condition_row(self):
+        """Удалить выбранное условие."""
+        current = self.conditions_table.currentRow()
+        if current >= 0:
+            self.conditions_table.removeRow(current)
+
     def add_markup_row(self):
         """Добавить строку наценки для текущего конкурента."""
         row = self.markup_rows_table.rowCount()
@@ -846,6 +1659,64 @@ class MainWindow(QMainWindow):
         self.config.city_aliases = new_aliases
         self.status_bar.showMessage("Города сохранены", 3000)
 
+    def load_alias_suggestions(self):
+        """Показать написания, принятые как города нечётким сравнением в последнем запуске."""
+        self.alias_suggestions = self.processor.alias_suggestions()
+        self.alias_review_table.setRowCount(len(self.alias_suggestions))
+        for row, suggestion in enumerate(self.alias_suggestions):
+            city_item = QTableWidgetItem(suggestion.city)
+            city_item.setFlags(city_item.flags() | Qt.ItemIsUserCheckable)
+            city_item.setCheckState(Qt.Checked)
+            self.alias_review_table.setItem(row, 0, city_item)
+            cells = [
+                suggestion.label, str(suggestion.score), suggestion.variant,
+                ", ".join(suggestion.competitors),
+            ]
+            for col, text in enumerate(cells, 1):
+                self.alias_review_table.setItem(row, col, QTableWidgetItem(text))
+        self.alias_review_table.resizeColumnsToContents()
+
+        if not self.alias_suggestions:
+            self.status_bar.showMessage("Новых написаний нет — запустите обработку", 5000)
+
+    def accept_alias_suggestions(self):
+        """Добавить отмеченные написания в псевдонимы городов."""
+        # Правки в таблице городов не теряются при её перезагрузке
+        self.save_cities()
+        accepted = [
+            suggestion for row, suggestion in enumerate(self.alias_suggestions)
+            if self.alias_review_table.item(row, 0).checkState() == Qt.Checked
+        ]
+        added = accept_aliases(self.config, accepted)
+        self.load_cities_to_table()
+        self.alias_suggestions = []
+        self.alias_review_table.setRowCount(0)
+        logger.info(f"Добавлено псевдонимов: {added}")
+        self.status_bar.showMessage(f"Добавлено псевдонимов: {added}", 5000)
+
+    def prune_stale_aliases(self):
+        """Удалить псевдонимы без совпадений в последних запусках и повторяющиеся."""
+        self.save_cities()
+        self.config.history.alias_stale_runs = self.alias_stale_spin.value()
+        stale = self.processor.stale_aliases(self.config.history.alias_stale_runs)
+        if not stale:
+            self.status_bar.showMessage("Устаревших псевдонимов нет", 5000)
+            return
+
+        listed = "\n".join(f"{city}: {', '.join(aliases)}" for city, aliases in stale.items())
+        answer = QMessageBox.question(
+            self, "Удалить псевдонимы",
+            f"Псевдонимы без совпадений в последних {self.config.history.alias_stale_runs} "
+            f"запусках или повторяющие другой вариант названия:\n\n{listed}\n\nУдалить?"
+        )
+        if answer != QMessageBox.Yes:
+            return
+
+        removed = remove_aliases(self.config, stale)
+        self.load_cities_to_table()
+        logger.info(f"Удалено псевдонимов: {removed}")
+        self.status_bar.showMessage(f"Удалено псевдонимов: {removed}", 5000)
+
     def load_cities_from_json(self):
         """Загрузить города из JSON файла."""
         file_path, _ = QFileDialog.getOpenFileName(
@@ -867,25 +1738,39 @@ class MainWindow(QMainWindow):
                 QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить файл: {e}")
 
     def preview_data(self):
-        """Предпросмотр данных конкурента."""
+        """Предпросмотр данных конкурента (страницы читаются в фоне)."""
         competitor_name = self.preview_competitor_combo.currentText()
         if not competitor_name or competitor_name not in self.config.competitors:
             return
 
         competitor = self.config.competitors[competitor_name]
-        data = self.processor.preview_data(competitor, max_rows=20)
+        if not competitor.file_path or not Path(competitor.file_path).exists():
+            QMessageBox.warning(self, "Ошибка", f"Файл не найден: {competitor.file_path}")
+            return
+
+        self.preview_status_label.setText("Чтение...")
+        self.preview_model.start(competitor.file_path, preview_columns(competitor))
 
-        self.preview_table.setRowCount(len(data))
+    def preview_goto_row(self):
+        """Прокрутить предпросмотр к строке (недостающие страницы дочитываются в фоне)."""
+        if not self.preview_model.started:
+            return
+        self.preview_status_label.setText(f"Чтение до строки {self.preview_row_spin.value()}...")
+        self.preview_model.ensure_row(self.preview_row_spin.value())
 
-        for i, row_data in enumerate(data):
-            self.preview_table.setItem(i, 0, QTableWidgetItem(str(row_data['row'])))
-            self.preview_table.setItem(i, 1, QTableWidgetItem(str(row_data.get('city', ''))))
-            self.preview_table.setItem(i, 2, QTableWidgetItem(str(row_data.get('convert', ''))))
-            self.preview_table.setItem(i, 3, QTableWidgetItem(str(row_data.get('minimum_1', ''))))
-            self.preview_table.setItem(i, 4, QTableWidgetItem(str(row_data.get('minimum_2', ''))))
-            self.preview_table.setItem(i, 5, QTableWidgetItem(str(row_data.get('volume', ''))))
-            self.preview_table.setItem(i, 6, QTableWidgetItem(str(row_data.get('weight_100', ''))))
-            self.preview_table.setItem(i, 7, QTableWidgetItem(str(row_data.get('weight_3000', ''))))
+    def on_preview_loaded(self, rows: int, finished: bool):
+        suffix = " (файл прочитан)" if finished else ""
+        self.preview_status_label.setText(f"Прочитано строк: {rows}{suffix}")
+
+    def on_preview_row_ready(self, row: int):
+        index = self.preview_model.index(row, 0)
+        self.preview_table.scrollTo(index, QTableView.ScrollHint.PositionAtTop)
+        self.preview_table.selectRow(row)
+
+    def on_preview_failed(self, error: str):
+        self.preview_status_label.setText("")
+        logger.error(f"Ошибка предпросмотра данных: {error}")
+        QMessageBox.warning(self, "Ошибка", f"Не удалось прочитать файл: {error}")
 
     def save_config(self):
         """Сохранить конфигурацию."""
@@ -928,17 +1813,35 @@ class MainWindow(QMainWindow):
         self.config.output_config.start_row = self.start_row_spin.value()
         self.config.output_config.include_average = self.include_average_check.isChecked()
         self.config.output_config.markups_sheet = self.markups_sheet_check.isChecked()
+        self.config.output_config.changes_report = self.changes_report_check.isChecked()
+        self.config.output_config.match_diagnostics = self.match_diagnostics_check.isChecked()
 
         # Собственная компания
         self.config.own_company.enabled = self.own_enabled_check.isChecked()
         self.config.own_company.name = self.own_name_edit.text()
+        self.config.own_company.fill_mode = self.own_fill_mode_combo.currentData()
         for field_key, spin in self.own_markup_fields.items():
             setattr(self.config.own_company.markups, field_key, spin.value())
 
+        # История цен
+        self.config.history.enabled = self.history_enabled_check.isChecked()
+        self.config.history.db_path = self.history_path_edit.text().strip()
+        self.config.history.alias_stale_runs = self.alias_stale_spin.value()
+
+        # Профилирование
+        self.config.profiling.enabled = self.profiling_check.isChecked()
+        self.config.profiling.cprofile = self.cprofile_check.isChecked()
+        self.config.profiling.memory = self.memory_profiling_check.isChecked()
+
+        # Сбор данных
+        self.config.processing.workers = self.workers_spin.value()
+
         self.save_config()
 
-        # Обновить процессор
+        # Обновить процессор (индексы поиска города остаются — устаревшие перестроятся)
+        city_lookup = self.processor.city_lookup
         self.processor = ExcelProcessor(self.config)
+        self.processor.city_lookup = city_lookup
 
         # Запустить обработку в отдельном потоке
         self.run_btn.setEnabled(False)
@@ -1007,18 +1910,97 @@ class MainWindow(QMainWindow):
             )
 
         self.status_bar.showMessage("Готово", 5000)
+        self.costing_btn.setEnabled(bool(self.processor.collected))
+
+    def run_costing(self):
+        """Рассчитать журнал отгрузок по тарифам последней обработки."""
+        csv_path, _ = QFileDialog.getOpenFileName(
+            self, "Журнал отгрузок", "", "CSV Files (*.csv)"
+        )
+        if not csv_path:
+            return
+        output_path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить итоги по городам", str(costing_csv_path(csv_path)), "CSV Files (*.csv)"
+        )
+        if not output_path:
+            return
+
+        self.costing_btn.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setMaximum(0)
+        self.status_bar.showMessage("Расчёт отгрузок...")
+
+        self.costing_thread = CostingThread(self.processor, csv_path, output_path)
+        self.costing_thread.finished.connect(
+            lambda result: self.on_costing_finished(result, output_path)
+        )
+        self.costing_thread.start()
+
+    def on_costing_finished(self, result, output_path: str):
+        """Расчёт отгрузок завершён."""
+        self.costing_btn.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        if result is None:
+            QMessageBox.warning(self, "Ошибка", "Не удалось рассчитать отгрузки, проверьте журнал")
+            return
+        QMessageBox.information(
+            self, "Расчёт отгрузок",
+            f"Строк: {result.total_rows}\n"
+            f"Городов: {len(result.cities)}\n"
+            f"Некорректных строк: {result.invalid_rows}\n"
+            f"Без найденного города: {result.unmatched_rows}\n\n"
+            f"Итоги сохранены в:\n{output_path}"
+        )
+        self.status_bar.showMessage("Готово", 5000)
 
 
 class QTextEditLogger(logging.Handler):
-    """Хэндлер для вывода логов в QTextEdit."""
+    """
+    Хэндлер для вывода логов в QTextEdit.
+
+    emit() может вызываться из любого потока (в т.ч. из ProcessingThread),
+    поэтому виджет в нём не трогаем: запись только кладётся в очередь.
+    Очередь разбирается таймером в GUI-потоке и выводится пачкой
+    одним append. Число строк в журнале ограничено max_lines.
+    """
+
+    FLUSH_INTERVAL_MS = 100
+    MAX_BATCH = 500
 
-    def __init__(self, text_edit: QTextEdit):
+    def __init__(self, text_edit: QTextEdit, max_lines: int = 5000):
         super().__init__()
         self.text_edit = text_edit
+        # Старые строки вытесняются самим документом
+        self.text_edit.document().setMaximumBlockCount(max_lines)
+        # deque.append потокобезопасен; при переполнении теряются самые старые записи,
+        # которые всё равно были бы вытеснены из журнала
+        self._queue: deque = deque(maxlen=max_lines)
+
+        # Таймер создаётся в GUI-потоке и срабатывает там же
+        self._timer = QTimer(text_edit)
+        self._timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self._timer.timeout.connect(self.flush_pending)
+        self._timer.start()
 
     def emit(self, record):
-        msg = self.format(record)
-        self.text_edit.append(msg)
+        # Форматирование откладывается до вывода — в рабочем потоке только append
+        self._queue.append(record)
+
+    def flush_pending(self):
+        """Вывести накопленные записи в виджет (вызывается в GUI-потоке)."""
+        if not self._queue:
+            return
+
+        lines = []
+        while self._queue and len(lines) < self.MAX_BATCH:
+            record = self._queue.popleft()
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+
+        if lines:
+            self.text_edit.append("\n".join(lines))
 
 
 def main():
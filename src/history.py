@@ -0,0 +1,254 @@
+"""
+История цен конкурентов в локальной базе SQLite.
+
+Каждый запуск дописывает исходные и наценённые значения с меткой запуска,
+времени, конкурента, города, поля и хэша исходного файла, а также принятые
+метки городов — по ним находятся давно не совпадавшие псевдонимы.
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Tuple, Callable
+import hashlib
+import logging
+import sqlite3
+
+from src.diagnostics import CityMatch
+from src.models import AppConfig, CompetitorConfig
+from src.pricing import is_number, marked_up_value
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_NAME = "price_history.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at  TEXT NOT NULL,
+    output_file TEXT
+);
+CREATE TABLE IF NOT EXISTS prices (
+    run_id      INTEGER NOT NULL REFERENCES runs(run_id),
+    recorded_at TEXT NOT NULL,
+    competitor  TEXT NOT NULL,
+    city        TEXT NOT NULL,
+    field       TEXT NOT NULL,
+    raw_value   REAL,
+    raw_text    TEXT,
+    value       REAL,
+    source_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_prices_city_field_time ON prices (city, field, recorded_at);
+CREATE INDEX IF NOT EXISTS idx_prices_competitor_time ON prices (competitor, recorded_at);
+CREATE TABLE IF NOT EXISTS city_matches (
+    run_id      INTEGER NOT NULL REFERENCES runs(run_id),
+    competitor  TEXT NOT NULL,
+    city        TEXT NOT NULL,
+    label       TEXT NOT NULL,
+    variant     TEXT NOT NULL,
+    score       INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_city_matches_run ON city_matches (run_id);
+"""
+
+
+def file_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 содержимого файла (пустая строка, если файл недоступен)."""
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    except OSError:
+        return ""
+    return digest.hexdigest()
+
+
+def resolve_db_path(config: AppConfig) -> Path:
+    """Путь к базе истории: из настроек или рядом с выходным файлом."""
+    if config.history.db_path:
+        return Path(config.history.db_path)
+    if config.output_file:
+        return Path(config.output_file).with_name(DEFAULT_DB_NAME)
+    return Path(DEFAULT_DB_NAME)
+
+
+class PriceHistoryStore:
+    """Хранилище истории цен."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def record_run(
+        self,
+        config: AppConfig,
+        competitors: Iterable[CompetitorConfig],
+        collected: Dict[str, Dict[str, Dict[str, Any]]],
+        started_at: Optional[str] = None,
+        fingerprint: Callable[[str], str] = file_hash,
+        matches: Iterable[CityMatch] = (),
+    ) -> int:
+        """
+        Записать данные запуска одной транзакцией.
+
+        fingerprint — функция хэша файла (по умолчанию file_hash; процессор передаёт
+        хэш по уже отображённому в память файлу). matches — принятые метки городов.
+
+        Returns:
+            run_id нового запуска
+        """
+        recorded_at = started_at or datetime.now().isoformat(timespec='seconds')
+
+        # Хэш считается один раз на файл, даже если он общий у нескольких конкурентов
+        hashes: Dict[str, str] = {}
+        # Наценённое значение — как в ячейке файла: без листа «Наценки» наценки нет
+        markups = config.output_config.markups_sheet
+        rows: List[Tuple[Any, ...]] = []
+        for competitor in competitors:
+            cities = collected.get(competitor.name)
+            if not cities:
+                continue
+            if competitor.file_path not in hashes:
+                hashes[competitor.file_path] = fingerprint(competitor.file_path)
+            source_hash = hashes[competitor.file_path]
+            for city, fields in cities.items():
+                for field, raw in fields.items():
+                    if raw is None:
+                        continue
+                    numeric = is_number(raw)
+                    rows.append((
+                        recorded_at, competitor.name, city, field,
+                        raw if numeric else None,
+                        None if numeric else str(raw),
+                        marked_up_value(competitor, field, raw, markups) if numeric else None,
+                        source_hash,
+                    ))
+
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (started_at, output_file) VALUES (?, ?)",
+                (recorded_at, config.output_file),
+            )
+            run_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO prices (run_id, recorded_at, competitor, city, field, "
+                "raw_value, raw_text, value, source_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, *row) for row in rows],
+            )
+            self.conn.executemany(
+                "INSERT INTO city_matches (run_id, competitor, city, label, variant, score) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, m.competitor, m.city, m.label, m.variant, m.score) for m in matches],
+            )
+
+        logger.info(f"История цен: запуск {run_id}, записано значений {len(rows)} ({self.db_path})")
+        return run_id
+
+    def runs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Последние запуски."""
+        cursor = self.conn.execute(
+            "SELECT run_id, started_at, output_file FROM runs ORDER BY run_id DESC LIMIT ?",
+            (limit,),
+        )
+        return [
+            {'run_id': run_id, 'started_at': started_at, 'output_file': output_file}
+            for run_id, started_at, output_file in cursor.fetchall()
+        ]
+
+    def recent_matches(self, runs: int) -> Tuple[int, List[CityMatch]]:
+        """
+        Принятые метки городов за последние запуски с записанными метками.
+
+        Returns:
+            (число найденных запусков, метки)
+        """
+        run_ids = [
+            run_id for (run_id,) in self.conn.execute(
+                "SELECT DISTINCT run_id FROM city_matches ORDER BY run_id DESC LIMIT ?", (runs,)
+            )
+        ]
+        if not run_ids:
+            return 0, []
+        cursor = self.conn.execute(
+            "SELECT competitor, city, label, variant, score FROM city_matches WHERE run_id >= ?",
+            (min(run_ids),),
+        )
+        return len(run_ids), [CityMatch(*row) for row in cursor]
+
+    def price_series(
+        self,
+        city: str,
+        field: str,
+        competitor: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Динамика цены поля в городе (индекс city, field, recorded_at).
+
+        since/until — границы времени в ISO формате (включительно).
+        """
+        query = (
+            "SELECT recorded_at, run_id, competitor, raw_value, raw_text, value FROM prices "
+            "WHERE city = ? AND field = ?"
+        )
+        params: List[Any] = [city, field]
+        if since:
+            query += " AND recorded_at >= ?"
+            params.append(since)
+        if until:
+            query += " AND recorded_at <= ?"
+            params.append(until)
+        if competitor:
+            query += " AND competitor = ?"
+            params.append(competitor)
+        query += " ORDER BY recorded_at"
+        return [
+            {
+                'recorded_at': recorded_at, 'run_id': run_id, 'competitor': comp,
+                'raw_value': raw_value if raw_value is not None else raw_text, 'value': value,
+            }
+            for recorded_at, run_id, comp, raw_value, raw_text, value
+            in self.conn.execute(query, params)
+        ]
+
+    def competitor_history(
+        self,
+        competitor: str,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Все значения конкурента за период (индекс competitor, recorded_at)."""
+        query = (
+            "SELECT recorded_at, run_id, city, field, raw_value, raw_text, value FROM prices "
+            "WHERE competitor = ?"
+        )
+        params: List[Any] = [competitor]
+        if since:
+            query += " AND recorded_at >= ?"
+            params.append(since)
+        if until:
+            query += " AND recorded_at <= ?"
+            params.append(until)
+        query += " ORDER BY recorded_at"
+        return [
+            {
+                'recorded_at': recorded_at, 'run_id': run_id, 'city': city, 'field': field,
+                'raw_value': raw_value if raw_value is not None else raw_text, 'value': value,
+            }
+            for recorded_at, run_id, city, field, raw_value, raw_text, value
+            in self.conn.execute(query, params)
+        ]
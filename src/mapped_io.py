@@ -0,0 +1,145 @@
+"""
+Чтение входных файлов через отображение в память (mmap, только чтение).
+
+Файл конкурента отображается один раз за запуск: хэш (отпечаток), определение
+колонок и извлечение данных читают его из одной и той же области, а ОС подгружает
+страницы по мере надобности. Для openpyxl/zipfile каждый проход получает свой
+читатель с собственной позицией поверх общего отображения.
+"""
+from pathlib import Path
+from typing import Dict, Optional
+import hashlib
+import io
+import logging
+import mmap
+import os
+
+logger = logging.getLogger(__name__)
+
+# Размер блока для хэширования (срез memoryview, без копирования)
+_HASH_BLOCK = 4 * 1024 * 1024
+
+
+class MappedReader(io.RawIOBase):
+    """Файловый объект с собственной позицией поверх общего отображения."""
+
+    def __init__(self, mapped: 'MappedFile'):
+        super().__init__()
+        self._mapped = mapped
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._mapped.size + offset
+        else:
+            raise ValueError(f"Неверный whence: {whence}")
+        if pos < 0:
+            raise ValueError("Отрицательная позиция")
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer) -> int:
+        start = min(self._pos, self._mapped.size)
+        end = min(start + len(buffer), self._mapped.size)
+        count = end - start
+        if count:
+            # Временный срез отображения копируется прямо в буфер вызывающего
+            with memoryview(self._mapped.region) as view:
+                buffer[:count] = view[start:end]
+        self._pos = end
+        return count
+
+
+class MappedFile:
+    """Один файл, отображённый в память только для чтения."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # Пустой файл отобразить нельзя — для него обычный пустой буфер
+        self.region = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        )
+        self._fingerprint: Optional[str] = None
+
+    def reader(self) -> MappedReader:
+        """Новый читатель с позицией 0 (для openpyxl.load_workbook и zipfile)."""
+        return MappedReader(self)
+
+    @property
+    def fingerprint(self) -> str:
+        """SHA-256 содержимого (считается один раз)."""
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            with memoryview(self.region) as view:
+                for start in range(0, self.size, _HASH_BLOCK):
+                    digest.update(view[start:start + _HASH_BLOCK])
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def close(self):
+        """
+        Закрыть отображение и файл.
+
+        Если на отображение ещё есть ссылки (BufferError), файл всё равно закрывается:
+        отображение держит свою копию дескриптора и освобождается вместе с последней ссылкой.
+        """
+        try:
+            if isinstance(self.region, mmap.mmap):
+                self.region.close()
+        finally:
+            self._file.close()
+
+
+class MappedFiles:
+    """Отображения файлов запуска: каждый файл отображается один раз до close_all()."""
+
+    def __init__(self):
+        self._files: Dict[str, MappedFile] = {}
+
+    def get(self, path: str) -> MappedFile:
+        key = os.path.abspath(path)
+        mapped = self._files.get(key)
+        if mapped is None:
+            mapped = self._files[key] = MappedFile(key)
+        return mapped
+
+    def reader(self, path: str) -> MappedReader:
+        return self.get(path).reader()
+
+    def fingerprint(self, path: str) -> str:
+        """Отпечаток файла (пустая строка, если файл недоступен)."""
+        try:
+            return self.get(path).fingerprint
+        except OSError:
+            return ""
+
+    def close_all(self):
+        """Закрыть все отображения (файлы снова можно заменять, в т.ч. в Windows)."""
+        for mapped in self._files.values():
+            try:
+                mapped.close()
+            except BufferError as e:
+                logger.debug(f"Отображение {mapped.path} ещё используется: {e}")
+        self._files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close_all()
+        return False
@@ -0,0 +1,240 @@
+"""
+Пакетная оценка совпадения названий (WRatio) по заранее подготовленным меткам.
+
+fuzz.WRatio из thefuzz каждый раз нормализует обе строки (full_process) и
+вызывает WRatio из rapidfuzz. Здесь метки нормализуются один раз, а запрос
+оценивается против всех меток одним вызовом rapidfuzz — оценки те же, что дал бы
+fuzz.WRatio(запрос, метка) для каждой метки по отдельности.
+
+Для колонок с большим числом меток TrigramIndex отбирает кандидатов по общим
+триграммам, и полный WRatio считается только для них.
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+
+from rapidfuzz import fuzz as rfuzz, process as rprocess
+from thefuzz import utils
+
+# Префильтр по триграммам точен, пока порог выше вклада partial_token_ratio
+# (100 × 0.95 × 0.9 = 85.5): при пороге ниже короткие общие слова дают оценку
+# без общих триграмм, и метки оцениваются полным перебором
+PREFILTER_MIN_THRESHOLD = 87
+# Индекс триграмм строится для колонок не меньше чем с таким числом меток и когда
+# запросов к колонке (городов с псевдонимами) достаточно, чтобы окупить построение
+PREFILTER_MIN_LABELS = 2000
+PREFILTER_MIN_QUERIES = 20
+
+
+def prepare(text: object) -> str:
+    """Нормализовать строку так же, как fuzz.WRatio (full_process, force_ascii)."""
+    return utils.full_process(str(text), force_ascii=True)
+
+
+def wratio_scores(query: str, choices: Sequence[str], cutoff: int = 0) -> List[Tuple[int, int]]:
+    """
+    Оценки WRatio запроса против подготовленных меток.
+
+    Args:
+        query: подготовленный запрос (prepare)
+        choices: подготовленные метки (prepare)
+        cutoff: минимальная оценка (%), как при сравнении fuzz.WRatio(...) >= cutoff
+
+    Returns:
+        [(номер метки, оценка)] для меток с оценкой не ниже cutoff, по порядку меток
+    """
+    if not query or not choices:
+        return []
+    # fuzz.WRatio округляет результат — отсекаем с запасом и сравниваем уже округлённое
+    matches = rprocess.extract(
+        query, choices, scorer=rfuzz.WRatio, processor=None,
+        score_cutoff=max(0.0, cutoff - 0.5), limit=None,
+    )
+    scored = [(index, int(round(score))) for _, score, index in matches]
+    return sorted((index, score) for index, score in scored if score >= cutoff)
+
+
+def best_wratio(query: str, choices: Sequence[str], cutoff: int = 0) -> Optional[Tuple[int, int]]:
+    """
+    Лучшая оценка WRatio запроса среди подготовленных меток (один вызов rapidfuzz).
+
+    Returns:
+        (номер метки, оценка) или None, если ни одна метка не достигла cutoff
+    """
+    if not query or not choices:
+        return None
+    match = rprocess.extractOne(
+        query, choices, scorer=rfuzz.WRatio, processor=None, score_cutoff=max(0.0, cutoff - 0.5)
+    )
+    if match is None:
+        return None
+    _, score, index = match
+    score = int(round(score))
+    return (index, score) if score >= cutoff else None
+
+
+def _trigrams(text: str) -> Counter:
+    """
+    Триграммы слов строки, каждое слово дополнено пробелами по краям.
+
+    У слова из L символов ровно L триграмм, от порядка слов они не зависят,
+    а одна вставка или удаление символа разрушает не больше трёх из них.
+    """
+    grams: Counter = Counter()
+    for token in text.split():
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(token)))
+    return grams
+
+
+def _shape(text: str) -> Tuple[int, int, int, int, int]:
+    """
+    Длины строки, от которых зависят компоненты WRatio.
+
+    Returns:
+        (длина, символов в словах, длина слов через пробел,
+        символов в различных словах, длина различных слов через пробел)
+    """
+    tokens = text.split()
+    chars = sum(len(t) for t in tokens)
+    distinct = set(tokens)
+    distinct_chars = sum(len(t) for t in distinct)
+    return (
+        len(text), chars, chars + len(tokens) - 1,
+        distinct_chars, distinct_chars + len(distinct) - 1,
+    )
+
+
+def _edits(similarity: float, length: int) -> int:
+    """Наибольшее расстояние Indel при нормированном сходстве не ниже similarity."""
+    return math.floor((1 - similarity) * length + 1e-9)
+
+
+def _required_overlap(query: Tuple, label: Tuple, raw_cutoff: float) -> int:
+    """
+    Необходимое число общих триграмм, чтобы WRatio мог достичь raw_cutoff.
+
+    Каждая компонента WRatio — сходство Indel двух строк, собранных из слов
+    запроса и метки (или подстроки метки для partial_ratio). При расстоянии d
+    у таких строк остаётся не меньше (символов в словах − 3·d) общих триграмм,
+    а у исходных строк их не меньше. Берётся минимум по компонентам, которые
+    при этих длинах могут дать оценку не ниже raw_cutoff.
+    """
+    n, chars1, joined1, set_chars1, set_joined1 = query
+    m, chars2, joined2, set_chars2, set_joined2 = label
+    # ratio
+    need = max(chars1, chars2) - 3 * _edits(raw_cutoff / 100, n + m)
+    len_ratio = max(n, m) / min(n, m)
+    if len_ratio < 1.5:
+        similarity = raw_cutoff / 95
+        if similarity <= 1:
+            need = min(
+                need,
+                # token_sort_ratio
+                max(chars1, chars2) - 3 * _edits(similarity, joined1 + joined2),
+                # token_set_ratio: слова одной строки входят в другую (оценка 100)
+                min(set_chars1, set_chars2),
+                # token_set_ratio: общие слова против общих + отличающихся
+                set_chars1 - 3 * _edits(similarity, 2 * set_joined1),
+                set_chars2 - 3 * _edits(similarity, 2 * set_joined2),
+                max(set_chars1, set_chars2) - 3 * _edits(similarity, set_joined1 + set_joined2),
+            )
+    elif len_ratio <= 8 and raw_cutoff <= 90:
+        # partial_ratio: короче строка против подстроки длинной; края подстроки
+        # добавляют не больше двух триграмм, которых нет в исходной строке
+        short_chars = chars1 if n < m else chars2 if m < n else min(chars1, chars2)
+        need = min(need, short_chars - 3 * _edits(raw_cutoff / 90, 2 * min(n, m)) - 2)
+    return need
+
+
+class TrigramIndex:
+    """
+    Обратный индекс триграмм по подготовленным меткам — строится один раз на колонку.
+
+    Для запроса полный WRatio считается только по меткам, у которых общих
+    триграмм не меньше необходимого для порога; результат совпадает с
+    wratio_scores по всем меткам при пороге не ниже PREFILTER_MIN_THRESHOLD.
+    """
+
+    def __init__(self, choices: Sequence[str]):
+        self.choices = choices
+        self.postings: Dict[str, List[int]] = {}
+        postings = self.postings
+        # Метки с одинаковыми длинами (_shape) проверяются по общему порогу пересечения
+        self.shapes: List[Tuple] = []
+        self.by_shape: List[List[int]] = []
+        self.shape_of: List[int] = []
+        shape_ids: Dict[Tuple, int] = {}
+        for i, text in enumerate(choices):
+            if not text.strip():
+                # Пустая метка: WRatio = 0, в кандидаты не попадает
+                self.shape_of.append(-1)
+                continue
+            shape = _shape(text)
+            shape_id = shape_ids.get(shape)
+            if shape_id is None:
+                shape_id = shape_ids[shape] = len(self.shapes)
+                self.shapes.append(shape)
+                self.by_shape.append([])
+            self.shape_of.append(shape_id)
+            self.by_shape[shape_id].append(i)
+            grams = {
+                padded[j:j + 3]
+                for padded in (f" {token} " for token in text.split())
+                for j in range(len(padded) - 2)
+            }
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+
+    def candidates(self, query: str, cutoff: int) -> List[int]:
+        """Номера меток, которые могут иметь оценку WRatio не ниже cutoff (по порядку)."""
+        if not query.strip():
+            return []
+        query_shape = _shape(query)
+        raw_cutoff = cutoff - 0.5  # fuzz.WRatio округляет результат
+        need = [_required_overlap(query_shape, shape, raw_cutoff) for shape in self.shapes]
+
+        found = set()
+        # Метки, которым при своих длинах общие триграммы не нужны
+        for shape_id, required in enumerate(need):
+            if required <= 0:
+                found.update(self.by_shape[shape_id])
+
+        positive = [required for required in need if required > 0]
+        if positive:
+            # Самые частые триграммы с общим весом меньше наименьшего необходимого
+            # пересечения не перебираются: у каждого кандидата есть хотя бы одна из
+            # остальных, а их вес добавляется к пересечению как запас
+            grams = sorted(
+                _trigrams(query).items(), key=lambda item: -len(self.postings.get(item[0], ()))
+            )
+            slack = 0
+            while grams and slack + grams[0][1] < min(positive):
+                slack += grams.pop(0)[1]
+
+            # Верхняя оценка пересечения: вес триграммы запроса для каждой метки, где она есть
+            overlap: Counter = Counter()
+            for gram, count in grams:
+                posting = self.postings.get(gram)
+                if posting:
+                    for _ in range(count):
+                        overlap.update(posting)
+            shape_of = self.shape_of
+            found.update(i for i, shared in overlap.items() if shared + slack >= need[shape_of[i]])
+        return sorted(found)
+
+    def scores(self, query: str, cutoff: int, all_candidates: bool = False) -> List[Tuple[int, int]]:
+        """
+        Оценки WRatio запроса по кандидатам — как wratio_scores(query, choices, cutoff).
+
+        Args:
+            all_candidates: вернуть оценки всех кандидатов, в том числе ниже cutoff
+                (для диагностики — ближайшие метки среди прошедших префильтр)
+        """
+        order = self.candidates(query, cutoff)
+        if len(order) * 2 > len(self.choices):
+            # Префильтр почти ничего не отсеял — дешевле оценить все метки разом
+            return wratio_scores(query, self.choices, 0 if all_candidates else cutoff)
+        subset = [self.choices[i] for i in order]
+        scored = wratio_scores(query, subset, 0 if all_candidates else cutoff)
+        return [(order[j], score) for j, score in scored]
@@ -2,7 +2,7 @@
 Модели данных для конфигурации анализа.
 """
 from dataclasses import dataclass, field, asdict
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import json
 from pathlib import Path
 
@@ -43,18 +43,37 @@ class Markups:
     weight_3000: float = 0.0  # Наценка на вес 3000 (%)
 
 
+@dataclass
+class NormalizationRules:
+    """Правила разбора строковых цен конкурента в числа."""
+    enabled: bool = True
+    decimal_comma: bool = True     # «1,5» — это 1.5, «1.200» — 1200 (иначе наоборот)
+    range_pick: str = "first"      # Что брать из «14/3080», «350-500»: first / last / min / max
+    text_values: Dict[str, Optional[float]] = field(default_factory=dict)  # «договорная»: None
+    ignore_words: List[str] = field(default_factory=list)  # Доп. слова рядом с числом («за кг»)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'NormalizationRules':
+        return cls(**{k: v for k, v in data.items() if k in asdict(cls()).keys()})
+
+
 @dataclass
 class OwnCompany:
     """Собственная компания — строка после среднего значения."""
     name: str = "Новая Витэка"
     enabled: bool = True
     markups: Markups = field(default_factory=Markups)
+    fill_mode: str = "formula"  # formula — ссылки на среднее и «Наценки», value — готовые числа
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             'name': self.name,
             'enabled': self.enabled,
             'markups': asdict(self.markups),
+            'fill_mode': self.fill_mode,
         }
 
     @classmethod
@@ -63,6 +82,7 @@ class OwnCompany:
             name=data.get('name', 'Новая Витэка'),
             enabled=data.get('enabled', True),
             markups=Markups(**data.get('markups', {})),
+            fill_mode=data.get('fill_mode', 'formula'),
         )
 
 
@@ -80,6 +100,36 @@ class MarkupRow:
         return cls(name=data.get('name', ''), percent=data.get('percent', 0.0))
 
 
+@dataclass
+class ConditionRule:
+    """Условие на строку города: значение другой колонки той же строки (например, «Авто»)."""
+    column: str = "B"
+    operator: str = "eq"  # eq / ne / in / not_in / contains / not_contains / regex / empty / not_empty / gt / ge / lt / le
+    value: Any = ""       # Для in / not_in — список значений
+    cities: List[str] = field(default_factory=list)  # Пусто — условие для всех городов
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ConditionRule':
+        return cls(**{k: v for k, v in data.items() if k in asdict(cls()).keys()})
+
+    @classmethod
+    def list_from_data(cls, data: Any, competitor_name: str) -> List['ConditionRule']:
+        """
+        Правила из config.json.
+
+        Старый формат — словарь: непустой словарь у «Энергии» включал проверку
+        «Авто» в колонке B для Владивостока, она переносится в правило.
+        """
+        if isinstance(data, list):
+            return [cls.from_dict(item) for item in data]
+        if data and competitor_name == "Энергия":
+            return [cls(column="B", operator="eq", value="Авто", cities=["Владивосток"])]
+        return []
+
+
 @dataclass
 class CompetitorConfig:
     """Конфигурация конкурента."""
@@ -91,9 +141,12 @@ class CompetitorConfig:
     target_columns: ColumnMapping = field(default_factory=ColumnMapping)
     row_offsets: RowOffsets = field(default_factory=RowOffsets)
     fuzzy_match_threshold: int = 95
+    evaluate_formulas: bool = True  # Вычислять формулы, сохранённые без результата
     markups: Markups = field(default_factory=Markups)
-    special_conditions: Dict[str, Any] = field(default_factory=dict)
+    special_conditions: List[ConditionRule] = field(default_factory=list)  # Условия на строку города
+    mode_column: str = ""  # Колонка вида доставки (авто/авиа/ЖД); пусто — город без видов
     markup_rows: List[MarkupRow] = field(default_factory=list)  # Дополнительные строки с наценками
+    normalization: NormalizationRules = field(default_factory=NormalizationRules)
 
     def to_dict(self) -> Dict[str, Any]:
         """Преобразовать в словарь."""
@@ -107,8 +160,11 @@ class CompetitorConfig:
             'row_offsets': asdict(self.row_offsets),
             'markups': asdict(self.markups),
             'fuzzy_match_threshold': self.fuzzy_match_threshold,
-            'special_conditions': self.special_conditions,
+            'evaluate_formulas': self.evaluate_formulas,
+            'special_conditions': [r.to_dict() for r in self.special_conditions],
+            'mode_column': self.mode_column,
             'markup_rows': [r.to_dict() for r in self.markup_rows],
+            'normalization': self.normalization.to_dict(),
         }
 
     @classmethod
@@ -124,8 +180,13 @@ class CompetitorConfig:
             row_offsets=RowOffsets(**data.get('row_offsets', {})),
             markups=Markups(**data.get('markups', {})),
             fuzzy_match_threshold=data.get('fuzzy_match_threshold', 95),
-            special_conditions=data.get('special_conditions', {}),
+            evaluate_formulas=data.get('evaluate_formulas', True),
+            special_conditions=ConditionRule.list_from_data(
+                data.get('special_conditions', []), data['name']
+            ),
+            mode_column=data.get('mode_column', ''),
             markup_rows=[MarkupRow.from_dict(r) for r in data.get('markup_rows', [])],
+            normalization=NormalizationRules.from_dict(data.get('normalization', {})),
         )
 
 
@@ -139,6 +200,9 @@ class OutputConfig:
     include_average: bool = True
     average_row_offset: int = 1
     markups_sheet: bool = True
+    changes_report: bool = True  # Лист «Изменения» и CSV относительно прошлого запуска
+    match_diagnostics: bool = True  # Лист «Диагностика» и JSON с лучшими кандидатами городов
+    diagnostics_top_k: int = 3      # Сколько кандидатов сохранять для пары город/конкурент
 
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
@@ -148,6 +212,49 @@ class OutputConfig:
         return cls(**{k: v for k, v in data.items() if k in asdict(cls()).keys()})
 
 
+@dataclass
+class ProfilingConfig:
+    """Настройки профилирования запуска."""
+    enabled: bool = False   # Замер времени этапов process_all
+    cprofile: bool = False  # Дополнительно сохранить дамп cProfile (.pstats)
+    memory: bool = False    # Пик памяти и места выделения по этапам (tracemalloc + RSS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ProfilingConfig':
+        return cls(**{k: v for k, v in data.items() if k in asdict(cls()).keys()})
+
+
+@dataclass
+class HistoryConfig:
+    """Настройки истории цен (SQLite)."""
+    enabled: bool = True
+    db_path: str = ""  # Пусто — price_history.sqlite рядом с выходным файлом
+    alias_stale_runs: int = 10  # Псевдоним без совпадений в стольких запусках подряд — устаревший
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HistoryConfig':
+        return cls(**{k: v for k, v in data.items() if k in asdict(cls()).keys()})
+
+
+@dataclass
+class ProcessingConfig:
+    """Настройки сбора данных."""
+    workers: int = 1  # Процессов для сбора данных конкурентов (1 — без параллельности)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ProcessingConfig':
+        return cls(**{k: v for k, v in data.items() if k in asdict(cls()).keys()})
+
+
 @dataclass
 class AppConfig:
     """Общая конфигурация приложения."""
@@ -156,8 +263,12 @@ class AppConfig:
     competitors: Dict[str, CompetitorConfig] = field(default_factory=dict)
     cities: Dict[str, int] = field(default_factory=dict)          # Город: номер строки в выходе
     city_aliases: Dict[str, List[str]] = field(default_factory=dict)  # Город: [псевдонимы]
+    delivery_modes: Dict[str, List[str]] = field(default_factory=dict)  # Вид доставки: [написания в файлах]
     output_config: OutputConfig = field(default_factory=OutputConfig)
     own_company: OwnCompany = field(default_factory=OwnCompany)
+    profiling: ProfilingConfig = field(default_factory=ProfilingConfig)
+    history: HistoryConfig = field(default_factory=HistoryConfig)
+    processing: ProcessingConfig = field(default_factory=ProcessingConfig)
 
     def get_city_names(self, city: str) -> List[str]:
         """Вернуть все варианты написания города (основное + псевдонимы)."""
@@ -171,8 +282,12 @@ class AppConfig:
             'competitors': {name: comp.to_dict() for name, comp in self.competitors.items()},
             'cities': self.cities,
             'city_aliases': self.city_aliases,
+            'delivery_modes': self.delivery_modes,
             'output_config': self.output_config.to_dict(),
             'own_company': self.own_company.to_dict(),
+            'profiling': self.profiling.to_dict(),
+            'history': self.history.to_dict(),
+            'processing': self.processing.to_dict(),
         }
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
@@ -195,7 +310,11 @@ class AppConfig:
             },
             cities=data.get('cities', {}),
             city_aliases=data.get('city_aliases', {}),
+            delivery_modes=data.get('delivery_modes', {}),
             output_config=OutputConfig.from_dict(data.get('output_config', {})),
             own_company=OwnCompany.from_dict(data['own_company']) if 'own_company' in data else OwnCompany(),
+            profiling=ProfilingConfig.from_dict(data.get('profiling', {})),
+            history=HistoryConfig.from_dict(data.get('history', {})),
+            processing=ProcessingConfig.from_dict(data.get('processing', {})),
         )
 
@@ -0,0 +1,194 @@
+"""
+Нормализация цен: разбор строковых значений ячеек в числа.
+
+Конкуренты пишут цены как «1 200 р.», «от 350», «1,5», «14/3080» или «договорная».
+Ячейка с неоднозначной записью числа («12,500.00», «1 23») или с несколькими числами,
+не образующими диапазон («100 р. 200 р.»), не разбирается, а отмечается. Разбор выполняется
+одним проходом по всем собранным данным после сбора, каждая уникальная строка
+разбирается один раз (кэш строка → число).
+"""
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+import logging
+import re
+
+from src.models import CompetitorConfig, NormalizationRules
+from src.pricing import is_number
+
+logger = logging.getLogger(__name__)
+
+# Слова и знаки, которые могут окружать число и не мешают разбору
+DEFAULT_IGNORE_WORDS = ['от', 'до', 'р', 'руб', 'рублей', 'коп', '₽', 'rub', 'кг', 'куб']
+
+# Число с разделителями внутри: «1200», «1,5», «1.200»; «12,500.00» разбирается и отклоняется
+_NUMBER_RE = re.compile(r'-?\d+(?:[.,]\d+)*')
+# Число, разбитое пробелами (в т.ч. неразрывными) на группы разрядов: «1 200», «12 500 000»
+_THOUSANDS_RE = re.compile(r'(?<![\d.,])\d{1,3}(?:[\s  ]\d{3})+(?!\d)')
+_GROUP_SPACE_RE = re.compile(r'[\s  ]')
+# Дефис между числами — диапазон «350-500», «350 - 500», а не знак минус
+_RANGE_DASH_RE = re.compile(r'(?<=\d)\s*-\s*(?=\d)')
+# Единицы с цифрой в названии убираются до поиска чисел, иначе «3» из «м3» станет числом
+_UNITS_RE = re.compile(r'(?<![a-zа-яё])[мm][3³](?![a-zа-яё0-9])')
+_SEPARATORS_RE = re.compile(r'[\s.,;:/\\\-–—()]+')
+# Что может стоять между числами диапазона: «350–500», «14/3080», «от 350 до 500»
+_RANGE_MARKS = set('–—-/')
+_RANGE_WORDS = {'до'}
+
+# Результат разбора: (значение, успешно)
+ParseResult = Tuple[Any, bool]
+
+
+def _to_number(token: str, decimal_comma: bool) -> Optional[Any]:
+    """
+    Число из записи с одним разделителем или без него; None — запись неоднозначна.
+
+    Разделитель, который по правилам не десятичный («.» при десятичной запятой,
+    «,» без неё), допускается только между тысячами: «1.200» — 1200. Записи
+    с двумя разделителями («12,500.00», «1.200.000») не разбираются.
+    """
+    digits = token.lstrip('-')
+    sign = -1 if digits != token else 1
+    separators = [c for c in digits if c in '.,']
+    if not separators:
+        return sign * int(digits)
+    if len(separators) > 1:
+        return None
+
+    whole, fraction = re.split(r'[.,]', digits)
+    grouping = '.' if decimal_comma else ','
+    if separators[0] == grouping:
+        if len(fraction) == 3 and len(whole) <= 3 and not whole.startswith('0'):
+            return sign * int(whole + fraction)
+        if not decimal_comma:
+            return None
+    return sign * float(f"{whole}.{fraction}")
+
+
+@dataclass
+class NormalizationIssue:
+    """Значение, которое не удалось разобрать в число."""
+    competitor: str
+    city: str
+    field: str
+    value: Any
+
+
+class PriceNormalizer:
+    """Разбор строковых цен по правилам конкурента с кэшированием результатов."""
+
+    def __init__(self):
+        # Кэш на набор правил: {ключ правил: {строка: результат}}
+        self._caches: Dict[Tuple, Dict[str, ParseResult]] = {}
+
+    @staticmethod
+    def _rules_key(rules: NormalizationRules) -> Tuple:
+        return (
+            rules.decimal_comma,
+            rules.range_pick,
+            tuple(sorted(rules.text_values.items(), key=lambda kv: kv[0])),
+            tuple(rules.ignore_words),
+        )
+
+    def parse(self, text: str, rules: NormalizationRules) -> ParseResult:
+        """Разобрать одну строку (с кэшем)."""
+        cache = self._caches.setdefault(self._rules_key(rules), {})
+        result = cache.get(text)
+        if result is None:
+            result = self._parse(text, rules)
+            cache[text] = result
+        return result
+
+    @staticmethod
+    def _parse(text: str, rules: NormalizationRules) -> ParseResult:
+        s = text.strip().lower()
+        if not s:
+            return None, True
+
+        text_values = {k.strip().lower(): v for k, v in rules.text_values.items()}
+        if s in text_values:
+            return text_values[s], True
+
+        s = _UNITS_RE.sub(' ', s)
+        s = _THOUSANDS_RE.sub(lambda m: _GROUP_SPACE_RE.sub('', m.group()), s)
+        s = _RANGE_DASH_RE.sub('–', s)
+
+        matches = list(_NUMBER_RE.finditer(s))
+        if not matches:
+            return text, False
+
+        # Всё, кроме чисел, разделителей и разрешённых слов, — признак нечисловой ячейки
+        rest = _SEPARATORS_RE.split(_NUMBER_RE.sub(' ', s))
+        allowed = set(DEFAULT_IGNORE_WORDS) | {w.lower() for w in rules.ignore_words}
+        if any(word and word not in allowed for word in rest):
+            return text, False
+
+        # Несколько чисел — только диапазон, а не «1 23» или «100 р. 200 р.»
+        for left, right in zip(matches, matches[1:]):
+            gap = s[left.end():right.start()]
+            if not (_RANGE_MARKS & set(gap) or _RANGE_WORDS & set(_SEPARATORS_RE.split(gap))):
+                return text, False
+
+        values = [_to_number(m.group(), rules.decimal_comma) for m in matches]
+        if any(value is None for value in values):
+            return text, False
+        if rules.range_pick == 'last':
+            value = values[-1]
+        elif rules.range_pick == 'min':
+            value = min(values)
+        elif rules.range_pick == 'max':
+            value = max(values)
+        else:
+            value = values[0]
+        return value, True
+
+    def normalize_collected(
+        self,
+        collected: Dict[str, Dict[str, Dict[str, Any]]],
+        competitors: Iterable[CompetitorConfig],
+    ) -> Tuple[Dict[str, Dict[str, Dict[str, Any]]], List[NormalizationIssue]]:
+        """
+        Разобрать строковые значения во всех собранных данных.
+
+        Неразобранные значения остаются строками и возвращаются списком issues.
+
+        Returns:
+            (нормализованные данные, неразобранные значения)
+        """
+        issues: List[NormalizationIssue] = []
+        normalized: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        by_name = {c.name: c for c in competitors}
+
+        for name, cities in collected.items():
+            competitor = by_name.get(name)
+            rules = competitor.normalization if competitor else NormalizationRules()
+            if not rules.enabled:
+                normalized[name] = cities
+                continue
+
+            # Разобрать каждую уникальную строку конкурента один раз
+            unique = {
+                value for fields in cities.values() for value in fields.values()
+                if isinstance(value, str)
+            }
+            parsed = {text: self.parse(text, rules) for text in unique}
+
+            result: Dict[str, Dict[str, Any]] = {}
+            for city, fields in cities.items():
+                row: Dict[str, Any] = {}
+                for field, value in fields.items():
+                    if isinstance(value, str):
+                        value, ok = parsed[value]
+                        if not ok:
+                            issues.append(NormalizationIssue(name, city, field, value))
+                    elif not (value is None or is_number(value)):
+                        # Даты, bool и прочие типы openpyxl — в строку, как их покажет Excel
+                        value = str(value)
+                        issues.append(NormalizationIssue(name, city, field, value))
+                    row[field] = value
+                result[city] = row
+            normalized[name] = result
+
+        if issues:
+            examples = ", ".join(f"{i.competitor}/{i.city}/{i.field}: '{i.value}'" for i in issues[:5])
+            logger.warning(f"Не удалось разобрать как число значений: {len(issues)} ({examples})")
+        return normalized, issues
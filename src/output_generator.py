@@ -1,16 +1,22 @@
 """
 Модуль для автоматической генерации выходного Excel файла.
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 import logging
 
+from src.diagnostics import STATUS_NAMES, sort_diagnostics
 from src.models import AppConfig, CompetitorConfig
+from src.pricing import average_value, marked_up_value, own_company_value
+from src.profiling import RunProfiler
 
 logger = logging.getLogger(__name__)
 
+# Ключ строки собственной ТК в row_map и markups_row_map
+OWN_ROW_KEY = "__own__"
+
 
 class OutputFileGenerator:
     """Генератор выходного Excel файла."""
@@ -26,8 +32,9 @@ class OutputFileGenerator:
         'weight_3000': 'Груз более 3000 кг'
     }
 
-    def __init__(self, config: AppConfig):
+    def __init__(self, config: AppConfig, profiler: Optional[RunProfiler] = None):
         self.config = config
+        self.profiler = profiler or RunProfiler()
         self.wb = None
         self.ws = None
         self.data: Dict[str, Dict[str, Dict[str, Any]]] = {}
@@ -47,17 +54,20 @@ class OutputFileGenerator:
             self.data = {city: {} for city in self.config.cities.keys()}
 
             # Создать заголовки
-            self._create_headers()
+            with self.profiler.span('create_headers'):
+                self._create_headers()
 
             # Создать пустые строки для данных
-            self._create_empty_rows(city_competitors=city_competitors)
+            with self.profiler.span('create_empty_rows'):
+                self._create_empty_rows(city_competitors=city_competitors)
 
             # Сохранить файл
             if not self.config.output_file:
                 logger.error("Не указан путь для выходного файла")
                 return False
 
-            self.wb.save(self.config.output_file)
+            with self.profiler.span('initial_save'):
+                self.wb.save(self.config.output_file)
             logger.info(f"Выходной файл создан: {self.config.output_file}")
 
             return True
@@ -198,7 +208,7 @@ class OutputFileGenerator:
 
                 # --- Строка собственной ТК ---
                 if own.enabled:
-                    self.row_map[city]["__own__"] = current_row
+                    self.row_map[city][OWN_ROW_KEY] = current_row
                     own_name_cell = self.ws.cell(row=current_row, column=1)
                     own_name_cell.value = own.name
                     self._style_own_cell(own_name_cell)
@@ -333,6 +343,63 @@ class OutputFileGenerator:
             self.data[city][competitor.name] = {}
         self.data[city][competitor.name][field] = value
 
+    def fill_own_company(self, city_competitors: Dict[str, List[CompetitorConfig]]):
+        """
+        Заполнить строку собственной ТК: среднее значение с наценкой собственной ТК.
+
+        В режиме formula ячейка ссылается на строку среднего и на лист «Наценки»,
+        в режиме value значения считаются одним проходом по всем городам
+        так же, как их посчитал бы Excel.
+        """
+        own = self.config.own_company
+        if not self.wb or not own.enabled or not self.config.output_config.include_average:
+            return
+
+        value_mode = own.fill_mode == 'value'
+        markup_row = self.markups_row_map.get(OWN_ROW_KEY)
+        # Ячейки конкурентов с наценкой только при листе «Наценки»
+        markups = self.config.output_config.markups_sheet
+        filled = 0
+        for city, rows in self.row_map.items():
+            own_row = rows.get(OWN_ROW_KEY)
+            avg_row = rows.get("__average__")
+            present = city_competitors.get(city, [])
+            if own_row is None or avg_row is None or not present:
+                continue
+
+            city_values = self.data.get(city, {})
+            for fi, field in enumerate(self.FIELDS):
+                col_idx = 2 + fi
+                col_letter = get_column_letter(col_idx)
+                if value_mode:
+                    value = own_company_value(
+                        self.config, average_value(present, city_values, field, markups), field
+                    )
+                    if value is None:
+                        continue
+                    value = round(value, 2)
+                elif markup_row is not None:
+                    value = f"={col_letter}{avg_row}*(1+Наценки!{col_letter}{markup_row}/100)"
+                else:
+                    percent = getattr(own.markups, field, 0)
+                    value = f"={col_letter}{avg_row}*(1+{percent}/100)" if percent else f"={col_letter}{avg_row}"
+                self.ws.cell(row=own_row, column=col_idx).value = value
+                filled += 1
+
+        logger.info(
+            f"Строка собственной ТК заполнена ({'значения' if value_mode else 'формулы'}): ячеек {filled}"
+        )
+
+    def mark_unparsed(self, competitor: CompetitorConfig, city: str, field: str):
+        """Выделить ячейку, значение которой не удалось разобрать как число."""
+        if not self.wb or field not in self.FIELDS:
+            return
+        row = self.row_map.get(city, {}).get(competitor.name)
+        if row is None:
+            return
+        cell = self.ws.cell(row=row, column=2 + self.FIELDS.index(field))
+        cell.fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+
     def _find_column(self, competitor: CompetitorConfig, field: str) -> Optional[int]:
         """Найти номер колонки для поля в новой структуре."""
         if field not in self.FIELDS:
@@ -399,6 +466,20 @@ class OutputFileGenerator:
                     cell.number_format = '0.##"%"'
                     self._style_data_cell(cell)
 
+            # Наценки собственной ТК — на них ссылается её строка в режиме формул
+            own = self.config.own_company
+            if own.enabled:
+                own_row = 4 + len(enabled_competitors)
+                self.markups_row_map[OWN_ROW_KEY] = own_row
+                cell = markups_ws.cell(row=own_row, column=1)
+                cell.value = own.name
+                self._style_own_cell(cell)
+                for fi, field in enumerate(self.FIELDS):
+                    cell = markups_ws.cell(row=own_row, column=2 + fi)
+                    cell.value = getattr(own.markups, field, 0)
+                    cell.number_format = '0.##"%"'
+                    self._style_own_cell(cell)
+
             # Ширина колонок
             markups_ws.column_dimensions['A'].width = 22
             for col_idx in range(2, 2 + len(self.FIELDS)):
@@ -408,3 +489,163 @@ class OutputFileGenerator:
 
         except Exception as e:
             logger.error(f"Ошибка добавления листа наценок: {e}")
+
+    def add_changes_sheet(self, changes: List[Any]):
+        """Добавить лист «Изменения» с ценами, изменившимися с прошлого запуска."""
+        try:
+            changes_ws = self.wb.create_sheet("Изменения")
+
+            title_cell = changes_ws['A1']
+            title_cell.value = f"Изменения цен с прошлого запуска: {len(changes)}"
+            title_cell.font = Font(size=14, bold=True)
+            changes_ws.merge_cells("A1:F1")
+
+            headers = ["Город", "Конкурент", "Поле", "Было", "Стало", "Изменение, %"]
+            for col_idx, header in enumerate(headers, 1):
+                cell = changes_ws.cell(row=3, column=col_idx)
+                cell.value = header
+                self._style_header_cell(cell)
+
+            for row_idx, change in enumerate(changes, 4):
+                changes_ws.cell(row=row_idx, column=1, value=change.city)
+                changes_ws.cell(row=row_idx, column=2, value=change.competitor)
+                changes_ws.cell(row=row_idx, column=3, value=self.FIELD_NAMES.get(change.field, change.field))
+                changes_ws.cell(row=row_idx, column=4, value=change.old)
+                changes_ws.cell(row=row_idx, column=5, value=change.new)
+                if change.percent is not None:
+                    pct_cell = changes_ws.cell(row=row_idx, column=6, value=round(change.percent, 2))
+                    pct_cell.number_format = '+0.00"%";-0.00"%"'
+                    color = "C00000" if change.percent > 0 else "00804C"
+                    pct_cell.font = Font(color=color)
+
+            changes_ws.column_dimensions['A'].width = 22
+            changes_ws.column_dimensions['B'].width = 18
+            changes_ws.column_dimensions['C'].width = 20
+            for col in ('D', 'E', 'F'):
+                changes_ws.column_dimensions[col].width = 14
+            changes_ws.freeze_panes = "A4"
+
+            logger.info("Лист с изменениями добавлен")
+
+        except Exception as e:
+            logger.error(f"Ошибка добавления листа изменений: {e}")
+
+    def add_diagnostics_sheet(self, diagnostics: List[Any], top_k: int):
+        """Добавить лист «Диагностика» с лучшими кандидатами для каждой пары город/конкурент."""
+        try:
+            diag_ws = self.wb.create_sheet("Диагностика")
+            items = sort_diagnostics(diagnostics)
+            missed = sum(1 for d in items if d.matched_row is None)
+
+            title_cell = diag_ws['A1']
+            title_cell.value = f"Сопоставление городов: не найдено {missed} из {len(items)}"
+            title_cell.font = Font(size=14, bold=True)
+            diag_ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=5 + top_k)
+
+            headers = ["Город", "Конкурент", "Статус", "Порог, %", "Строка"]
+            headers += [f"Кандидат {n}" for n in range(1, top_k + 1)]
+            for col_idx, header in enumerate(headers, 1):
+                cell = diag_ws.cell(row=3, column=col_idx)
+                cell.value = header
+                self._style_header_cell(cell)
+
+            missed_fill = PatternFill(start_color="FCE4D6", end_color="FCE4D6", fill_type="solid")
+            for row_idx, item in enumerate(items, 4):
+                diag_ws.cell(row=row_idx, column=1, value=item.city)
+                diag_ws.cell(row=row_idx, column=2, value=item.competitor)
+                status_cell = diag_ws.cell(row=row_idx, column=3, value=STATUS_NAMES[item.status])
+                diag_ws.cell(row=row_idx, column=4, value=item.threshold)
+                diag_ws.cell(row=row_idx, column=5, value=item.matched_row)
+                for n, candidate in enumerate(item.candidates[:top_k]):
+                    diag_ws.cell(
+                        row=row_idx, column=6 + n,
+                        value=f"{candidate.label} (стр. {candidate.row}, {candidate.score}%)"
+                    )
+                if item.matched_row is None:
+                    status_cell.fill = missed_fill
+
+            diag_ws.column_dimensions['A'].width = 22
+            diag_ws.column_dimensions['B'].width = 18
+            diag_ws.column_dimensions['C'].width = 22
+            diag_ws.column_dimensions['D'].width = 10
+            diag_ws.column_dimensions['E'].width = 8
+            for n in range(top_k):
+                diag_ws.column_dimensions[get_column_letter(6 + n)].width = 34
+            diag_ws.freeze_panes = "A4"
+
+            logger.info("Лист диагностики добавлен")
+
+        except Exception as e:
+            logger.error(f"Ошибка добавления листа диагностики: {e}")
+
+    def add_modes_sheet(
+        self,
+        mode_data: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]],
+        presence: Dict[str, Dict[str, List[CompetitorConfig]]],
+        averages: Dict[str, Dict[str, Dict[str, Optional[float]]]],
+    ):
+        """
+        Добавить лист «Виды доставки»: для каждой пары город/вид — строки конкурентов
+        (с их наценкой) и строка «Среднее значение».
+
+        Args:
+            mode_data: {вид: {конкурент: {город: {поле: значение}}}}
+            presence: {город: {вид: [конкурент, ...]}} — delivery_modes.mode_presence
+            averages: {город: {вид: {поле: среднее}}} — delivery_modes.mode_averages
+        """
+        markups = self.config.output_config.markups_sheet
+        try:
+            modes_ws = self.wb.create_sheet("Виды доставки")
+
+            title_cell = modes_ws['A1']
+            title_cell.value = "Стоимость доставки по видам доставки"
+            title_cell.font = Font(size=14, bold=True)
+            total_cols = 3 + len(self.FIELDS)
+            modes_ws.merge_cells(f"A1:{get_column_letter(total_cols)}1")
+
+            headers = ["Город", "Вид доставки", "Конкурент"] + [self.FIELD_NAMES[f] for f in self.FIELDS]
+            for col_idx, header in enumerate(headers, 1):
+                cell = modes_ws.cell(row=3, column=col_idx)
+                cell.value = header
+                self._style_header_cell(cell)
+
+            row = 4
+            for city, by_mode in presence.items():
+                for mode, competitors in by_mode.items():
+                    for competitor in competitors:
+                        values = mode_data[mode][competitor.name][city]
+                        modes_ws.cell(row=row, column=1, value=city)
+                        modes_ws.cell(row=row, column=2, value=mode)
+                        modes_ws.cell(row=row, column=3, value=competitor.name)
+                        for fi, field in enumerate(self.FIELDS):
+                            cell = modes_ws.cell(row=row, column=4 + fi)
+                            value = marked_up_value(competitor, field, values.get(field), markups)
+                            cell.value = round(value, 2) if isinstance(value, float) else value
+                            self._style_data_cell(cell, bold=competitor.bold)
+                        for col_idx in (1, 2, 3):
+                            self._style_city_cell(modes_ws.cell(row=row, column=col_idx))
+                        row += 1
+
+                    mode_average = averages.get(city, {}).get(mode, {})
+                    modes_ws.cell(row=row, column=1, value=city)
+                    modes_ws.cell(row=row, column=2, value=mode)
+                    modes_ws.cell(row=row, column=3, value="Среднее значение")
+                    for col_idx in range(1, total_cols + 1):
+                        cell = modes_ws.cell(row=row, column=col_idx)
+                        if col_idx > 3:
+                            value = mode_average.get(self.FIELDS[col_idx - 4])
+                            cell.value = round(value, 2) if value is not None else None
+                        self._style_average_cell(cell)
+                    row += 1
+
+            modes_ws.column_dimensions['A'].width = 22
+            modes_ws.column_dimensions['B'].width = 14
+            modes_ws.column_dimensions['C'].width = 18
+            for col_idx in range(4, total_cols + 1):
+                modes_ws.column_dimensions[get_column_letter(col_idx)].width = 15
+            modes_ws.freeze_panes = "A4"
+
+            logger.info("Лист видов доставки добавлен")
+
+        except Exception as e:
+            logger.error(f"Ошибка добавления листа видов доставки: {e}")
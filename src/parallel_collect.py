@@ -0,0 +1,257 @@
+"""
+Параллельный сбор данных конкурентов в отдельных процессах.
+
+Числовые результаты воркеры пишут прямо в общую память — массив double
+конкуренты × города × поля (NaN — значения нет) и по байту на ячейку с признаком
+int, чтобы родитель вернул исходный тип значения. Обратно через pickle передаётся
+только небольшой побочный канал: найденные города и нечисловые значения.
+Родитель собирает итоговые данные чтением из той же памяти, без копирования буфера.
+Данные по видам доставки (их немного) тоже передаются через побочный канал.
+
+Вместе с данными группы воркер возвращает то, что при последовательном сборе
+остаётся в процессоре: диагностику сопоставления (для обучения псевдонимов),
+индексы меток (для поиска города) и отрезки профилировщика. Память в воркерах
+не замеряется — режим памяти профилировщика видит только родительский процесс.
+"""
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Dict, Any, List, Optional, Callable, Tuple
+import logging
+import math
+
+from src.city_lookup import CityLookup, LabelIndex
+from src.delivery_modes import ModeData, merge_mode_data
+from src.diagnostics import CityDiagnostics
+from src.models import AppConfig, CompetitorConfig
+from src.output_generator import OutputFileGenerator
+from src.pricing import is_number
+from src.profiling import RunProfiler
+
+logger = logging.getLogger(__name__)
+
+FIELDS = OutputFileGenerator.FIELDS
+
+_DOUBLE_SIZE = 8
+
+# Целые больше этого не представимы в double точно — передаются побочным каналом
+_MAX_EXACT_INT = 2 ** 53
+
+# Побочный канал воркера: (найденные индексы городов, [(город, поле, значение)], ошибка)
+SideChannel = Tuple[List[int], List[Tuple[int, int, Any]], Optional[str]]
+
+# Процессор воркера — создаётся один раз на процесс
+_worker_processor = None
+
+
+@dataclass
+class GroupResult:
+    """Результат воркера по группе конкурентов с общим файлом (кроме чисел в общей памяти)."""
+    channels: Dict[int, SideChannel] = field(default_factory=dict)
+    diagnostics: List[CityDiagnostics] = field(default_factory=list)
+    modes: ModeData = field(default_factory=dict)
+    label_indexes: List[LabelIndex] = field(default_factory=list)
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+    started_wall: float = 0.0  # time.time() начала отсчёта spans
+
+
+class SharedResultBlock:
+    """Массив double в общей памяти: конкуренты × города × поля, и признаки int по ячейкам."""
+
+    def __init__(self, competitors: int, cities: int, name: Optional[str] = None):
+        self.shape = (competitors, cities, len(FIELDS))
+        count = max(1, competitors * cities * len(FIELDS))
+        size = count * (_DOUBLE_SIZE + 1)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = _attach(name)
+            self.owner = False
+        self.values = self.shm.buf[:count * _DOUBLE_SIZE].cast('d')
+        # 1 — значение ячейки было int
+        self.is_int = self.shm.buf[count * _DOUBLE_SIZE:size]
+        if self.owner:
+            self.shm.buf[:count * _DOUBLE_SIZE] = (array('d', [math.nan]) * count).tobytes()
+            self.is_int[:] = bytes(count)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def offset(self, competitor: int, city: int) -> int:
+        return (competitor * self.shape[1] + city) * self.shape[2]
+
+    def close(self):
+        self.values.release()
+        self.is_int.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        # Python 3.13+: воркер не регистрирует чужой сегмент в resource_tracker
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(config: AppConfig):
+    global _worker_processor
+    from src.excel_processor import ExcelProcessor
+    _worker_processor = ExcelProcessor(config)
+    # В воркере — только время этапов: cProfile и tracemalloc замеряет родитель
+    _worker_processor.profiler.cprofile = False
+    _worker_processor.profiler.memory = False
+
+
+def _collect_worker(
+    members: List[Tuple[str, int]],
+    block_name: str,
+    shape: Tuple[int, int, int],
+    cities: List[str],
+) -> GroupResult:
+    """Собрать данные группы конкурентов с общим файлом и записать числа в общую память."""
+    processor = _worker_processor
+    competitors = [processor.config.competitors[name] for name, _ in members]
+    processor.match_diagnostics = []
+    processor.collected_modes = {}
+    processor.city_lookup = CityLookup()
+    processor.profiler.begin_run()
+    result = GroupResult(started_wall=processor.profiler.run_started_wall)
+    try:
+        group_data = processor.collect_file_group(competitors)
+    except Exception as e:
+        result.channels = {index: ([], [], str(e)) for _, index in members}
+        return result
+    finally:
+        processor.mapped_files.close_all()
+        processor.profiler.end_run()
+        result.spans = processor.profiler.spans
+
+    result.diagnostics = processor.match_diagnostics
+    result.modes = processor.collected_modes
+    result.label_indexes = list(processor.city_lookup.indexes.values())
+    block = SharedResultBlock(shape[0], shape[1], name=block_name)
+    channels = result.channels
+    try:
+        for name, competitor_index in members:
+            city_data = group_data.get(name, {})
+            found: List[int] = []
+            side: List[Tuple[int, int, Any]] = []
+            for city_index, city in enumerate(cities):
+                fields = city_data.get(city)
+                if fields is None:
+                    continue
+                found.append(city_index)
+                base = block.offset(competitor_index, city_index)
+                for field_index, field in enumerate(FIELDS):
+                    value = fields.get(field)
+                    if is_number(value) and not (isinstance(value, int) and abs(value) > _MAX_EXACT_INT):
+                        block.values[base + field_index] = value
+                        block.is_int[base + field_index] = isinstance(value, int)
+                    elif value is not None:
+                        side.append((city_index, field_index, value))
+            channels[competitor_index] = (found, side, None)
+    finally:
+        block.close()
+    return result
+
+
+def collect_parallel(
+    config: AppConfig,
+    groups: List[List[CompetitorConfig]],
+    workers: int,
+    progress_callback: Optional[Callable[[str, bool], None]] = None,
+    profiler: Optional[RunProfiler] = None,
+    city_lookup: Optional[CityLookup] = None,
+) -> Tuple[Dict[str, Dict[str, Dict[str, Any]]], List[CityDiagnostics], ModeData]:
+    """
+    Собрать данные конкурентов в workers процессах.
+
+    Args:
+        groups: конкуренты, сгруппированные по файлу (ExcelProcessor.file_groups) —
+            группа собирается одним воркером за одно чтение файла
+        profiler: куда добавить отрезки этапов воркеров (вложатся в текущий этап)
+        city_lookup: куда сохранить индексы меток, построенные воркерами
+
+    Returns:
+        ({конкурент: {город: {поле: значение}}} — как при последовательном сборе,
+        диагностика сопоставления городов, данные по видам доставки)
+    """
+    competitors = [competitor for group in groups for competitor in group]
+    cities = list(config.cities.keys())
+    block = SharedResultBlock(len(competitors), len(cities))
+    side_channels: Dict[int, SideChannel] = {}
+    diagnostics: List[CityDiagnostics] = []
+    mode_data: ModeData = {}
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max(1, min(workers, len(groups))),
+            initializer=_init_worker,
+            initargs=(config,),
+        ) as pool:
+            futures = {}
+            index = 0
+            for group in groups:
+                members = []
+                for competitor in group:
+                    if progress_callback:
+                        progress_callback(competitor.name, False)
+                    members.append((competitor.name, index))
+                    index += 1
+                future = pool.submit(_collect_worker, members, block.name, block.shape, cities)
+                futures[future] = group
+            for future in as_completed(futures):
+                group_result = future.result()
+                side_channels.update(group_result.channels)
+                diagnostics.extend(group_result.diagnostics)
+                merge_mode_data(mode_data, group_result.modes)
+                if profiler is not None:
+                    profiler.merge_spans(group_result.spans, group_result.started_wall)
+                if city_lookup is not None:
+                    for label_index in group_result.label_indexes:
+                        city_lookup.store(label_index)
+                if progress_callback:
+                    for competitor in futures[future]:
+                        progress_callback(competitor.name, True)
+
+        collected = _assemble(block, competitors, cities, side_channels)
+        # Порядок как у конкурентов в конфигурации
+        order = [c.name for c in config.competitors.values()]
+        return {name: collected[name] for name in order if name in collected}, diagnostics, mode_data
+    finally:
+        block.close()
+
+
+def _assemble(
+    block: SharedResultBlock,
+    competitors: List[CompetitorConfig],
+    cities: List[str],
+    side_channels: Dict[int, SideChannel],
+) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Собрать данные из общей памяти и побочного канала."""
+    values = block.values
+    is_int = block.is_int
+    collected: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for index, competitor in enumerate(competitors):
+        found, side, error = side_channels.get(index, ([], [], None))
+        if error:
+            logger.error(f"Ошибка сбора данных {competitor.name}: {error}")
+        extra = {(city_index, field_index): value for city_index, field_index, value in side}
+        result: Dict[str, Dict[str, Any]] = {}
+        for city_index in found:
+            base = block.offset(index, city_index)
+            row: Dict[str, Any] = {}
+            for field_index, field in enumerate(FIELDS):
+                value = values[base + field_index]
+                if value != value:  # NaN
+                    row[field] = extra.get((city_index, field_index))
+                else:
+                    row[field] = int(value) if is_int[base + field_index] else value
+            result[cities[city_index]] = row
+        collected[competitor.name] = result
+    return collected
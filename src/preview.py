@@ -0,0 +1,89 @@
+"""
+Постраничное чтение файла конкурента для предпросмотра.
+
+Лист читается потоково (read_only) и строго последовательно: каждая следующая
+страница продолжает тот же поток строк, из строки сохраняются только колонки
+предпросмотра. Прочитанные строки повторно не разбираются.
+"""
+from itertools import islice
+from typing import Any, List, Tuple
+import logging
+
+import openpyxl
+from openpyxl.utils import column_index_from_string
+
+from src.mapped_io import MappedFiles
+from src.models import CompetitorConfig
+
+logger = logging.getLogger(__name__)
+
+# Поля предпросмотра в порядке колонок таблицы (после номера строки)
+PREVIEW_FIELDS = ['city', 'convert', 'minimum_1', 'minimum_2', 'volume', 'weight_100', 'weight_3000']
+
+# Строк в одной странице по умолчанию
+PAGE_SIZE = 500
+
+# Строка предпросмотра: (номер строки, значения колонок PREVIEW_FIELDS)
+PreviewRow = Tuple[Any, ...]
+
+
+def preview_columns(competitor: CompetitorConfig) -> List[str]:
+    """Буквы колонок источника для полей предпросмотра."""
+    return [getattr(competitor.source_columns, name) for name in PREVIEW_FIELDS]
+
+
+class PreviewReader:
+    """
+    Последовательный читатель первого листа книги страницами.
+
+    Args:
+        file_path: файл конкурента
+        columns: буквы колонок, которые попадают в строки предпросмотра
+    """
+
+    def __init__(self, file_path: str, columns: List[str]):
+        self._files = MappedFiles()
+        self._wb = None
+        try:
+            self._wb = openpyxl.load_workbook(
+                self._files.reader(file_path), read_only=True, data_only=True
+            )
+            sheet = self._wb.worksheets[0]
+            # Размеры в файле бывают неверными — читаем все строки, что есть в XML
+            sheet.reset_dimensions()
+            self._rows = sheet.iter_rows(values_only=True)
+        except Exception:
+            self.close()
+            raise
+        self._indices = [column_index_from_string(col) - 1 for col in columns]
+        self.rows_read = 0
+        self.finished = False
+
+    def next_page(self, count: int = PAGE_SIZE) -> List[PreviewRow]:
+        """Следующие count строк листа (меньше — если лист закончился)."""
+        page: List[PreviewRow] = []
+        if self.finished:
+            return page
+        for values in islice(self._rows, count):
+            self.rows_read += 1
+            page.append((self.rows_read,) + tuple(
+                values[idx] if idx < len(values) else None for idx in self._indices
+            ))
+        if len(page) < count:
+            self.finished = True
+            self.close()
+        return page
+
+    def close(self):
+        if self._wb is not None:
+            self._wb.close()
+            self._wb = None
+        self._files.close_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
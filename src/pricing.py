@@ -0,0 +1,73 @@
+"""
+Общие расчёты цен: числовые значения и наценки конкурентов.
+"""
+from typing import Any, Dict, List, Optional
+
+from src.models import AppConfig, CompetitorConfig
+
+
+def is_number(value: Any) -> bool:
+    """Является ли значение числом (bool числом не считается)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def apply_markup(value: Any, percent: float) -> Any:
+    """Применить наценку в процентах к числу; прочие значения возвращаются как есть."""
+    if not is_number(value) or not percent:
+        return value
+    return value * (1 + percent / 100)
+
+
+def marked_up_value(competitor: CompetitorConfig, field: str, value: Any, markups: bool = True) -> Any:
+    """
+    Значение поля конкурента с его наценкой — как в ячейке итогового файла.
+
+    markups — есть ли в файле лист «Наценки» (output_config.markups_sheet):
+    без него ячейки конкурентов пишутся без наценки.
+    """
+    if not markups:
+        return value
+    return apply_markup(value, getattr(competitor.markups, field, 0))
+
+
+def average_value(
+    competitors: List[CompetitorConfig],
+    city_values: Dict[str, Dict[str, Any]],
+    field: str,
+    markups: bool = True,
+) -> Optional[float]:
+    """
+    Значение строки «Среднее значение» для города — как AVERAGE в итоговом файле.
+
+    В диапазон AVERAGE входят строки конкурентов (с их наценкой) и их строки наценок.
+    Как в Excel: текст и пустые ячейки конкурентов пропускаются, строка наценки
+    от пустой ячейки даёт 0, а от текста — ошибку (тогда возвращается None).
+
+    Args:
+        competitors: конкуренты, выведенные в городе (в порядке строк)
+        city_values: {имя конкурента: {поле: значение}} для города
+        markups: применяются ли наценки конкурентов (см. marked_up_value)
+    """
+    numbers: List[float] = []
+    for competitor in competitors:
+        raw = city_values.get(competitor.name, {}).get(field)
+        value = marked_up_value(competitor, field, raw, markups)
+        if is_number(value):
+            numbers.append(value)
+        for mk_row in competitor.markup_rows:
+            if is_number(value):
+                numbers.append(apply_markup(value, mk_row.percent))
+            elif value is None:
+                numbers.append(0)
+            elif mk_row.percent:
+                return None
+    if not numbers:
+        return None
+    return sum(numbers) / len(numbers)
+
+
+def own_company_value(config: AppConfig, average: Optional[float], field: str) -> Optional[float]:
+    """Значение собственной ТК: среднее с наценкой собственной компании."""
+    if average is None:
+        return None
+    return apply_markup(average, getattr(config.own_company.markups, field, 0))
@@ -0,0 +1,449 @@
+"""
+Модуль профилирования этапов обработки.
+
+Отрезки (spans) замеряются вокруг этапов process_all с разбивкой по конкурентам.
+В выключенном состоянии span() возвращает общий пустой контекст и ничего не замеряет.
+В режиме памяти на границах этапов снимаются RSS и tracemalloc (пик, прирост,
+места выделения).
+"""
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Общий пустой контекст для выключенного профилировщика
+_NULL_SPAN = nullcontext()
+
+# Сколько мест выделения памяти сохранять на этап
+TOP_ALLOCATIONS = 10
+
+MB = 1024 * 1024
+
+
+def process_memory() -> Tuple[Optional[int], Optional[int]]:
+    """
+    Текущий и пиковый RSS процесса в байтах.
+
+    Возвращает (None, None), если платформа не даёт этих данных.
+    """
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize, counters.PeakWorkingSetSize
+        except Exception:
+            pass
+        return None, None
+
+    current = None
+    peak = None
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдаёт килобайты, macOS — байты
+        if sys.platform != 'darwin':
+            peak *= 1024
+    except Exception:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        current = None
+    if current is not None and peak is not None:
+        peak = max(peak, current)
+    return current, peak
+
+
+def _allocation_filters() -> List[tracemalloc.Filter]:
+    return [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        tracemalloc.Filter(False, '<unknown>'),
+    ]
+
+
+def _format_trace(stat) -> str:
+    frame = stat.traceback[0]
+    return f"{Path(frame.filename).name}:{frame.lineno}"
+
+
+class _Span:
+    """Замер одного этапа."""
+
+    __slots__ = (
+        'profiler', 'stage', 'competitor', 'start', 'depth',
+        'mem_start', 'mem_peak', 'snapshot',
+    )
+
+    def __init__(self, profiler: 'RunProfiler', stage: str, competitor: Optional[str]):
+        self.profiler = profiler
+        self.stage = stage
+        self.competitor = competitor
+        self.start = 0.0
+        self.depth = 0
+        self.mem_start = 0
+        self.mem_peak = 0
+        self.snapshot = None
+
+    def __enter__(self):
+        profiler = self.profiler
+        self.depth = len(profiler._stack)
+        if profiler.memory:
+            self._enter_memory()
+        profiler._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        profiler = self.profiler
+        profiler._stack.pop()
+        span = {
+            'stage': self.stage,
+            'competitor': self.competitor,
+            'depth': self.depth,
+            'start': round(self.start - profiler.run_started, 6),
+            'duration': round(duration, 6),
+        }
+        if profiler.memory:
+            span.update(self._exit_memory())
+        profiler.spans.append(span)
+        return False
+
+    def _enter_memory(self):
+        current, peak = tracemalloc.get_traced_memory()
+        # Пик до входа принадлежит внешнему этапу — переносим его туда и сбрасываем.
+        # Трассировку, запущенную вызывающим кодом, не сбрасываем: её пик нужен ему,
+        # а пик этапа тогда — верхняя граница (с начала внешней трассировки)
+        if self.profiler._stack:
+            parent = self.profiler._stack[-1]
+            parent.mem_peak = max(parent.mem_peak, peak)
+        if self.profiler._owns_tracemalloc:
+            tracemalloc.reset_peak()
+        self.mem_start = current
+        self.mem_peak = current
+        # Снимки — только на границах этапов верхнего уровня: они дорогие
+        if self.depth == 0:
+            self.snapshot = tracemalloc.take_snapshot().filter_traces(_allocation_filters())
+
+    def _exit_memory(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        self.mem_peak = max(self.mem_peak, peak)
+        if self.profiler._stack:
+            parent = self.profiler._stack[-1]
+            parent.mem_peak = max(parent.mem_peak, self.mem_peak)
+
+        rss, rss_peak = process_memory()
+        memory: Dict[str, Any] = {
+            'mem_start': self.mem_start,
+            'mem_end': current,
+            'mem_peak': self.mem_peak,
+            'rss': rss,
+            'rss_peak': rss_peak,
+        }
+        if self.snapshot is not None:
+            after = tracemalloc.take_snapshot().filter_traces(_allocation_filters())
+            stats = after.compare_to(self.snapshot, 'lineno')
+            memory['top_allocations'] = [
+                {'site': _format_trace(stat), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+                for stat in stats[:TOP_ALLOCATIONS] if stat.size_diff > 0
+            ]
+            self.snapshot = None
+        return memory
+
+
+class RunProfiler:
+    """Профилировщик одного запуска обработки."""
+
+    def __init__(self, enabled: bool = False, cprofile: bool = False, memory: bool = False):
+        # Режим памяти замеряет те же отрезки, поэтому включает и их
+        self.enabled = enabled or memory
+        self.cprofile = cprofile
+        self.memory = memory
+        self.spans: List[Dict[str, Any]] = []
+        self.run_started = 0.0
+        # Начало запуска по time.time() — для отрезков из других процессов
+        self.run_started_wall = 0.0
+        self.run_duration = 0.0
+        self.started_at = ""
+        self.final_allocations: List[Dict[str, Any]] = []
+        self.run_memory: Dict[str, Any] = {}
+        self._stack: List[_Span] = []
+        self._profile: Optional[cProfile.Profile] = None
+        self._owns_tracemalloc = False
+
+    @property
+    def active(self) -> bool:
+        """Включён ли хотя бы один из режимов профилирования."""
+        return self.enabled or self.cprofile
+
+    def span(self, stage: str, competitor: Optional[str] = None):
+        """Контекст замера этапа (пустой, если профилирование выключено)."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, competitor)
+
+    def begin_run(self):
+        """Начать новый запуск: сбросить замеры и при необходимости запустить cProfile/tracemalloc."""
+        self.spans = []
+        self._stack = []
+        self.final_allocations = []
+        self.run_memory = {}
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        self.run_started = time.perf_counter()
+        self.run_started_wall = time.time()
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def merge_spans(self, spans: List[Dict[str, Any]], started_wall: float):
+        """
+        Добавить отрезки, замеренные в другом процессе (воркере параллельного сбора).
+
+        Отрезки вкладываются в текущий открытый этап, их начало переводится
+        в отсчёт этого запуска.
+
+        Args:
+            started_wall: time.time() начала отсчёта отрезков в том процессе
+        """
+        if not self.enabled:
+            return
+        offset = started_wall - self.run_started_wall
+        depth = len(self._stack)
+        for span in spans:
+            self.spans.append(dict(span, start=round(span['start'] + offset, 6), depth=span['depth'] + depth))
+
+    def end_run(self):
+        """Завершить запуск."""
+        self.run_duration = time.perf_counter() - self.run_started
+        if self._profile is not None:
+            self._profile.disable()
+        if self.memory and tracemalloc.is_tracing():
+            rss, rss_peak = process_memory()
+            self.run_memory = {
+                'mem_peak': max((s.get('mem_peak', 0) for s in self.spans), default=0),
+                'rss': rss,
+                'rss_peak': rss_peak,
+            }
+            # Что осталось в памяти к концу запуска
+            snapshot = tracemalloc.take_snapshot().filter_traces(_allocation_filters())
+            self.final_allocations = [
+                {'site': _format_trace(stat), 'size': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+            ]
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+
+    def stage_totals(self) -> Dict[str, Dict[str, float]]:
+        """Суммарное время и число вызовов по этапам."""
+        totals: Dict[str, Dict[str, float]] = {}
+        # Вложенные отрезки закрываются раньше внешних — упорядочиваем по началу
+        for span in sorted(self.spans, key=lambda s: (s['start'], s['depth'])):
+            entry = totals.setdefault(span['stage'], {'total': 0.0, 'count': 0, 'depth': span['depth']})
+            entry['total'] += span['duration']
+            entry['count'] += 1
+            entry['depth'] = min(entry['depth'], span['depth'])
+            if 'mem_peak' in span:
+                entry['mem_peak'] = max(entry.get('mem_peak', 0), span['mem_peak'])
+                entry['mem_growth'] = max(entry.get('mem_growth', 0), span['mem_peak'] - span['mem_start'])
+                entry['rss_peak'] = max(entry.get('rss_peak') or 0, span['rss_peak'] or 0)
+        return totals
+
+    def competitor_totals(self) -> Dict[str, Dict[str, float]]:
+        """Время этапов в разбивке по конкурентам: {конкурент: {этап: секунды}}."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            if span['competitor'] is None:
+                continue
+            stages = totals.setdefault(span['competitor'], {})
+            stages[span['stage']] = stages.get(span['stage'], 0.0) + span['duration']
+        return totals
+
+    def competitor_memory(self) -> Dict[str, Dict[str, int]]:
+        """
+        Память по конкурентам: {конкурент: {'peak_growth': байт, 'retained': байт}}.
+
+        peak_growth — наибольший прирост пика над началом этапа,
+        retained — сколько осталось занято после этапов конкурента.
+        """
+        result: Dict[str, Dict[str, int]] = {}
+        for span in self.spans:
+            if span['competitor'] is None or 'mem_peak' not in span or span['depth'] != 0:
+                continue
+            entry = result.setdefault(span['competitor'], {'peak_growth': 0, 'retained': 0})
+            entry['peak_growth'] = max(entry['peak_growth'], span['mem_peak'] - span['mem_start'])
+            entry['retained'] += span['mem_end'] - span['mem_start']
+        return result
+
+    def top_allocations(self) -> List[Dict[str, Any]]:
+        """Места выделения с наибольшим приростом за запуск (сумма по этапам верхнего уровня)."""
+        sites: Dict[str, Dict[str, int]] = {}
+        for span in self.spans:
+            for item in span.get('top_allocations', []):
+                entry = sites.setdefault(item['site'], {'size_diff': 0, 'count_diff': 0})
+                entry['size_diff'] += item['size_diff']
+                entry['count_diff'] += item['count_diff']
+        ranked = sorted(sites.items(), key=lambda kv: kv[1]['size_diff'], reverse=True)
+        return [{'site': site, **values} for site, values in ranked[:TOP_ALLOCATIONS]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            'started_at': self.started_at,
+            'total': round(self.run_duration, 6),
+            'stages': {
+                stage: {
+                    k: (round(v, 6) if k == 'total' else v)
+                    for k, v in values.items() if k != 'depth'
+                }
+                for stage, values in self.stage_totals().items()
+            },
+            'competitors': {
+                name: {stage: round(t, 6) for stage, t in stages.items()}
+                for name, stages in self.competitor_totals().items()
+            },
+            'spans': self.spans,
+        }
+        if self.memory:
+            data['memory'] = {
+                'run': self.run_memory,
+                'competitors': self.competitor_memory(),
+                'top_allocations': self.top_allocations(),
+                'retained_at_end': self.final_allocations,
+            }
+        return data
+
+    def summary_lines(self) -> List[str]:
+        """Текстовая сводка для журнала."""
+        total = self.run_duration or 1e-9
+        lines = [f"Профиль запуска: всего {self.run_duration:.3f} с"]
+        for stage, v in self.stage_totals().items():
+            indent = "  " * (int(v['depth']) + 1)
+            lines.append(
+                f"{indent}{stage}: {v['total']:.3f} с "
+                f"({v['total'] / total * 100:.1f}%, вызовов: {int(v['count'])})"
+            )
+        for name, stages in self.competitor_totals().items():
+            parts = ", ".join(f"{stage} {t:.3f} с" for stage, t in stages.items())
+            lines.append(f"  [{name}] {parts}")
+        if self.memory:
+            lines.extend(self.memory_summary_lines())
+        return lines
+
+    def memory_summary_lines(self) -> List[str]:
+        """Сводка по памяти для журнала."""
+        def mb(value: Optional[int]) -> str:
+            return f"{value / MB:.1f} МБ" if value is not None else "н/д"
+
+        run = self.run_memory
+        lines = [
+            f"Память: пик Python {mb(run.get('mem_peak'))}, "
+            f"RSS {mb(run.get('rss'))}, пиковый RSS {mb(run.get('rss_peak'))}"
+        ]
+        for stage, v in self.stage_totals().items():
+            if 'mem_peak' not in v:
+                continue
+            indent = "  " * (int(v['depth']) + 1)
+            lines.append(
+                f"{indent}{stage}: прирост пика {mb(v['mem_growth'])}, "
+                f"пиковый RSS {mb(v['rss_peak'] or None)}"
+            )
+        for name, v in self.competitor_memory().items():
+            lines.append(f"  [{name}] прирост пика {mb(v['peak_growth'])}, осталось {mb(v['retained'])}")
+        top = self.top_allocations()
+        if top:
+            lines.append("Основные места выделения памяти:")
+            for item in top:
+                lines.append(f"  {mb(item['size_diff']):>10}  {item['count_diff']:>8} блоков  {item['site']}")
+        return lines
+
+    def save_json(self, file_path: Path):
+        """Сохранить профиль в JSON."""
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def dump_stats(self, file_path: Path, top: int = 25) -> List[str]:
+        """
+        Сохранить дамп cProfile (.pstats) и вернуть самые затратные функции.
+
+        Returns:
+            Строки с top функциями по cumulative времени
+        """
+        if self._profile is None:
+            return []
+        self._profile.dump_stats(str(file_path))
+        stats = pstats.Stats(self._profile)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        hotspots = []
+        for func in stats.fcn_list[:top]:
+            _cc, ncalls, tottime, cumtime, _callers = stats.stats[func]
+            filename, line, name = func
+            hotspots.append(
+                f"{cumtime:8.3f} с  {tottime:8.3f} с  {ncalls:>8}  "
+                f"{Path(filename).name}:{line}({name})"
+            )
+        return hotspots
+
+    def report(self, output_file: str):
+        """
+        Вывести сводку в журнал и сохранить файлы профиля рядом с выходным файлом.
+
+        <output>.profile.json — отрезки этапов, <output>.pstats — дамп cProfile.
+        """
+        if not self.active:
+            return
+        base = Path(output_file) if output_file else Path('result.xlsx')
+
+        if self.enabled:
+            for line in self.summary_lines():
+                logger.info(line)
+            json_path = base.with_suffix('.profile.json')
+            try:
+                self.save_json(json_path)
+                logger.info(f"Профиль сохранён: {json_path}")
+            except Exception as e:
+                logger.error(f"Ошибка сохранения профиля: {e}")
+
+        if self.cprofile:
+            stats_path = base.with_suffix('.pstats')
+            try:
+                hotspots = self.dump_stats(stats_path)
+                logger.info(f"Дамп cProfile сохранён: {stats_path}")
+                for line in hotspots[:10]:
+                    logger.info(f"  {line}")
+            except Exception as e:
+                logger.error(f"Ошибка сохранения дампа cProfile: {e}")
@@ -0,0 +1,189 @@
+"""
+Сценарии наценок собственной ТК без пересборки итогового файла.
+
+Собранные данные раскладываются один раз по полям: среднее по городу (как в строке
+«Среднее значение») и отсортированные цены конкурентов. Каждая пара (поле, наценка)
+из всех сценариев вычисляется один раз, позиция — двоичным поиском по ценам города.
+"""
+from bisect import bisect_left
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+import logging
+
+from src.models import AppConfig, CompetitorConfig, Markups
+from src.output_generator import OutputFileGenerator
+from src.pricing import is_number, marked_up_value, average_value
+
+logger = logging.getLogger(__name__)
+
+FIELDS = OutputFileGenerator.FIELDS
+
+
+@dataclass
+class FieldOutcome:
+    """Итог наценки для одного поля по всем городам."""
+    field: str
+    percent: float
+    cities: int = 0               # Города со средним значением
+    avg_position: float = 0.0     # Средняя позиция (1 — дешевле всех конкурентов)
+    cheapest_share: float = 0.0   # Доля городов, где собственная ТК дешевле всех
+    avg_gap: float = 0.0          # Средняя разница с самым дешёвым конкурентом, %
+    revenue_delta: float = 0.0    # Изменение выручки относительно текущих наценок
+
+
+@dataclass
+class ScenarioResult:
+    """Итог сценария по всем полям."""
+    name: str
+    markups: Markups
+    fields: Dict[str, FieldOutcome] = field(default_factory=dict)
+
+    @property
+    def revenue_delta(self) -> float:
+        return sum(outcome.revenue_delta for outcome in self.fields.values())
+
+    @property
+    def avg_position(self) -> float:
+        outcomes = [o for o in self.fields.values() if o.cities]
+        if not outcomes:
+            return 0.0
+        return sum(o.avg_position for o in outcomes) / len(outcomes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'markups': asdict(self.markups),
+            'avg_position': self.avg_position,
+            'revenue_delta': self.revenue_delta,
+            'fields': {name: asdict(outcome) for name, outcome in self.fields.items()},
+        }
+
+
+@dataclass
+class _FieldData:
+    """Данные поля по городам в параллельных списках."""
+    cities: List[str]
+    averages: List[float]
+    competitor_prices: List[List[float]]  # Отсортированные цены конкурентов города
+    units: List[float]                    # Объём для выручки (1, если журнала отгрузок нет)
+
+
+def markup_grid(start: float, stop: float, step: float) -> List[float]:
+    """Значения наценки от start до stop включительно с шагом step."""
+    if step <= 0:
+        raise ValueError("Шаг сетки должен быть больше нуля")
+    count = int(round((stop - start) / step))
+    return [round(start + i * step, 6) for i in range(count + 1)]
+
+
+class ScenarioEngine:
+    """
+    Оценка сценариев наценок собственной ТК.
+
+    Args:
+        config: конфигурация (наценки конкурентов и текущие наценки собственной ТК)
+        collected: нормализованные данные запуска {конкурент: {город: {поле: значение}}}
+        city_competitors: конкуренты, выведенные в каждом городе
+        units: объём отгрузок {(город, поле): единиц} для выручки; без него — 1 на город
+    """
+
+    def __init__(
+        self,
+        config: AppConfig,
+        collected: Dict[str, Dict[str, Dict[str, Any]]],
+        city_competitors: Dict[str, List[CompetitorConfig]],
+        units: Optional[Dict[Tuple[str, str], float]] = None,
+    ):
+        self.config = config
+        self.data: Dict[str, _FieldData] = {f: _FieldData([], [], [], []) for f in FIELDS}
+        # Кэш оценок: {(поле, наценка): FieldOutcome}
+        self._outcomes: Dict[Tuple[str, float], FieldOutcome] = {}
+        # Наценки конкурентов — только если они есть в файле (лист «Наценки»)
+        markups = config.output_config.markups_sheet
+
+        for city in sorted(config.cities.keys()):
+            present = city_competitors.get(city, [])
+            if not present:
+                continue
+            city_values = {c.name: collected.get(c.name, {}).get(city, {}) for c in present}
+            for field_name in FIELDS:
+                average = average_value(present, city_values, field_name, markups)
+                if average is None:
+                    continue
+                prices = sorted(
+                    price for price in (
+                        marked_up_value(c, field_name, city_values[c.name].get(field_name), markups)
+                        for c in present
+                    )
+                    if is_number(price)
+                )
+                data = self.data[field_name]
+                data.cities.append(city)
+                data.averages.append(average)
+                data.competitor_prices.append(prices)
+                data.units.append(units.get((city, field_name), 0.0) if units else 1.0)
+
+    def evaluate_field(self, field_name: str, percent: float) -> FieldOutcome:
+        """Позиция и выручка собственной ТК для одного поля при наценке percent."""
+        key = (field_name, percent)
+        cached = self._outcomes.get(key)
+        if cached is not None:
+            return cached
+
+        data = self.data[field_name]
+        current = getattr(self.config.own_company.markups, field_name, 0)
+        outcome = FieldOutcome(field=field_name, percent=percent, cities=len(data.cities))
+        if data.cities:
+            factor = 1 + percent / 100
+            current_factor = 1 + current / 100
+            positions = cheapest = 0
+            gaps: List[float] = []
+            revenue = 0.0
+            for average, prices, units in zip(data.averages, data.competitor_prices, data.units):
+                own = average * factor
+                rank = bisect_left(prices, own)
+                positions += rank + 1
+                if rank == 0:
+                    cheapest += 1
+                if prices and prices[0]:
+                    gaps.append((own - prices[0]) / abs(prices[0]) * 100)
+                revenue += average * (factor - current_factor) * units
+            outcome.avg_position = positions / len(data.cities)
+            outcome.cheapest_share = cheapest / len(data.cities)
+            outcome.avg_gap = sum(gaps) / len(gaps) if gaps else 0.0
+            outcome.revenue_delta = revenue
+
+        self._outcomes[key] = outcome
+        return outcome
+
+    def rank_share(self, field_name: str, percent: float, rank: int) -> float:
+        """Доля городов, где собственная ТК не дальше места rank при наценке percent."""
+        data = self.data[field_name]
+        if not data.cities:
+            return 0.0
+        factor = 1 + percent / 100
+        hits = sum(
+            1 for average, prices in zip(data.averages, data.competitor_prices)
+            if bisect_left(prices, average * factor) < rank
+        )
+        return hits / len(data.cities)
+
+    def evaluate(self, scenarios: Iterable[Tuple[str, Markups]]) -> List[ScenarioResult]:
+        """Оценить сценарии (имя, наценки собственной ТК); одинаковые наценки поля считаются один раз."""
+        results = []
+        for name, markups in scenarios:
+            result = ScenarioResult(name=name, markups=markups)
+            for field_name in FIELDS:
+                result.fields[field_name] = self.evaluate_field(field_name, getattr(markups, field_name))
+            results.append(result)
+        logger.info(
+            f"Сценарии наценок: {len(results)}, уникальных расчётов поле/наценка: {len(self._outcomes)}"
+        )
+        return results
+
+    def evaluate_grid(self, percents: List[float]) -> Dict[str, List[FieldOutcome]]:
+        """Сетка наценок по каждому полю: {поле: [итог для каждой наценки]}."""
+        return {
+            field_name: [self.evaluate_field(field_name, p) for p in percents]
+            for field_name in FIELDS
+        }
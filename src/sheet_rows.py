@@ -0,0 +1,99 @@
+"""
+Строки листа, прочитанные одним потоковым проходом.
+
+Книга открывается в режиме read_only, первый лист читается один раз в список
+кортежей значений. Все планы извлечения (конкуренты с общим файлом) работают
+с этим списком по индексу, без повторного чтения XML листа.
+"""
+from typing import Dict, Any, List, Tuple
+import logging
+
+import openpyxl
+from openpyxl.utils import column_index_from_string
+
+from src.matching import TrigramIndex, prepare
+from src.translit import canonical_key
+
+logger = logging.getLogger(__name__)
+
+
+class SheetRows:
+    """Значения первого листа: строка (с 1) -> кортеж значений колонок."""
+
+    def __init__(self, title: str, rows: List[Tuple[Any, ...]]):
+        self.title = title
+        self.rows = rows
+        # Метки колонок: {буква колонки: [(строка, значение)]} — строятся по запросу
+        self._labels: Dict[str, List[Tuple[int, Any]]] = {}
+        self._prepared: Dict[str, List[str]] = {}
+        self._trigram_indexes: Dict[str, TrigramIndex] = {}
+        self._keys: Dict[str, Dict[str, List[int]]] = {}
+
+    @property
+    def max_row(self) -> int:
+        return len(self.rows)
+
+    def value(self, col: str, row: int) -> Any:
+        """Значение ячейки (None за пределами листа)."""
+        if row < 1 or row > len(self.rows):
+            return None
+        values = self.rows[row - 1]
+        idx = column_index_from_string(col) - 1
+        return values[idx] if idx < len(values) else None
+
+    def labels(self, col: str) -> List[Tuple[int, Any]]:
+        """Непустые значения колонки по порядку строк (один раз на колонку)."""
+        labels = self._labels.get(col)
+        if labels is None:
+            idx = column_index_from_string(col) - 1
+            labels = self._labels[col] = [
+                (row_idx, values[idx])
+                for row_idx, values in enumerate(self.rows, start=1)
+                if idx < len(values) and values[idx]
+            ]
+        return labels
+
+    def prepared(self, col: str) -> List[str]:
+        """Метки колонки, подготовленные для пакетной оценки WRatio (в порядке labels)."""
+        prepared = self._prepared.get(col)
+        if prepared is None:
+            prepared = self._prepared[col] = [
+                prepare(str(value).lower()) for _, value in self.labels(col)
+            ]
+        return prepared
+
+    def label_keys(self, col: str) -> Dict[str, List[int]]:
+        """Канонические ключи меток колонки: {ключ: [номер метки в labels]} (один раз на колонку)."""
+        keys = self._keys.get(col)
+        if keys is None:
+            keys = self._keys[col] = {}
+            for i, (_, value) in enumerate(self.labels(col)):
+                key = canonical_key(value)
+                if key:
+                    keys.setdefault(key, []).append(i)
+        return keys
+
+    def trigram_index(self, col: str) -> TrigramIndex:
+        """Индекс триграмм подготовленных меток колонки (один раз на колонку)."""
+        index = self._trigram_indexes.get(col)
+        if index is None:
+            index = self._trigram_indexes[col] = TrigramIndex(self.prepared(col))
+        return index
+
+
+def read_sheet_rows(source: Any) -> SheetRows:
+    """
+    Прочитать первый лист книги одним проходом (сохранённые значения, data_only).
+
+    Args:
+        source: путь или файловый объект книги
+    """
+    wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = wb.worksheets[0]
+        # Размеры в файле бывают неверными — читаем все строки, что есть в XML
+        sheet.reset_dimensions()
+        rows = [tuple(values) for values in sheet.iter_rows(values_only=True)]
+        return SheetRows(sheet.title, rows)
+    finally:
+        wb.close()
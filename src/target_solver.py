@@ -0,0 +1,112 @@
+"""
+Подбор наценок собственной ТК под целевую позицию.
+
+Цели: «на X% ниже среднего по городу» (решается напрямую) и «не дальше места N
+в S% городов» (бисекция по наценке: доля городов монотонно убывает с ростом наценки).
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+import logging
+import math
+
+from src.models import AppConfig
+from src.scenarios import ScenarioEngine
+
+logger = logging.getLogger(__name__)
+
+GOAL_BELOW_AVERAGE = 'below_average'
+GOAL_RANK_SHARE = 'rank_share'
+
+# Границы поиска наценки (%) и точность бисекции
+SEARCH_BOUNDS: Tuple[float, float] = (-99.0, 1000.0)
+TOLERANCE = 0.01
+
+
+@dataclass
+class PositionGoal:
+    """Цель для одного поля."""
+    field: str
+    kind: str = GOAL_RANK_SHARE
+    percent_below: float = 5.0  # Для below_average: на сколько % ниже среднего
+    rank: int = 2               # Для rank_share: место не дальше rank (1 — дешевле всех)
+    share: float = 0.8          # Для rank_share: в какой доле городов
+
+    def describe(self) -> str:
+        if self.kind == GOAL_BELOW_AVERAGE:
+            return f"на {self.percent_below:g}% ниже среднего"
+        return f"не дальше {self.rank}-го места в {self.share:.0%} городов"
+
+
+@dataclass
+class SolverResult:
+    """Подобранная наценка поля."""
+    goal: PositionGoal
+    percent: float
+    feasible: bool
+    achieved_share: float = 0.0  # Для rank_share: фактическая доля городов
+    iterations: int = 0
+
+
+def solve_goal(engine: ScenarioEngine, goal: PositionGoal) -> SolverResult:
+    """Наибольшая наценка, при которой цель выполняется."""
+    if goal.kind == GOAL_BELOW_AVERAGE:
+        return SolverResult(goal=goal, percent=-goal.percent_below, feasible=True)
+    if goal.kind != GOAL_RANK_SHARE:
+        raise ValueError(f"Неизвестный тип цели: {goal.kind}")
+
+    lo, hi = SEARCH_BOUNDS
+    satisfied = lambda p: engine.rank_share(goal.field, p, goal.rank) >= goal.share - 1e-9
+
+    if not satisfied(lo):
+        return SolverResult(
+            goal=goal, percent=lo, feasible=False,
+            achieved_share=engine.rank_share(goal.field, lo, goal.rank),
+        )
+    if satisfied(hi):
+        return SolverResult(
+            goal=goal, percent=hi, feasible=True,
+            achieved_share=engine.rank_share(goal.field, hi, goal.rank),
+        )
+
+    # Инвариант: на lo цель выполняется, на hi — нет
+    iterations = 0
+    while hi - lo > TOLERANCE:
+        mid = (lo + hi) / 2
+        if satisfied(mid):
+            lo = mid
+        else:
+            hi = mid
+        iterations += 1
+
+    # Округление вниз до сотых сохраняет выполнение цели
+    percent = math.floor(lo * 100) / 100
+    return SolverResult(
+        goal=goal, percent=percent, feasible=True,
+        achieved_share=engine.rank_share(goal.field, percent, goal.rank),
+        iterations=iterations,
+    )
+
+
+def solve_markups(
+    engine: ScenarioEngine,
+    goals: List[PositionGoal],
+    config: AppConfig,
+    apply: bool = True,
+) -> Dict[str, SolverResult]:
+    """
+    Подобрать наценки для набора целей (одна цель на поле).
+
+    При apply=True выполнимые решения записываются в config.own_company.markups.
+    """
+    results: Dict[str, SolverResult] = {}
+    for goal in goals:
+        result = solve_goal(engine, goal)
+        results[goal.field] = result
+        if result.feasible and apply:
+            setattr(config.own_company.markups, goal.field, result.percent)
+        logger.info(
+            f"Подбор наценки {goal.field} ({goal.describe()}): "
+            + (f"{result.percent:+.2f}%" if result.feasible else "цель недостижима")
+            + (f", доля городов {result.achieved_share:.0%}" if goal.kind == GOAL_RANK_SHARE else "")
+        )
+    return results
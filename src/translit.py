@@ -0,0 +1,113 @@
+"""
+Канонические ключи названий городов, не зависящие от письменности.
+
+Кириллица (русская и казахская) и латиница (в том числе казахская латиница
+с диакритикой) приводятся к одному латинскому ключу: «Астана», «Astana» и
+«Астана қ.» дают ключ «astana». Совпадение ключей проверяется поиском в словаре,
+без нечёткого сравнения с каждым вариантом написания.
+
+Известные переименования городов Казахстана (Нур-Султан/Астана, Алма-Ата/Алматы)
+собраны в KNOWN_NAMES: ключ любого названия из группы находит все остальные.
+"""
+from typing import Dict, Iterable, List
+import re
+import unicodedata
+
+_CYRILLIC = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+    # Казахские буквы
+    'ә': 'a', 'ғ': 'g', 'қ': 'k', 'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u', 'һ': 'h', 'і': 'i',
+}
+
+# Латинские буквы с диакритикой, которые NFKD не сводит к нужному написанию
+_LATIN = {'ş': 'sh', 'ç': 'ch', 'ı': 'i', 'ñ': 'n', 'ğ': 'g'}
+
+# Разные латинские схемы для одних и тех же звуков — к одному написанию
+_LATIN_VARIANTS = [
+    ('shch', 'sh'), ('kh', 'h'), ('x', 'h'), ('zh', 'j'), ('dj', 'j'), ('dzh', 'j'),
+    ('q', 'k'), ('w', 'v'), ('iy', 'i'), ('yi', 'i'), ('ye', 'e'), ('iu', 'yu'), ('ia', 'ya'),
+]
+
+_TABLE = str.maketrans({**_CYRILLIC, **_LATIN})
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+_VOWEL_Y = re.compile(r'([aeiou])y')
+_REPEATS = re.compile(r'(.)\1+')
+
+# Слова-обозначения, которые не входят в ключ: «г. Москва», «Астана қ.», «Almaty city»
+_STOP_WORDS = {'g', 'gor', 'gorod', 'city', 'k', 'kala', 'kalasy'}
+
+# Известные разные названия одного города
+KNOWN_NAMES: List[List[str]] = [
+    ["Астана", "Нур-Султан", "Акмола", "Целиноград"],
+    ["Алматы", "Алма-Ата"],
+    ["Шымкент", "Чимкент"],
+    ["Усть-Каменогорск", "Өскемен"],
+    ["Семей", "Семипалатинск"],
+    ["Актобе", "Актюбинск"],
+    ["Атырау", "Гурьев"],
+    ["Костанай", "Кустанай"],
+    ["Караганда", "Караганды"],
+    ["Кызылорда", "Кзыл-Орда"],
+    ["Уральск", "Орал"],
+    ["Петропавловск", "Петропавл"],
+    ["Тараз", "Джамбул", "Жамбыл"],
+    ["Талдыкорган", "Талды-Курган"],
+    ["Кокшетау", "Кокчетав"],
+    ["Жезказган", "Джезказган"],
+    ["Туркестан", "Түркістан"],
+    ["Байконур", "Байқоңыр"],
+]
+
+
+def canonical_key(text: str) -> str:
+    """
+    Канонический латинский ключ названия.
+
+    Регистр, диакритика, дефисы, повторы букв и слова-обозначения («г», «city»)
+    не учитываются.
+    """
+    text = str(text).lower().translate(_TABLE)
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    key = "".join(w for w in _NON_WORD.split(text) if w and w not in _STOP_WORDS)
+    for variant, canonical in _LATIN_VARIANTS:
+        if variant in key:
+            key = key.replace(variant, canonical)
+    # «й» после гласной пишут и как y, и как i: «Semey», «Maikop»
+    key = _VOWEL_Y.sub(r'\1i', key)
+    # Повторы букв: «Allmaty», «Алма-Ата»
+    return _REPEATS.sub(r'\1', key)
+
+
+def _known_keys() -> Dict[str, List[str]]:
+    groups: Dict[str, List[str]] = {}
+    for names in KNOWN_NAMES:
+        for name in names:
+            groups[canonical_key(name)] = names
+    return groups
+
+
+_KNOWN_BY_KEY = _known_keys()
+
+
+def name_keys(names: Iterable[str]) -> Dict[str, str]:
+    """
+    Ключи вариантов названия, включая известные другие названия города.
+
+    Returns:
+        {ключ: вариант названия} — при совпадении ключей остаётся первый вариант
+    """
+    keys: Dict[str, str] = {}
+    for name in names:
+        key = canonical_key(name)
+        if not key:
+            continue
+        keys.setdefault(key, name)
+        for other in _KNOWN_BY_KEY.get(key, []):
+            keys.setdefault(canonical_key(other), other)
+    return keys
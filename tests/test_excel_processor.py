@@ -0,0 +1,104 @@
+"""Поиск строк городов при сборе: ExcelProcessor.collect_all."""
+import random
+
+import openpyxl
+import pytest
+from thefuzz import fuzz
+
+from src.excel_processor import ExcelProcessor
+from src.matching import PREFILTER_MIN_LABELS
+from src.models import AppConfig, ColumnMapping, CompetitorConfig
+from src.translit import canonical_key, name_keys
+
+CITIES = [
+    "Москва", "Санкт-Петербург", "Новосибирск", "Екатеринбург", "Казань", "Нижний Новгород",
+    "Челябинск", "Самара", "Омск", "Ростов-на-Дону", "Уфа", "Красноярск", "Воронеж", "Пермь",
+    "Волгоград", "Краснодар", "Саратов", "Тюмень", "Алматы", "Астана", "Шымкент", "Караганда",
+]
+
+
+def write_sheet(path, labels, mode=None):
+    """Лист конкурента: метка в A, номер строки в B (по нему видно найденную строку)."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row, label in enumerate(labels, start=1):
+        ws.append([label, row, mode])
+    wb.save(path)
+
+
+def collect(path, cities, threshold, aliases=None, mode_column="", diagnostics=False):
+    config = AppConfig(output_file=str(path.parent / "out.xlsx"))
+    config.cities = {city: i for i, city in enumerate(cities, start=1)}
+    config.city_aliases = aliases or {}
+    config.output_config.match_diagnostics = diagnostics
+    config.competitors['A'] = CompetitorConfig(
+        name='A', file_path=str(path), fuzzy_match_threshold=threshold, mode_column=mode_column,
+        source_columns=ColumnMapping(city='A', convert='B', minimum_1='B', minimum_2='B',
+                                     volume='B', weight_100='B', weight_3000='B'),
+    )
+    processor = ExcelProcessor(config)
+    data = processor.collect_all(list(config.competitors.values()))
+    return {city: fields['convert'] for city, fields in data['A'].items()}
+
+
+def exhaustive(labels, cities, threshold, aliases=None):
+    """Первая строка листа, где метка совпадает с городом по ключу или по fuzz.WRatio."""
+    found = {}
+    for city in cities:
+        variants = [city] + (aliases or {}).get(city, [])
+        keys = name_keys(variants)
+        for row, label in enumerate(labels, start=1):
+            if canonical_key(label) in keys or max(fuzz.WRatio(v, label) for v in variants) >= threshold:
+                found[city] = row
+                break
+    return found
+
+
+def test_earlier_fuzzy_row_wins_over_later_key_row(tmp_path):
+    path = tmp_path / "a.xlsx"
+    write_sheet(path, ["Москва-Сортировочная", "Казань", "Moskva", "Москва"], mode="авто")
+    for mode_column in ("", "C"):
+        for diagnostics in (False, True):
+            assert collect(path, ["Москва", "Казань"], 85, mode_column=mode_column,
+                           diagnostics=diagnostics) == {"Москва": 1, "Казань": 2}
+
+
+def test_key_row_found_without_fuzzy_match(tmp_path):
+    path = tmp_path / "a.xlsx"
+    write_sheet(path, ["Astana", "Almaty", "Şymkent city", "Qarağandy"])
+    found = collect(path, ["Нур-Султан", "Алма-Ата", "Шымкент", "Караганда"], 95)
+    assert found == {"Нур-Султан": 1, "Алма-Ата": 2, "Шымкент": 3, "Караганда": 4}
+
+
+def test_script_variant_alias_keeps_fuzzy_matches(tmp_path):
+    path = tmp_path / "a.xlsx"
+    write_sheet(path, ["Астана", "Almaty (авто)"])
+    assert collect(path, ["Алматы"], 90, aliases={"Алматы": ["Almaty"]}) == {"Алматы": 2}
+    assert collect(path, ["Алматы"], 90) == {}
+
+
+def _noisy_labels(count, seed):
+    rnd = random.Random(seed)
+    latin = ["Moskva", "Sankt-Peterburg", "Kazan", "Almaty", "Astana", "Shymkent", "Omsk", "Ufa"]
+    labels = []
+    for _ in range(count):
+        name = rnd.choice(CITIES + latin + ["Урюпинск", "Мытищи", "Кизляр"])
+        chars = list(name)
+        for _ in range(rnd.randint(0, 2)):
+            pos = rnd.randrange(len(chars))
+            if rnd.random() < 0.5:
+                chars.insert(pos, rnd.choice("абвгдеклмнопрст"))
+            else:
+                chars[pos] = rnd.choice("абвгдеклмнопрст")
+        labels.append("".join(chars) + rnd.choice(["", "", " (склад)", " обл.", " г."]))
+    return labels
+
+
+@pytest.mark.parametrize('threshold', [80, 90, 95])
+def test_matches_exhaustive_search(tmp_path, threshold):
+    # С порогом не ниже PREFILTER_MIN_THRESHOLD и таким числом меток работает индекс триграмм
+    labels = _noisy_labels(PREFILTER_MIN_LABELS + 200, seed=threshold)
+    aliases = {"Москва": ["Мск", "Moskva"], "Алматы": ["Almaty"]}
+    path = tmp_path / "a.xlsx"
+    write_sheet(path, labels)
+    assert collect(path, CITIES, threshold, aliases) == exhaustive(labels, CITIES, threshold, aliases)
@@ -0,0 +1,100 @@
+"""Вычисление формул без сохранённых значений: src/formula_eval.py."""
+import pytest
+
+from src.formula_eval import FormulaEvaluator, FormulaError
+
+
+def evaluator(cells):
+    """Вычислитель по словарю {'A1': значение} одного листа 'Лист' и {'Лист2!A1': ...}."""
+    def cell_value(sheet, col, row):
+        return cells.get(f"{col}{row}" if sheet == 'Лист' else f"{sheet}!{col}{row}")
+    return FormulaEvaluator(cell_value)
+
+
+def evaluate(formula, **cells):
+    return evaluator({'X1': formula, **cells}).evaluate('Лист', 'X', 1)
+
+
+@pytest.mark.parametrize('formula, expected', [
+    ("=1+2*3", 7),
+    ("=(1+2)*3", 9),
+    ("=2^3^2", 512),
+    ("=-2^2", 4),
+    ("=50%", 0.5),
+    ("=10/4", 2.5),
+    ("=SUM(A1:A3)", 6),
+    ("=MIN(A1:A3)", 1),
+    ("=MAX(A1:A3,10)", 10),
+    ("=AVERAGE(A1:A3)", 2),
+    ("=ROUND(A3/7,2)", 0.43),
+    ("=ABS(-A2)", 2),
+    ("=A1+Лист2!B1", 101),
+    ("='Лист2'!B1*2", 200),
+])
+def test_formulas(formula, expected):
+    assert evaluate(formula, A1=1, A2=2, A3=3, **{'Лист2!B1': 100}) == expected
+
+
+@pytest.mark.parametrize('formula', [
+    "=1/0",
+    "=10.0^400",
+    "=AVERAGE(A9)",
+    "=ROUND()",
+    "=ROUND(A1,1,2)",
+    "=ABS(A1:A3)",
+    "=FOO(1)",
+    "=1+",
+    "=\"text\"",
+])
+def test_errors_give_none(formula):
+    assert evaluate(formula, A1=1, A2=2, A3=3) is None
+
+
+def test_blank_arguments_count_as_zero():
+    assert evaluate("=ROUND(A9)") == 0
+    assert evaluate("=ABS(A9:A9)") == 0
+    assert evaluate("=SUM(A9:A10)+1") == 1
+
+
+def test_long_reference_chain():
+    cells = {'A1': 1, **{f"A{n}": f"=A{n - 1}+1" for n in range(2, 5001)}}
+    assert evaluator(cells).evaluate('Лист', 'A', 5000) == 5000
+
+
+def test_long_chain_through_ranges():
+    cells = {'A1': 1, **{f"A{n}": f"=SUM(A{n - 1}:A{n - 1})*1" for n in range(2, 3001)}}
+    assert evaluator(cells).evaluate('Лист', 'A', 3000) == 1
+
+
+def test_deep_nesting_is_formula_error():
+    formula = "=" + "(" * 5000 + "1" + ")" * 5000
+    with pytest.raises(FormulaError):
+        evaluator({'A1': formula}).value('Лист', 'A', 1)
+
+
+def test_overflow_is_formula_error():
+    with pytest.raises(FormulaError):
+        evaluator({'A1': "=10.0^400"}).value('Лист', 'A', 1)
+
+
+@pytest.mark.parametrize('cells', [
+    {'A1': "=A1"},
+    {'A1': "=A2+1", 'A2': "=A1+1"},
+    {'A1': "=SUM(A2:A3)", 'A3': "=A1"},
+])
+def test_cycle_is_formula_error(cells):
+    with pytest.raises(FormulaError):
+        evaluator(cells).value('Лист', 'A', 1)
+
+
+def test_cells_evaluated_once():
+    calls = []
+
+    def cell_value(sheet, col, row):
+        calls.append((col, row))
+        return {'A1': 2, 'A2': "=A1*2", 'A3': "=A2+A2+A1"}.get(f"{col}{row}")
+
+    ev = FormulaEvaluator(cell_value)
+    assert ev.value('Лист', 'A', 3) == 10
+    assert ev.value('Лист', 'A', 3) == 10
+    assert sorted(calls) == [('A', 1), ('A', 2), ('A', 3)]
@@ -0,0 +1,76 @@
+"""Пакетная оценка WRatio и префильтр триграмм: src/matching.py."""
+import random
+
+import pytest
+from thefuzz import fuzz
+
+from src.matching import PREFILTER_MIN_THRESHOLD, TrigramIndex, best_wratio, prepare, wratio_scores
+
+NAMES = [
+    "Москва", "Санкт-Петербург", "Нижний Новгород", "Ростов-на-Дону", "Казань", "Уфа",
+    "Омск", "Екатеринбург", "Набережные Челны", "Усть-Каменогорск", "Moskva", "Almaty",
+]
+
+
+def _labels(count, seed):
+    """Метки с опечатками, лишними словами и короткими общими словами."""
+    rnd = random.Random(seed)
+    extra = ["", "", " г.", " (склад)", " обл.", " ПВЗ 2", " до 5 кг"]
+    labels = []
+    for _ in range(count):
+        chars = list(rnd.choice(NAMES + ["Урюпинск", "Мытищи", "Кизляр", "Новгород", "Дону"]))
+        for _ in range(rnd.randint(0, 3)):
+            pos = rnd.randrange(len(chars))
+            roll = rnd.random()
+            if roll < 0.4:
+                chars.insert(pos, rnd.choice("абвгдежзиклмнопрст -"))
+            elif roll < 0.7 and len(chars) > 2:
+                chars.pop(pos)
+            else:
+                chars[pos] = rnd.choice("абвгдежзиклмнопрст")
+        text = "".join(chars)
+        labels.append(text + rnd.choice(extra) if rnd.random() < 0.8 else "г. " + text)
+    return labels + ["", "   ", "-"]
+
+
+def exhaustive(query, labels, cutoff):
+    result = []
+    for i, label in enumerate(labels):
+        score = fuzz.WRatio(query, label)
+        if score >= cutoff:
+            result.append((i, score))
+    return result
+
+
+@pytest.mark.parametrize('cutoff', [0, 60, 85, 90])
+def test_wratio_scores_equal_fuzz_wratio(cutoff):
+    labels = _labels(300, seed=cutoff)
+    prepared = [prepare(label) for label in labels]
+    for name in NAMES:
+        assert wratio_scores(prepare(name), prepared, cutoff) == exhaustive(name, labels, cutoff)
+
+
+@pytest.mark.parametrize('cutoff', [PREFILTER_MIN_THRESHOLD, 90, 95, 100])
+def test_trigram_index_equals_exhaustive(cutoff):
+    labels = _labels(3000, seed=cutoff)
+    prepared = [prepare(label) for label in labels]
+    index = TrigramIndex(prepared)
+    for name in NAMES + ["Ростов", "Н. Новгород", "Спб"]:
+        assert index.scores(prepare(name), cutoff) == exhaustive(name, labels, cutoff)
+
+
+def test_trigram_candidates_include_every_match():
+    labels = _labels(3000, seed=1)
+    prepared = [prepare(label) for label in labels]
+    index = TrigramIndex(prepared)
+    for name in NAMES:
+        expected = {i for i, _ in exhaustive(name, labels, PREFILTER_MIN_THRESHOLD)}
+        assert expected <= set(index.candidates(prepare(name), PREFILTER_MIN_THRESHOLD))
+
+
+def test_best_wratio():
+    labels = ["Казань", "Москва (склад)", "Moskva"]
+    prepared = [prepare(label) for label in labels]
+    assert best_wratio(prepare("Москва"), prepared, 80) == (1, fuzz.WRatio("Москва", "Москва (склад)"))
+    assert best_wratio(prepare("Урюпинск"), prepared, 80) is None
+    assert best_wratio("", prepared, 0) is None
@@ -0,0 +1,72 @@
+"""Разбор строковых цен: src/normalization.py."""
+import pytest
+
+from src.models import NormalizationRules
+from src.normalization import PriceNormalizer
+
+
+def parse(text, **rules):
+    return PriceNormalizer().parse(text, NormalizationRules(**rules))
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("1 200 р.", 1200),
+    ("12 500 000", 12500000),
+    ("1 200", 1200),
+    ("от 350", 350),
+    ("1,5", 1.5),
+    ("14/3080", 14),
+    ("350-500", 350),
+    ("350 - 500", 350),
+    ("от 350 до 500", 350),
+    ("-5", -5),
+    ("1.200", 1200),
+    ("1.5", 1.5),
+    ("0,5 м3", 0.5),
+    ("2,5 м³", 2.5),
+])
+def test_parsed(text, expected):
+    value, ok = parse(text)
+    assert ok
+    assert value == expected
+    assert type(value) is type(expected)
+
+
+@pytest.mark.parametrize('text', [
+    "договорная",
+    "12,500.00",
+    "1.200.000",
+    "1 23",
+    "1234 567",
+    "100 р. 200 р.",
+    "звоните 350",
+])
+def test_flagged(text):
+    assert parse(text) == (text, False)
+
+
+def test_text_values():
+    assert parse("Договорная", text_values={"договорная": None}) == (None, True)
+
+
+@pytest.mark.parametrize('pick, expected', [('first', 500), ('last', 350), ('min', 350), ('max', 500)])
+def test_range_pick(pick, expected):
+    assert parse("500-350", range_pick=pick) == (expected, True)
+
+
+def test_decimal_point_rules():
+    assert parse("1.200", decimal_comma=False) == (1.2, True)
+    assert parse("1,200", decimal_comma=False) == (1200, True)
+    assert parse("1,5", decimal_comma=False) == ("1,5", False)
+
+
+def test_ignore_words():
+    assert parse("350 за шт", ignore_words=["за", "шт"]) == (350, True)
+    assert parse("350 за шт") == ("350 за шт", False)
+
+
+def test_normalize_collected_flags_issues():
+    collected = {'A': {'Москва': {'convert': "1 200 р.", 'volume': "договорная", 'weight_100': 7}}}
+    normalized, issues = PriceNormalizer().normalize_collected(collected, [])
+    assert normalized['A']['Москва'] == {'convert': 1200, 'volume': "договорная", 'weight_100': 7}
+    assert [(i.city, i.field) for i in issues] == [('Москва', 'volume')]
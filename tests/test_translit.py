@@ -0,0 +1,44 @@
+"""Канонические ключи названий городов: src/translit.py."""
+import pytest
+
+from src.translit import canonical_key, name_keys
+
+
+@pytest.mark.parametrize('names', [
+    ["Астана", "Astana", "Астана қ.", "ASTANA city"],
+    ["Алматы", "Almaty", "Allmaty"],
+    ["Шымкент", "Shymkent", "Şymkent", "г. Шымкент"],
+    ["Караганда", "Qaraganda", "Karaganda"],
+    ["Москва", "Moskva", "г. Москва", "gorod Moskva"],
+    ["Екатеринбург", "Yekaterinburg", "Ekaterinburg"],
+    ["Усть-Каменогорск", "Ust-Kamenogorsk", "Усть Каменогорск"],
+    ["Семей", "Semey", "Semei"],
+])
+def test_same_key(names):
+    assert len({canonical_key(name) for name in names}) == 1
+
+
+@pytest.mark.parametrize('first, second', [
+    ("Москва", "Омск"),
+    ("Казань", "Кизляр"),
+    ("Актобе", "Актау"),
+])
+def test_different_key(first, second):
+    assert canonical_key(first) != canonical_key(second)
+
+
+def test_marker_words_only_give_empty_key():
+    assert canonical_key("г.") == ""
+    assert canonical_key("") == ""
+
+
+def test_name_keys_include_known_names():
+    keys = name_keys(["Нур-Султан"])
+    assert canonical_key("Астана") in keys
+    assert canonical_key("Целиноград") in keys
+    assert keys[canonical_key("Нур-Султан")] == "Нур-Султан"
+
+
+def test_name_keys_keep_first_variant():
+    keys = name_keys(["Алматы", "Almaty"])
+    assert keys[canonical_key("Almaty")] == "Алматы"